@@ -37,6 +37,13 @@ public:
     //! Read data from \p addr
     uint32_t peek32(const uint32_t addr);
 
+    //! Read \p count consecutive 32-bit words starting at \p addr into \p dest
+    void peek32_block(const uint32_t addr, const size_t count, uint32_t* dest);
+
+    //! Write \p count address/data pairs. \p addr_data_pairs holds
+    // 2 * \p count words, alternating between address and data.
+    void poke32_many(const uint32_t* addr_data_pairs, const size_t count);
+
 private:
     void log(mpm::types::log_level_t level, const std::string path, const char* comment);
 
@@ -43,5 +43,28 @@ void export_types(py::module& top_module)
         .def("open", &mmap_regs_iface::open)
         .def("close", &mmap_regs_iface::close)
         .def("peek32", &mmap_regs_iface::peek32)
-        .def("poke32", &mmap_regs_iface::poke32);
+        .def("poke32", &mmap_regs_iface::poke32)
+        .def("peek32_block",
+            [](mmap_regs_iface& self, const uint32_t addr, const size_t count) {
+                // Allocate the bytes object up front and read straight into it
+                auto result = py::reinterpret_steal<py::bytes>(
+                    PyBytes_FromStringAndSize(nullptr, count * sizeof(uint32_t)));
+                if (!result) {
+                    throw py::error_already_set();
+                }
+                self.peek32_block(addr,
+                    count,
+                    reinterpret_cast<uint32_t*>(PyBytes_AS_STRING(result.ptr())));
+                return result;
+            })
+        .def("poke32_many", [](mmap_regs_iface& self, py::buffer addr_data_pairs) {
+            py::buffer_info info = addr_data_pairs.request();
+            if (info.itemsize != sizeof(uint32_t) || info.ndim != 1
+                || info.strides[0] != sizeof(uint32_t) || info.shape[0] % 2) {
+                throw py::value_error("poke32_many() requires a contiguous buffer "
+                                      "of 32-bit address/data pairs");
+            }
+            self.poke32_many(
+                static_cast<const uint32_t*>(info.ptr), info.shape[0] / 2);
+        });
 }
@@ -93,6 +93,32 @@ uint32_t mmap_regs_iface::peek32(const uint32_t addr)
     return _mmap[addr / sizeof(uint32_t)];
 }
 
+void mmap_regs_iface::peek32_block(
+    const uint32_t addr, const size_t count, uint32_t* dest)
+{
+    MPM_ASSERT_THROW(_mmap);
+    if (addr + count * sizeof(uint32_t) > _length) {
+        throw mpm::runtime_error("peek32_block() exceeds mapped region!");
+    }
+    // Device registers must be accessed word by word, so no memcpy() here
+    const volatile uint32_t* src = _mmap + addr / sizeof(uint32_t);
+    for (size_t i = 0; i < count; i++) {
+        dest[i] = src[i];
+    }
+}
+
+void mmap_regs_iface::poke32_many(const uint32_t* addr_data_pairs, const size_t count)
+{
+    MPM_ASSERT_THROW(_mmap);
+    for (size_t i = 0; i < count; i++) {
+        MPM_ASSERT_THROW(addr_data_pairs[2 * i] < _length);
+    }
+    volatile uint32_t* regs = _mmap;
+    for (size_t i = 0; i < count; i++) {
+        regs[addr_data_pairs[2 * i] / sizeof(uint32_t)] = addr_data_pairs[2 * i + 1];
+    }
+}
+
 void mmap_regs_iface::log(
     mpm::types::log_level_t level, const std::string path, const char* comment)
 {
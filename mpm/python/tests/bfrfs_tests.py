@@ -0,0 +1,145 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for BufferFS
+"""
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm import mpmlog
+from usrp_mpm import user_eeprom
+from usrp_mpm.bfrfs import BufferFS
+
+
+class TestBufferFS(TestBase):
+    """
+    Tests for BufferFS
+    """
+    def setUp(self):
+        self.log = mpmlog.get_main_logger(use_console=False) \
+            .getChild('test_bfrfs')
+
+    def test_dirty_ranges(self):
+        """
+        Checks that only the changed blocks of the buffer are reported dirty,
+        and that they can be applied to the device image
+        """
+        image = b'\xFF' * 4096
+        bfs = BufferFS(image, max_size=4096, alignment=1024, log=self.log)
+        bfs.set_blob('cal0', b'\x01' * 100)
+        bfs.set_blob('cal1', b'\x02' * 100)
+        image = self._apply(image, bfs.get_dirty_ranges())
+        bfs.mark_clean()
+        self.assertEqual(bfs.get_dirty_ranges(), [])
+        # Changing the second blob only touches the TOC and one block
+        bfs.set_blob('cal1', b'\x02' * 99 + b'\x03')
+        dirty_ranges = bfs.get_dirty_ranges(block_size=32)
+        self.assertEqual([offset for offset, _ in dirty_ranges], [32, 2048+96])
+        self.assertEqual(len(dirty_ranges[0][1]), 32)
+        self.assertEqual(len(dirty_ranges[1][1]), 4)
+        image = self._apply(image, dirty_ranges)
+        bfs_readback = \
+            BufferFS(image, max_size=4096, alignment=1024, log=self.log)
+        self.assertEqual(bfs_readback.get_blob('cal0'), b'\x01' * 100)
+        self.assertEqual(bfs_readback.get_blob('cal1'), b'\x02' * 99 + b'\x03')
+
+    def test_mark_clean(self):
+        """
+        Checks that mark_clean() takes the buffer that was written, and that
+        mark_dirty() makes the entire buffer dirty
+        """
+        bfs = BufferFS(b'\xFF' * 4096, max_size=4096, alignment=1024,
+                       log=self.log)
+        bfs.set_blob('cal0', b'\x01' * 100)
+        written_buf = bfs.buffer
+        bfs.set_blob('cal1', b'\x02' * 100)
+        bfs.mark_clean(written_buf)
+        # The TOC, and everything after the end of the written buffer
+        self.assertEqual([offset for offset, _ in bfs.get_dirty_ranges()],
+                         [0, 1120])
+        bfs.mark_dirty()
+        dirty_ranges = bfs.get_dirty_ranges()
+        self.assertEqual(len(dirty_ranges), 1)
+        self.assertEqual(bytes(dirty_ranges[0][1]), bfs.buffer)
+
+    @staticmethod
+    def _apply(image, dirty_ranges):
+        " Return image with the dirty ranges written to it "
+        image = bytearray(image)
+        for offset, data in dirty_ranges:
+            image[offset:offset+len(data)] = data
+        return bytes(image)
+
+
+class FakeUserEEPROM(user_eeprom.BfrfsEEPROM):
+    """
+    Object with a user EEPROM at the start of a file
+    """
+    user_eeprom = {
+        0: {'label': 'test-eeprom', 'offset': 0, 'max_size': 4096,
+            'alignment': 1024},
+    }
+    rev = 0
+    slot_idx = 0
+
+    def __init__(self, log):
+        self.log = log
+        user_eeprom.BfrfsEEPROM.__init__(self)
+
+
+class TestBfrfsEEPROM(TestBase):
+    """
+    Tests for the user EEPROM writer in BfrfsEEPROM
+    """
+    def setUp(self):
+        self.log = mpmlog.get_main_logger(use_console=False) \
+            .getChild('test_bfrfs')
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.eeprom_path = os.path.join(tmp_dir.name, 'nvmem')
+        with open(self.eeprom_path, 'wb') as eeprom_file:
+            eeprom_file.write(b'\xFF' * 4096)
+        patcher = mock.patch.object(
+            user_eeprom, 'get_eeprom_paths', return_value=[self.eeprom_path])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user_eeprom.eeprom.invalidate_cache()
+        self.addCleanup(user_eeprom.eeprom.invalidate_cache)
+
+    @staticmethod
+    def _wait_for_writer():
+        " Wait until the EEPROM writer thread is done "
+        for thread in threading.enumerate():
+            if thread.name == 'eeprom_writer_task_0':
+                thread.join()
+
+    def test_write(self):
+        """
+        Checks that the buffer is only marked clean after it was written, and
+        that a failed write is retried in full
+        """
+        dut = FakeUserEEPROM(self.log)
+        dut.set_user_eeprom_data({'cal0': b'\x01' * 100})
+        self._wait_for_writer()
+        self.assertEqual(dut.eeprom_fs.get_dirty_ranges(), [])
+        with open(self.eeprom_path, 'rb') as eeprom_file:
+            readback = BufferFS(eeprom_file.read(), max_size=4096,
+                                alignment=1024, log=self.log)
+        self.assertEqual(readback.get_blob('cal0'), b'\x01' * 100)
+        # Make the next write fail
+        os.remove(self.eeprom_path)
+        dut.set_user_eeprom_data({'cal1': b'\x02' * 100})
+        self._wait_for_writer()
+        dirty_ranges = dut.eeprom_fs.get_dirty_ranges()
+        self.assertEqual(len(dirty_ranges), 1)
+        self.assertEqual(bytes(dirty_ranges[0][1]), dut.eeprom_fs.buffer)
+
+
+if __name__ == '__main__':
+    unittest.main()
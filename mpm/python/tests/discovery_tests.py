@@ -0,0 +1,108 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the discovery responder
+"""
+import ipaddress
+import unittest
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm import discovery
+from usrp_mpm import mpmlog
+from usrp_mpm.mpmtypes import SharedState
+
+
+class FakeSocketResponder(discovery.DiscoveryResponder):
+    """
+    DiscoveryResponder which only records which sockets it would open,
+    instead of binding to the discovery port
+    """
+    def _open_sock(self, ifname):
+        self._socks[ifname] = None
+
+    def _close_sock(self, ifname):
+        del self._socks[ifname]
+
+
+class TestDiscovery(TestBase):
+    """
+    Tests for DiscoveryResponder
+    """
+    IFACE_NETWORKS = {
+        'eth0': [ipaddress.IPv4Interface('192.168.1.2/24')],
+        'eth1': [ipaddress.IPv4Interface('192.168.10.2/24')],
+    }
+
+    def _make_responder(self, discovery_addr):
+        " Return a FakeSocketResponder with the interfaces refreshed "
+        state = SharedState()
+        state.dev_type.value = b"n3xx"
+        state.dev_product.value = b"n310"
+        state.dev_serial.value = b"12345AB"
+        responder = FakeSocketResponder(
+            state, discovery_addr,
+            mpmlog.get_main_logger(use_console=False).getChild('discovery'))
+        with mock.patch.object(discovery.net, 'get_iface_ipv4_networks',
+                               return_value=self.IFACE_NETWORKS):
+            responder.refresh_ifaces()
+        return responder
+
+    def test_response_cache(self):
+        """
+        Checks that the response bytes are only rebuilt when the shared state
+        changes
+        """
+        responder = self._make_responder('0.0.0.0')
+        response = responder.get_response()
+        self.assertEqual(
+            response,
+            b"USRP-MPM;type=n3xx;product=n310;serial=12345AB;claimed=False")
+        self.assertIs(responder.get_response(), response)
+        responder._state.claim_status.value = True
+        self.assertTrue(responder.get_response().endswith(b";claimed=True"))
+
+    def test_rate_limit(self):
+        """
+        Checks that every sender gets a burst of responses, which is then
+        refilled over time
+        """
+        responder = self._make_responder('0.0.0.0')
+        for _ in range(discovery.RATE_LIMIT_BURST):
+            self.assertTrue(responder.allow_response('10.0.0.7', 100.0))
+        self.assertFalse(responder.allow_response('10.0.0.7', 100.0))
+        self.assertTrue(responder.allow_response('10.0.0.8', 100.0))
+        refill_time = 100.0 + 2.5 / discovery.RATE_LIMIT_RATE
+        self.assertTrue(responder.allow_response('10.0.0.7', refill_time))
+        self.assertTrue(responder.allow_response('10.0.0.7', refill_time))
+        self.assertFalse(responder.allow_response('10.0.0.7', refill_time))
+        # Only MPM-DISC requests are rate limited
+        responder._handle_request(None, b"MPM-DISC\0", ('10.0.0.7', 1234), refill_time)
+        responder._handle_request(None, b"MPM-ECHO;foo", ('10.0.0.7', 1234), refill_time)
+        self.assertEqual(len(responder._disc_queue), 0)
+        self.assertEqual(len(responder._echo_queue), 1)
+
+    def test_address_filter(self):
+        """
+        Checks that everyone is answered without a discovery address, and only
+        senders on the subnet of the discovery address otherwise
+        """
+        responder = self._make_responder('0.0.0.0')
+        self.assertEqual(list(responder._socks), [None])
+        for sender in ('192.168.1.7', '10.0.0.7'):
+            responder._handle_request(None, b"MPM-DISC", (sender, 1234), 0.0)
+        self.assertEqual([x[1][0] for x in responder._disc_queue],
+                         ['192.168.1.7', '10.0.0.7'])
+        responder = self._make_responder('192.168.10.255')
+        self.assertEqual(list(responder._socks), ['eth1'])
+        responder._handle_request('eth1', b"MPM-DISC", ('192.168.10.7', 1234), 0.0)
+        responder._handle_request('eth1', b"MPM-DISC", ('10.0.0.7', 1234), 0.0)
+        responder._handle_request('eth0', b"MPM-DISC", ('192.168.1.7', 1234), 0.0)
+        self.assertEqual([x[1][0] for x in responder._disc_queue],
+                         ['192.168.10.7'])
+
+
+if __name__ == '__main__':
+    unittest.main()
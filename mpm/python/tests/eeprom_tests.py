@@ -0,0 +1,80 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the EEPROM readout and its cache
+"""
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+from base_tests import TestBase
+from usrp_mpm import eeprom
+
+DB_MAGIC = 0xF008AD11
+
+def make_db_eeprom(serial, tail=b''):
+    " Return a version 1 dboard EEPROM image, followed by tail "
+    header = struct.pack("!I I H H 7s 1x", DB_MAGIC, 1, 0x150, 3, serial)
+    return header + struct.pack("!I", zlib.crc32(header) & 0xffffffff) + tail
+
+
+class TestEEPROM(TestBase):
+    """
+    Tests for read_eeprom()
+    """
+    def setUp(self):
+        eeprom_file, self.eeprom_path = tempfile.mkstemp()
+        os.close(eeprom_file)
+        self.addCleanup(os.remove, self.eeprom_path)
+        self.addCleanup(eeprom.invalidate_cache)
+
+    def _write(self, data):
+        " Write data to the fake EEPROM "
+        with open(self.eeprom_path, 'wb') as eeprom_file:
+            eeprom_file.write(data)
+
+    def _read(self):
+        " Read the fake EEPROM as a dboard EEPROM "
+        return eeprom.read_eeprom(
+            self.eeprom_path,
+            0,
+            eeprom.DboardEEPROM.eeprom_header_format,
+            eeprom.DboardEEPROM.eeprom_header_keys,
+            DB_MAGIC,
+        )
+
+    def test_cache(self):
+        """
+        Checks that headers and raw data are cached until the cache is
+        invalidated, and that the raw data is read lazily
+        """
+        image = make_db_eeprom(b'3141592', tail=b'\xAA' * 100)
+        self._write(image)
+        header, data = self._read()
+        self.assertEqual(header['serial'], b'3141592')
+        self.assertEqual(header['rev'], 3)
+        # Header is cached, raw data is not read yet
+        self._write(make_db_eeprom(b'2718281', tail=b'\x55' * 100))
+        header, data = self._read()
+        self.assertEqual(header['serial'], b'3141592')
+        self.assertEqual(len(data), len(image))
+        self.assertEqual(data[-1], 0x55)
+        eeprom.invalidate_cache(self.eeprom_path)
+        header, data = self._read()
+        self.assertEqual(header['serial'], b'2718281')
+
+    def test_bad_magic(self):
+        """
+        Checks that a wrong magic value is rejected
+        """
+        self._write(struct.pack("!I I", 0xDEADBEEF, 1) + b'\0' * 16)
+        with self.assertRaises(RuntimeError):
+            self._read()
+
+
+if __name__ == '__main__':
+    unittest.main()
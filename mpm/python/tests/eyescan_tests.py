@@ -0,0 +1,155 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the RX eye scan tool
+"""
+import io
+import os
+import tempfile
+import unittest
+from base_tests import TestBase
+from usrp_mpm import mpmlog
+from usrp_mpm.cores import eyescan
+from usrp_mpm.cores.eyescan import EyeScanTool
+
+
+class FakeJESDCore(object):
+    """
+    JESD core with simulated GT DRPs. Every GT has a rectangular eye, which
+    gets smaller with the lane number, and its eye scan FSM reaches the END
+    state lane_num + 1 status polls after it was started. Counts the DRP
+    accesses, and the reads of the eye scan attribute registers.
+    """
+    def __init__(self):
+        # PMA_RSV2[5] is set, i.e. the eye scan circuitry is powered
+        self.drp = {lane: {0x082: 0x0020} for lane in range(4)}
+        self.polls = {lane: 0 for lane in range(4)}
+        self.target = None
+        self.num_accesses = 0
+        self.attr_reads = 0
+
+    def set_drp_target(self, mgt_or_qpll, dev_num):
+        " Select the GT to access "
+        assert mgt_or_qpll == 'mgt'
+        self.target = dev_num
+
+    def disable_drp_target(self):
+        " Deselect the GT "
+        self.target = None
+
+    def _get_counters(self):
+        " Return the error and sample count for the current offsets "
+        regs = self.drp[self.target]
+        ver_offset = regs.get(0x03B, 0) & 0x7F
+        hor_offset = regs.get(0x03C, 0) & 0xFFF
+        if hor_offset & 0x800:
+            hor_offset -= 0x1000
+        eye_open = abs(hor_offset) < 24 and ver_offset < 60 - 10 * self.target
+        return (0 if eye_open else 0x100 + self.target), 0x1000 + self.target
+
+    def drp_access(self, rd=True, addr=0, wr_data=0):
+        " Access a DRP register of the selected GT "
+        assert self.target is not None
+        self.num_accesses += 1
+        regs = self.drp[self.target]
+        if addr == 0x151:
+            assert rd
+            if not regs.get(0x03D, 0) & 0x1:
+                return 0
+            self.polls[self.target] += 1
+            if self.polls[self.target] <= self.target:
+                return 0b011 << 1
+            return (0b010 << 1) | 0x1
+        if addr in (0x14F, 0x150):
+            assert rd
+            return self._get_counters()[addr - 0x14F]
+        if rd:
+            self.attr_reads += addr in (0x03B, 0x03C, 0x03D)
+            return regs.get(addr, 0)
+        if (wr_data & 0x1) and not (regs.get(addr, 0) & 0x1) and addr == 0x03D:
+            self.polls[self.target] = 0
+        regs[addr] = wr_data
+        return 0
+
+
+@unittest.skipIf(eyescan.numpy is None, "NumPy is not available")
+class TestEyeScan(TestBase):
+    """
+    Tests for the parallel eye scan sweep
+    """
+    HOR_RANGE = {'start': -16, 'stop': 16, 'step': 2}
+    VER_RANGE = {'start': -96, 'stop': 96, 'step': 8}
+
+    def setUp(self):
+        mpmlog.get_main_logger(use_console=False)
+
+    def _make_tool(self, jesdcore, lanes, **kwargs):
+        " Return an EyeScanTool for lanes, with the GTs configured "
+        tool = EyeScanTool(jesdcore, 0, rxout_div=2, rx_int_datawidth=20, **kwargs)
+        tool.lanes = lanes
+        tool.eyescan_config()
+        return tool
+
+    def test_parallel_sweep(self):
+        """
+        Checks that the parallel sweep writes the same .pes data as the legacy
+        sweep, and that the eye scan attributes are only read once per lane
+        """
+        pes_data = []
+        num_accesses = []
+        for parallel in (False, True):
+            jesdcore = FakeJESDCore()
+            tool = self._make_tool(jesdcore, [1, 3, 0], eq_mode='DFE')
+            parsed_ranges = tool.parse_ranges(self.HOR_RANGE, self.VER_RANGE)
+            pes_file = io.BytesIO()
+            jesdcore.num_accesses = 0
+            jesdcore.attr_reads = 0
+            if parallel:
+                results = tool.eyescan_parallel_sweep(parsed_ranges)
+                tool.write_pes_data(pes_file, results)
+                self.assertTrue(results['measured'].all())
+                self.assertEqual(list(results['hor_offsets']), list(range(-16, 17, 2)))
+            else:
+                tool.eyescan_sweep(pes_file, parsed_ranges)
+            pes_data.append(pes_file.getvalue())
+            num_accesses.append(jesdcore.num_accesses)
+            self.assertEqual(jesdcore.attr_reads, 3 * 3)
+        self.assertEqual(len(pes_data[0]), 17 * 25 * 3 * 2 * 4)
+        self.assertEqual(pes_data[0], pes_data[1])
+        self.assertEqual(num_accesses[0], num_accesses[1])
+
+    def test_adaptive_scan(self):
+        """
+        Checks that coarse-to-fine sampling only measures part of the points,
+        but finds the same eye as a full scan, and that the .npz file is written
+        next to the .pes file
+        """
+        hor_range = {'start': -32, 'stop': 32, 'step': 2}
+        ver_range = {'start': -127, 'stop': 127, 'step': 4}
+        full_tool = self._make_tool(FakeJESDCore(), [0, 2])
+        full_results = full_tool.eyescan_parallel_sweep(
+            full_tool.parse_ranges(hor_range, ver_range))
+        with tempfile.TemporaryDirectory() as save_dir:
+            tool = EyeScanTool(FakeJESDCore(), 0, rxout_div=2, rx_int_datawidth=20,
+                               refine_step=4, SAVE_DIR=save_dir + "/")
+            pes_file_name = tool.eyescan_full_scan([0, 2], hor_range, ver_range)
+            self.assertEqual(sorted(os.listdir(save_dir)),
+                             sorted([pes_file_name, pes_file_name[:-4] + ".npz"]))
+            results = eyescan.numpy.load(os.path.join(save_dir, pes_file_name[:-4] + ".npz"))
+            self.assertEqual(str(results['eq_mode']), 'LPM')
+            self.assertEqual(list(results['lanes']), [0, 2])
+            measured = results['measured']
+            self.assertLess(measured.sum(), measured.size / 3)
+            for lane_idx in range(2):
+                self.assertTrue(
+                    (results['errors'][lane_idx][:, measured[lane_idx]] ==
+                     full_results['errors'][lane_idx][:, measured[lane_idx]]).all())
+            self.assertTrue(
+                ((results['errors'] > 0) == (full_results['errors'] > 0)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
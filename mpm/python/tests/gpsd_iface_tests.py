@@ -0,0 +1,168 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the GPSd interface
+"""
+import json
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm import gpsd_iface
+from usrp_mpm import mpmlog
+from usrp_mpm.gpsd_iface import GPSDIface, GPSDIfaceExtension
+
+
+class FakeGPSD(object):
+    """
+    Stand-in for GPSd: Accepts a single client on a local port, answers the
+    WATCH command, and streams the reports passed to send_report(). All
+    commands received from the client are recorded.
+    """
+    def __init__(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        self.commands = []
+        self._client = None
+        self._watching = threading.Event()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _send(self, data):
+        " Send raw data to the client "
+        self._client.sendall(data)
+
+    def _serve(self):
+        " Answer the commands of the client "
+        try:
+            self._client, _ = self._server.accept()
+            self._send(b'{"class":"VERSION","release":"3.17"}\n')
+            while True:
+                command = self._client.recv(1024)
+                if not command:
+                    return
+                self.commands.append(command)
+                if command.startswith(b'?WATCH={"enable":true'):
+                    self._send(b'{"class":"DEVICES","devices":[]}\n'
+                               b'{"class":"WATCH","enable":true}\n')
+                    self._watching.set()
+        except OSError:
+            # close() shut down the sockets
+            return
+
+    def send_report(self, report, chunk_size=None):
+        """
+        Send a report (a dictionary) to the client, optionally split into
+        multiple chunks of chunk_size bytes
+        """
+        assert self._watching.wait(5)
+        data = json.dumps(report).encode('ascii') + b'\n'
+        chunk_size = chunk_size or len(data)
+        for offset in range(0, len(data), chunk_size):
+            self._send(data[offset:offset+chunk_size])
+
+    def close(self):
+        " Shut down the server, and wait for its thread to finish "
+        for sock in (self._client, self._server):
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join(5)
+        if self._client is not None:
+            self._client.close()
+        self._server.close()
+
+
+class TestGPSDIface(TestBase):
+    """
+    Tests for GPSDIface and GPSDIfaceExtension, using FakeGPSD
+    """
+    def setUp(self):
+        self.gpsd = FakeGPSD()
+        mpmlog.get_main_logger(use_console=False)
+
+    def tearDown(self):
+        self.gpsd.close()
+
+    def test_read_stream(self):
+        """
+        Checks that reports split across reads are reassembled, and that
+        get_report() waits for a matching report
+        """
+        with GPSDIface('127.0.0.1', self.gpsd.port) as gps_iface:
+            self.gpsd.send_report({'class': 'TPV', 'mode': 0}, chunk_size=5)
+            self.gpsd.send_report({'class': 'SKY', 'hdop': 0.9})
+            self.gpsd.send_report({'class': 'TPV', 'mode': 3}, chunk_size=7)
+            self.assertEqual(
+                gps_iface.get_report('TPV', 5, lambda r: r['mode'] > 0),
+                {'class': 'TPV', 'mode': 3})
+            self.assertEqual(gps_iface.get_report('SKY', 0)['hdop'], 0.9)
+            self.assertEqual(gps_iface.get_report('PPS', 0.1), {})
+
+    def test_report_expiry(self):
+        """
+        Checks that outdated reports are not returned, but waited for
+        """
+        gps_ext = GPSDIfaceExtension('127.0.0.1', self.gpsd.port)
+        try:
+            with mock.patch.object(gpsd_iface, 'GPSD_REPORT_MAX_AGE', 0.2):
+                self.gpsd.send_report({'class': 'SKY', 'hdop': 0.9})
+                gps_iface = gps_ext._gpsd_iface
+                self.assertEqual(gps_iface.get_report('SKY', 5)['hdop'], 0.9)
+                time.sleep(0.3)
+                self.assertEqual(gps_iface.get_report('SKY', 0.1), {})
+                self.gpsd.send_report({'class': 'SKY', 'hdop': 1.1})
+                self.assertEqual(gps_iface.get_report('SKY', 5)['hdop'], 1.1)
+        finally:
+            gps_ext.close()
+
+    def test_cached_sensors(self):
+        """
+        Checks that the sensors are served from the reports streamed by GPSd,
+        without sending any further commands
+        """
+        gps_ext = GPSDIfaceExtension('127.0.0.1', self.gpsd.port)
+        try:
+            self.gpsd.send_report({
+                'class': 'TPV', 'mode': 3, 'status': 2,
+                'time': '2019-05-10T12:34:56.000Z', 'lat': 30.5, 'lon': -97.5})
+            self.gpsd.send_report({
+                'class': 'SKY', 'hdop': 0.9,
+                'satellites': [{'used': True}, {'used': False}]})
+            tpv_sensor = gps_ext.get_gps_tpv_sensor()
+            self.assertEqual(json.loads(tpv_sensor['value'])['lat'], 30.5)
+            self.assertEqual(
+                json.loads(gps_ext.get_gps_sky_sensor()['value'])['hdop'], 0.9)
+            self.assertTrue(gps_ext.get_gps_gpgga_sensor()['value'].startswith(
+                "$GPGGA,123456.000,3030.0000,N,09730.0000,W,2,01,0.90,"))
+            self.assertTrue(gps_ext.get_gps_lock())
+            # The time sensor returns on the next second edge
+            time_sensor = []
+            getter = threading.Thread(target=lambda: time_sensor.append(
+                gps_ext.get_gps_time_sensor()))
+            getter.start()
+            getter.join(0.2)
+            self.assertFalse(time_sensor)
+            self.gpsd.send_report({
+                'class': 'TPV', 'mode': 3,
+                'time': '2019-05-10T12:34:57.000Z'})
+            getter.join(5)
+            self.assertEqual(time_sensor[0]['value'], str(1557491697))
+            self.assertEqual(len(self.gpsd.commands), 1)
+        finally:
+            gps_ext.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
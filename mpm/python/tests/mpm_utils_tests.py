@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 #
+import time
 import unittest
 from base_tests import TestBase
 from usrp_mpm import mpmutils
@@ -50,6 +51,27 @@ class TestMpmUtils(TestBase):
         finally:
             self.assertEqual(my_resource.locked, False)
 
+    def test_poll_with_timeout(self):
+        """
+        Checks that poll_with_timeout() detects quick state changes quickly,
+        despite a long poll interval, and records the waits
+        """
+        done_time = time.monotonic() + 0.005
+        start_time = time.monotonic()
+        self.assertTrue(mpmutils.poll_with_timeout(
+            lambda: time.monotonic() >= done_time, 1000, 500,
+            name="test quick lock"))
+        self.assertLess(time.monotonic() - start_time, 0.1)
+        start_time = time.monotonic()
+        self.assertFalse(mpmutils.poll_with_timeout(
+            lambda: False, 20, 500, name="test no lock"))
+        self.assertLess(time.monotonic() - start_time, 0.1)
+        wait_stats = mpmutils.get_wait_stats()
+        self.assertEqual(wait_stats["test quick lock"]["timeouts"], 0)
+        self.assertEqual(wait_stats["test no lock"]["timeouts"], 1)
+        self.assertAlmostEqual(wait_stats["test no lock"]["timeout"], 0.02)
+        self.assertGreaterEqual(wait_stats["test no lock"]["max_wait"], 0.02)
+
 
 if __name__ == '__main__':
     unittest.main()
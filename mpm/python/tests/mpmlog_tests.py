@@ -0,0 +1,188 @@
+#
+# Copyright 2020 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests related to usrp_mpm.mpmlog
+"""
+
+import ast
+import os
+import timeit
+import unittest
+from base_tests import TestBase
+import usrp_mpm
+from usrp_mpm import mpmlog
+
+# Modules which access registers in loops or in time-critical paths. Log
+# statements in these modules must not format their messages unless the log
+# level is enabled.
+REGISTER_ACCESS_MODULES = (
+    'ethdispatch.py',
+    'rpc_server.py',
+    os.path.join('cores', 'eyescan.py'),
+    os.path.join('cores', 'nijesdcore.py'),
+    os.path.join('sys_utils', 'sysfs_gpio.py'),
+    os.path.join('sys_utils', 'uio.py'),
+    os.path.join('xports', 'xportmgr_udp.py'),
+)
+
+
+class TestLogRing(TestBase):
+    """
+    Tests for the LogRing class and the non-consuming log buffer API
+    """
+    def _make_ring(self, size, num_records):
+        " Return a LogRing of size with num_records records "
+        ring = mpmlog.LogRing(size)
+        for idx in range(num_records):
+            ring.append(float(idx), mpmlog.INFO, 'test', 'msg{}'.format(idx))
+        return ring
+
+    def test_get_since(self):
+        """
+        Checks that records are returned in order, with correct sequence
+        numbers, and without removing them from the ring
+        """
+        ring = self._make_ring(8, 5)
+        first_seq, next_seq, records = ring.get_since(0)
+        self.assertEqual(first_seq, 0)
+        self.assertEqual(next_seq, 5)
+        self.assertEqual([x[3] for x in records],
+                         ['msg{}'.format(x) for x in range(5)])
+        # Reading again returns the same records
+        self.assertEqual(ring.get_since(0)[2], records)
+        first_seq, next_seq, records = ring.get_since(3, 1)
+        self.assertEqual((first_seq, next_seq), (3, 4))
+        self.assertEqual(records[0][3], 'msg3')
+        self.assertEqual(ring.get_since(5), (5, 5, []))
+
+    def test_wraparound(self):
+        """
+        Checks that old records get overwritten, and that readers which fell
+        behind resume at the oldest available record
+        """
+        ring = self._make_ring(4, 10)
+        self.assertEqual(len(ring), 4)
+        first_seq, next_seq, records = ring.get_since(2)
+        self.assertEqual((first_seq, next_seq), (6, 10))
+        self.assertEqual([x[3] for x in records],
+                         ['msg6', 'msg7', 'msg8', 'msg9'])
+
+    def test_columnar_output(self):
+        """
+        Checks the format of MPMLogger.get_log_buf_since()
+        """
+        main_logger = mpmlog.get_main_logger(use_console=False)
+        logger = main_logger.getChild('test_columns')
+        start_seq = main_logger.log_ring.next_seq
+        logger.warning("foo %d", 1)
+        logger.error("bar")
+        result = main_logger.get_log_buf_since(start_seq, 10)
+        self.assertEqual(result['seq'], start_seq)
+        self.assertEqual(result['next_seq'], start_seq + 2)
+        self.assertEqual(result['message'], ['foo 1', 'bar'])
+        self.assertEqual(result['levelno'], [mpmlog.WARNING, mpmlog.ERROR])
+        self.assertEqual(len(result['created']), 2)
+
+
+
+class FormatCounter(object):
+    """
+    Log argument which counts how often it was converted to a string
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "FormatCounter"
+
+
+class TestLogOverhead(TestBase):
+    """
+    Tests that disabled log statements are cheap
+    """
+    def setUp(self):
+        self.log = mpmlog.get_main_logger(use_console=False) \
+            .getChild('test_overhead')
+        self.log.setLevel(mpmlog.INFO)
+
+    def tearDown(self):
+        self.log.setLevel(mpmlog.logging.NOTSET)
+
+    def test_deferred_formatting(self):
+        """
+        Checks that disabled log statements never format their arguments, and
+        that changing the log level takes effect immediately
+        """
+        arg = FormatCounter()
+        self.log.trace("Value: %s", arg)
+        self.log.debug("Value: %s", arg)
+        self.assertEqual(arg.count, 0)
+        self.log.setLevel(mpmlog.TRACE)
+        self.log.trace("Value: %s", arg)
+        self.assertEqual(arg.count, 1)
+
+    def test_disabled_overhead(self):
+        """
+        Measures the per-call overhead of a disabled log statement in a
+        register access path, and compares it to the same statement with an
+        eager str.format() call.
+        """
+        num_calls = 10000
+        addr, value = 0x1234, 0xDEADBEEF
+        lazy_time = timeit.timeit(
+            lambda: self.log.trace("Writing to address 0x%04X: 0x%08X",
+                                   addr, value),
+            number=num_calls)
+        eager_time = timeit.timeit(
+            lambda: self.log.trace("Writing to address 0x{:04X}: 0x{:08X}"
+                                   .format(addr, value)),
+            number=num_calls)
+        self.assertLess(
+            lazy_time, eager_time,
+            "Disabled log statement takes {:.3f} us per call, eager "
+            "formatting takes {:.3f} us per call.".format(
+                lazy_time / num_calls * 1e6, eager_time / num_calls * 1e6))
+
+    def test_register_access_modules(self):
+        """
+        Lint: Checks that trace and debug statements in register access paths
+        don't call str.format(), unless guarded by isEnabledFor().
+        """
+        def is_guard(node):
+            " Returns True if node is an 'if' checking the log level "
+            return isinstance(node, ast.If) and any(
+                isinstance(x, ast.Attribute) and x.attr == 'isEnabledFor'
+                for x in ast.walk(node.test))
+        def find_eager_calls(node, guarded=False):
+            " Yields line numbers of unguarded, eagerly formatted log calls "
+            guarded = guarded or is_guard(node)
+            if not guarded and isinstance(node, ast.Call) \
+                    and isinstance(node.func, ast.Attribute) \
+                    and node.func.attr in ('trace', 'debug') \
+                    and node.args \
+                    and isinstance(node.args[0], ast.Call) \
+                    and isinstance(node.args[0].func, ast.Attribute) \
+                    and node.args[0].func.attr == 'format':
+                yield node.lineno
+            for child in ast.iter_child_nodes(node):
+                for lineno in find_eager_calls(child, guarded):
+                    yield lineno
+        mpm_dir = os.path.dirname(usrp_mpm.__file__)
+        violations = []
+        for module in REGISTER_ACCESS_MODULES:
+            path = os.path.join(mpm_dir, module)
+            with open(path) as src_file:
+                tree = ast.parse(src_file.read(), path)
+            violations += [
+                "{}:{}".format(module, lineno)
+                for lineno in find_eager_calls(tree)
+            ]
+        self.assertEqual(violations, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
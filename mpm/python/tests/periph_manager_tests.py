@@ -0,0 +1,87 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for usrp_mpm.periph_manager.base
+"""
+
+import unittest
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm import mpmlog
+from usrp_mpm.periph_manager import base
+
+# Daughterboard PIDs for StubDboard
+STUB_DBOARD_PID = 0x4242
+FAILING_DBOARD_PID = 0x4243
+
+
+class StubDboard(object):
+    """
+    Daughterboard class, which fails to initialize if it's given
+    FAILING_DBOARD_PID
+    """
+    def __init__(self, slot_idx, **kwargs):
+        if kwargs['pid'] == FAILING_DBOARD_PID:
+            raise RuntimeError("No clock in slot {}".format(slot_idx))
+        self.slot_idx = slot_idx
+
+
+class StubPeriphManager(base.PeriphManagerBase):
+    """
+    Motherboard without EEPROMs, the dboard infos are set by the tests
+    """
+    pids = {0x4200: 'stub'}
+
+    def _get_dboard_eeprom_info(self):
+        return []
+
+
+class TestPeriphManagerBase(TestBase):
+    """
+    Tests the daughterboard initialization in PeriphManagerBase
+    """
+    def setUp(self):
+        mpmlog.get_main_logger(use_console=False)
+        patcher = mock.patch.object(
+            base, 'get_dboard_class_from_pid', lambda pid: StubDboard)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_init_dboard_failures(self):
+        """
+        Checks that a failing slot doesn't keep the other slot from being
+        initialized, and that the failures of all slots are reported with
+        their tracebacks, in parallel and serialized initialization
+        """
+        for default_args in ({}, {'serialize_init': 'True'}):
+            mgr = StubPeriphManager()
+            with self.assertLogs(mgr.log, 'ERROR') as logs:
+                with self.assertRaisesRegex(RuntimeError, r"slot\(s\) 1$"):
+                    mgr._init_dboards([
+                        {'pid': STUB_DBOARD_PID},
+                        {'pid': FAILING_DBOARD_PID},
+                    ], [], default_args)
+            self.assertEqual([x.slot_idx for x in mgr.dboards], [0])
+            self.assertEqual(len(logs.records), 1)
+            self.assertEqual(
+                logs.records[0].getMessage(),
+                "Failed to initialize dboard 1: No clock in slot 1")
+            self.assertIs(logs.records[0].exc_info[0], RuntimeError)
+            mgr = StubPeriphManager()
+            with self.assertLogs(mgr.log, 'ERROR') as logs:
+                with self.assertRaisesRegex(RuntimeError, r"slot\(s\) 0, 1$"):
+                    mgr._init_dboards([
+                        {'pid': FAILING_DBOARD_PID},
+                        {'pid': FAILING_DBOARD_PID},
+                    ], [], default_args)
+            self.assertEqual(mgr.dboards, [])
+            self.assertEqual(
+                [str(x.exc_info[1]) for x in logs.records],
+                ["No clock in slot 0", "No clock in slot 1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the initialization profiler
+"""
+import threading
+import unittest
+from base_tests import TestBase
+from usrp_mpm import profiler
+
+
+class TestProfiler(TestBase):
+    """
+    Tests for the profiler spans
+    """
+    def test_span_tree(self):
+        """
+        Checks nesting of spans, including spans from other threads, and that
+        spans outside of a root span are not recorded
+        """
+        with profiler.span("outside"):
+            pass
+        with profiler.span("test init", root=True):
+            with profiler.span("init LMK"):
+                with profiler.span("poll PLL lock"):
+                    pass
+            def _worker():
+                with profiler.span("dboard 0 init"):
+                    pass
+            worker = threading.Thread(target=_worker, name="worker")
+            worker.start()
+            worker.join()
+        root_span = profiler.get_profile()[-1]
+        self.assertEqual(root_span['name'], "test init")
+        self.assertFalse(root_span['running'])
+        self.assertEqual(
+            [child['name'] for child in root_span['children']],
+            ["init LMK", "dboard 0 init"])
+        lmk_span = root_span['children'][0]
+        self.assertEqual(lmk_span['children'][0]['name'], "poll PLL lock")
+        self.assertLessEqual(lmk_span['duration'], root_span['duration'])
+        self.assertEqual(root_span['children'][1]['thread'], "worker")
+        self.assertNotIn(
+            "outside", [span['name'] for span in profiler.get_profile()])
+        text = profiler.format_profile([root_span]).splitlines()
+        self.assertEqual(len(text), 4)
+        self.assertTrue(text[2].startswith("    poll PLL lock"))
+        self.assertIn("[worker]", text[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,555 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for usrp_mpm.rpc_server
+"""
+
+import os
+import socket
+from hashlib import md5
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+import time
+import msgpack
+import gevent
+from gevent import monkey
+from gevent.server import StreamServer
+from base_tests import TestBase
+from usrp_mpm import mpmlog
+from usrp_mpm import prefs
+from usrp_mpm import rpc_server
+from usrp_mpm.mpmtypes import SharedState
+from usrp_mpm.rpc_server import blocking, no_claim, no_rpc
+
+MSGPACKRPC_REQUEST = rpc_server.MSGPACKRPC_REQUEST
+MSGPACKRPC_RESPONSE = rpc_server.MSGPACKRPC_RESPONSE
+# threading is monkey patched by rpc_server, this returns the OS thread ID
+get_thread_ident = monkey.get_original('threading', 'get_ident')
+
+
+class StubDboard(object):
+    """
+    Daughterboard with one RPC method, and one which is assigned to the
+    instance (like the methods dboards export from their drivers)
+    """
+    def __init__(self, slot_idx):
+        self.slot_idx = slot_idx
+        self.peek16 = lambda addr: (self.slot_idx, addr)
+
+    def get_slot(self):
+        " Return the slot index "
+        return self.slot_idx
+
+
+class StubUpload(object):
+    """
+    Component upload which collects the data in memory (same interface as
+    ComponentUpload)
+    """
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.filepath = '/tmp/uploads/' + metadata['filename']
+        self.data = b''
+        self.aborted = False
+        self.fail_writes = False
+
+    @property
+    def size(self):
+        " Number of bytes received so far "
+        return len(self.data)
+
+    def write(self, data):
+        " Append a chunk of data "
+        if self.fail_writes:
+            raise OSError("No space left on device")
+        self.data += data
+
+    def abort(self):
+        " Drop the data "
+        self.aborted = True
+
+
+class StubPeriphManager(object):
+    """
+    Peripheral manager which only implements what MPMServer needs, plus a
+    few RPC methods for the tests
+    """
+    clear_rpc_registry_on_unclaim = False
+    updateable_components = {
+        'fpga': {'callback': 'update_fpga', 'reset': True},
+        'dts': {'callback': 'update_dts', 'reset': False},
+    }
+
+    def __init__(self, default_args):
+        self.default_args = default_args
+        self.claimed = False
+        self.dboards = [StubDboard(0), StubDboard(1)]
+        self.calls = []
+        # Called by run_hook(), tests can set this to get control during an
+        # RPC call
+        self.hook = None
+        self.uploads = []
+        # List of (component ID, data) of all completed updates
+        self.updates = []
+
+    @no_rpc
+    def get_device_info(self):
+        " Return static device info "
+        return {'type': 'stub', 'product': 'stub', 'serial': '1234'}
+
+    @no_rpc
+    def claim(self):
+        " Claim hook "
+
+    @no_rpc
+    def unclaim(self):
+        " Unclaim hook "
+
+    @no_rpc
+    def deinit(self):
+        " Deinit hook "
+
+    @no_rpc
+    def tear_down(self):
+        " Tear-down hook "
+
+    @no_rpc
+    def invalidate_device_info(self):
+        " Device info hook "
+
+    @no_rpc
+    def set_connection_type(self, conn_type):
+        " Connection type hook "
+
+    @no_rpc
+    def set_client_addr(self, client_addr):
+        " Client address hook "
+
+    @no_rpc
+    def start_component_upload(self, metadata):
+        " Start an upload "
+        if metadata['id'] not in self.updateable_components:
+            raise KeyError(
+                "Update component not implemented for " + metadata['id'])
+        upload = StubUpload(metadata)
+        self.uploads.append(upload)
+        return upload
+
+    @no_rpc
+    def finish_component_upload(self, upload):
+        " Complete an upload, checking the MD5 hash "
+        if 'md5' in upload.metadata \
+                and upload.metadata['md5'] != md5(upload.data).hexdigest():
+            upload.abort()
+            raise RuntimeError("Component file hash mismatch")
+        self.updates.append((upload.metadata['id'], upload.data))
+
+    def set_value(self, value):
+        " Claimed method which records its argument "
+        self.calls.append(value)
+        return value
+
+    @no_claim
+    def get_status(self):
+        " Unclaimed method "
+        return 'ok'
+
+    def fail(self):
+        " Claimed method which always raises "
+        raise RuntimeError("fail() failed")
+
+    def run_hook(self):
+        " Claimed method which calls the hook "
+        return self.hook()
+
+    @blocking
+    def slow_op(self, duration):
+        " Slow claimed method, returns the ID of the thread it ran in "
+        time.sleep(duration)
+        self.calls.append('slow_op')
+        return get_thread_ident()
+
+
+class TestRPCServer(TestBase):
+    """
+    Tests MPMServer by feeding requests to its request handler. The server
+    runs on top of StubPeriphManager.
+    """
+    def setUp(self):
+        mpmlog.get_main_logger(use_console=False)
+        patcher = mock.patch.object(
+            rpc_server.net, 'get_local_ip_addrs', return_value={'127.0.0.1'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.msg_id = 0
+
+    def _make_server(self, rpc_stats=False):
+        " Create an MPMServer with a StubPeriphManager "
+        mpm_prefs = prefs.get_prefs()
+        old_rpc_stats = mpm_prefs.get('mpm', 'rpc_stats')
+        mpm_prefs.set('mpm', 'rpc_stats', str(rpc_stats))
+        self.addCleanup(mpm_prefs.set, 'mpm', 'rpc_stats', old_rpc_stats)
+        periph_manager_module = types.ModuleType('usrp_mpm.periph_manager')
+        periph_manager_module.periph_manager = StubPeriphManager
+        with mock.patch.dict(
+                sys.modules,
+                {'usrp_mpm.periph_manager': periph_manager_module}):
+            server = rpc_server.MPMServer(SharedState(), {})
+        self.addCleanup(server._executor.kill)
+        self.addCleanup(lambda: server._timer.kill())
+        return server
+
+    def _call(self, server, method_name, *args):
+        """
+        Execute an RPC call on server. Returns (error, result) from the
+        response.
+        """
+        self.msg_id += 1
+        msg_id = self.msg_id
+        response = server._handle_request(
+            [MSGPACKRPC_REQUEST, msg_id, method_name, list(args)])
+        self.assertEqual(response[1], msg_id)
+        return response[2], response[3]
+
+    def _claim(self, server):
+        " Claim server and return the token "
+        error, token = self._call(server, 'claim', 'test')
+        self.assertIsNone(error)
+        return token
+
+    def test_rpc_stats(self):
+        """
+        Checks that call statistics cover periph manager, dboard and server
+        methods, and that resetting them requires a claim
+        """
+        server = self._make_server(rpc_stats=True)
+        token = self._claim(server)
+        self._call(server, 'set_value', token, 5)
+        self._call(server, 'fail', token)
+        self._call(server, 'db_1_get_slot', token)
+        self._call(server, 'get_status')
+        self._call(server, 'set_value', 'invalid token', 5)
+        self._call(server, 'no_such_method')
+        error, stats = self._call(server, 'get_rpc_stats')
+        self.assertIsNone(error)
+        self.assertEqual(
+            set(stats.keys()),
+            {'claim', 'set_value', 'fail', 'db_1_get_slot', 'get_status'})
+        self.assertEqual(stats['set_value']['calls'], 2)
+        self.assertEqual(stats['set_value']['errors'], 1)
+        self.assertEqual(stats['fail']['errors'], 1)
+        self.assertEqual(stats['get_status']['errors'], 0)
+        error, _ = self._call(server, 'reset_rpc_stats', 'invalid token')
+        self.assertIsNotNone(error)
+        error, _ = self._call(server, 'reset_rpc_stats', token)
+        self.assertIsNone(error)
+        # The reset itself is recorded after it completes
+        _, stats = self._call(server, 'get_rpc_stats')
+        self.assertEqual(set(stats.keys()), {'reset_rpc_stats'})
+
+    def test_batch_call(self):
+        """
+        Checks that batched calls are executed in order, and that failing
+        calls are reported without aborting the batch
+        """
+        server = self._make_server()
+        error, _ = self._call(server, 'batch_call', 'invalid token',
+                              [('set_value', [1])])
+        self.assertIn("without valid claim", error)
+        self.assertEqual(server.periph_manager.calls, [])
+        token = self._claim(server)
+        error, results = self._call(server, 'batch_call', token, [
+            ('set_value', [1]),
+            ('fail', []),
+            ('no_such_method', []),
+            ('db_1_get_slot', []),
+            ('get_status', []),
+            ('set_value', [2]),
+        ])
+        self.assertIsNone(error)
+        self.assertEqual(results, [
+            (True, 1),
+            (False, "RuntimeError: fail() failed"),
+            (False, "KeyError: Unknown method in batch: `no_such_method'"),
+            (True, 1),
+            (True, 'ok'),
+            (True, 2),
+        ])
+        self.assertEqual(server.periph_manager.calls, [1, 2])
+
+    def test_batch_call_lost_claim(self):
+        """
+        Checks that a batch stops when the claim is lost during a call
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        def _drop_claim():
+            server._state.claim_status.value = False
+        server.periph_manager.hook = _drop_claim
+        error, results = self._call(server, 'batch_call', token, [
+            ('set_value', [1]),
+            ('run_hook', []),
+            ('set_value', [2]),
+        ])
+        self.assertIsNone(error)
+        self.assertEqual(results, [(True, 1), (True, None)])
+        self.assertEqual(server.periph_manager.calls, [1])
+
+    def _serve_unix(self, server):
+        """
+        Serve server on a Unix domain socket, and return a client socket
+        connected to it
+        """
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        socket_path = os.path.join(tmp_dir.name, 'usrp_hwd.sock')
+        # Leftover from a previous run, must get replaced
+        open(socket_path, 'w').close()
+        stream_server = StreamServer(
+            rpc_server._make_unix_listener(socket_path), handle=server)
+        stream_server.start()
+        self.addCleanup(stream_server.stop)
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        self.addCleanup(client.close)
+        return client
+
+    @staticmethod
+    def _recv_responses(client, unpacker, num_responses):
+        " Read num_responses responses from client "
+        responses = []
+        while len(responses) < num_responses:
+            data = client.recv(4096)
+            if not data:
+                break
+            unpacker.feed(data)
+            responses.extend(unpacker)
+        return responses
+
+    def test_pipelining(self):
+        """
+        Checks that requests which are sent back-to-back over the Unix domain
+        socket are all answered in order
+        """
+        server = self._make_server()
+        client = self._serve_unix(server)
+        packer = msgpack.Packer(**rpc_server.RPC_PACK_PARAMS)
+        unpacker = msgpack.Unpacker(**rpc_server.RPC_UNPACK_PARAMS)
+        requests = [
+            [MSGPACKRPC_REQUEST, msg_id, 'ping', [msg_id]]
+            for msg_id in range(20)
+        ]
+        requests.append([MSGPACKRPC_REQUEST, 20, 'get_device_info', []])
+        requests.append([MSGPACKRPC_REQUEST, 21, 'no_such_method', []])
+        client.sendall(b''.join(packer.pack(req) for req in requests))
+        responses = self._recv_responses(client, unpacker, len(requests))
+        self.assertEqual(
+            responses[:20],
+            [[MSGPACKRPC_RESPONSE, msg_id, None, msg_id]
+             for msg_id in range(20)])
+        # Unix domain socket clients are local
+        self.assertEqual(responses[20][3]['connection'], 'local')
+        self.assertEqual(responses[21][1:3],
+                         [21, "Method not found: no_such_method"])
+
+    def test_invalid_request(self):
+        """
+        Checks that an invalid request is answered with an error, and that the
+        connection can be used afterwards
+        """
+        server = self._make_server()
+        client = self._serve_unix(server)
+        packer = msgpack.Packer(**rpc_server.RPC_PACK_PARAMS)
+        unpacker = msgpack.Unpacker(**rpc_server.RPC_UNPACK_PARAMS)
+        client.sendall(packer.pack([MSGPACKRPC_REQUEST, 1]))
+        self.assertEqual(
+            self._recv_responses(client, unpacker, 1),
+            [[MSGPACKRPC_RESPONSE, -1, "Invalid protocol", None]])
+        client.sendall(packer.pack([MSGPACKRPC_REQUEST, 2, 'ping', ['ok']]))
+        self.assertEqual(
+            self._recv_responses(client, unpacker, 1),
+            [[MSGPACKRPC_RESPONSE, 2, None, 'ok']])
+
+    def test_method_table(self):
+        """
+        Checks the RPC method table of a class, and the methods which get
+        registered for the periph manager and dboards
+        """
+        class PropertyComponent(StubDboard):
+            " Component with a property that must not be evaluated "
+            @property
+            def status(self):
+                " Property "
+                raise AssertionError("Property was evaluated")
+        table = rpc_server.get_rpc_method_table(PropertyComponent)
+        self.assertEqual(table, {'get_slot': True})
+        self.assertIs(rpc_server.get_rpc_method_table(PropertyComponent), table)
+        server = self._make_server()
+        self.assertEqual(
+            {(name, claimed) for name, _, claimed in server.list_methods()
+             if name in server._mb_methods + server._db_methods},
+            {('set_value', True), ('get_status', False), ('fail', True),
+             ('run_hook', True), ('slow_op', True), ('db_0_get_slot', True),
+             ('db_0_peek16', True), ('db_1_get_slot', True),
+             ('db_1_peek16', True)})
+        token = self._claim(server)
+        self.assertEqual(self._call(server, 'db_1_peek16', token, 0x10),
+                         (None, (1, 0x10)))
+
+    def test_reset_mgr(self):
+        """
+        Checks that no method of the previous periph manager is called after
+        reset_mgr()
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        old_mgr = server.periph_manager
+        self._call(server, 'set_value', token, 1)
+        server.reset_mgr()
+        self.assertIsNot(server.periph_manager, old_mgr)
+        self._call(server, 'set_value', token, 2)
+        self.assertEqual(old_mgr.calls, [1])
+        self.assertEqual(server.periph_manager.calls, [2])
+
+    def test_blocking(self):
+        """
+        Checks that @blocking methods run in a worker thread, that other
+        greenlets can run unclaimed calls meanwhile, and that claimed calls
+        are still executed one at a time
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        slow_call = gevent.spawn(self._call, server, 'slow_op', token, 0.5)
+        gevent.sleep(0.1)
+        self.assertFalse(slow_call.ready())
+        self.assertEqual(self._call(server, 'get_status'), (None, 'ok'))
+        self.assertEqual(self._call(server, 'reclaim', token), (None, True))
+        self.assertFalse(slow_call.ready())
+        claimed_call = gevent.spawn(self._call, server, 'set_value', token, 1)
+        gevent.sleep(0.1)
+        self.assertFalse(claimed_call.ready())
+        self.assertEqual(server.periph_manager.calls, [])
+        error, thread_ident = slow_call.get(timeout=5)
+        self.assertIsNone(error)
+        self.assertNotEqual(thread_ident, get_thread_ident())
+        self.assertEqual(claimed_call.get(timeout=5), (None, 1))
+        self.assertEqual(server.periph_manager.calls, ['slow_op', 1])
+
+    def test_blocking_unclaim(self):
+        """
+        Checks that unclaim() waits for a running claimed call
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        slow_call = gevent.spawn(self._call, server, 'slow_op', token, 0.3)
+        gevent.sleep(0.1)
+        self.assertEqual(self._call(server, 'unclaim', token), (None, True))
+        self.assertTrue(slow_call.ready())
+        self.assertEqual(slow_call.get()[0], None)
+        self.assertFalse(server._state.claim_status.value)
+
+    def test_chunked_upload(self):
+        """
+        Checks that interleaved uploads are assembled correctly, that they
+        can be finished in any order, and that the periph manager is reset
+        after updating a component which requires it
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        mgr = server.periph_manager
+        _, dts_id = self._call(server, 'begin_upload', token,
+                               {'id': 'dts', 'filename': 'usrp.dts'})
+        _, fpga_id = self._call(server, 'begin_upload', token, {
+            'id': 'fpga', 'filename': 'usrp.bit',
+            'md5': md5(b'fpga image').hexdigest()})
+        self.assertNotEqual(dts_id, fpga_id)
+        self.assertEqual(
+            self._call(server, 'upload_chunk', token, fpga_id, b'fpga '),
+            (None, 5))
+        self._call(server, 'upload_chunk', token, dts_id, b'dts ')
+        self._call(server, 'upload_chunk', token, fpga_id, b'image')
+        self.assertEqual(
+            self._call(server, 'upload_chunk', token, dts_id, b'file'),
+            (None, 8))
+        # Finish the uploads in the opposite order
+        self.assertEqual(
+            self._call(server, 'finish_upload', token, dts_id), (None, None))
+        self.assertEqual(mgr.updates, [('dts', b'dts file')])
+        self.assertIs(server.periph_manager, mgr)
+        self.assertEqual(
+            self._call(server, 'finish_upload', token, fpga_id), (None, None))
+        self.assertEqual(mgr.updates,
+                         [('dts', b'dts file'), ('fpga', b'fpga image')])
+        self.assertIsNot(server.periph_manager, mgr)
+        error, _ = self._call(server, 'finish_upload', token, fpga_id)
+        self.assertIn("Unknown upload ID", error)
+
+    def test_upload_errors(self):
+        """
+        Checks that failed uploads are aborted and can't be continued
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        mgr = server.periph_manager
+        error, _ = self._call(server, 'begin_upload', 'invalid token',
+                              {'id': 'dts', 'filename': 'usrp.dts'})
+        self.assertIn("without valid claim", error)
+        error, _ = self._call(server, 'begin_upload', token,
+                              {'id': 'cpld', 'filename': 'usrp.svf'})
+        self.assertIn("not implemented", error)
+        self.assertEqual(mgr.uploads, [])
+        # Hash mismatch
+        _, upload_id = self._call(server, 'begin_upload', token, {
+            'id': 'dts', 'filename': 'usrp.dts',
+            'md5': md5(b'dts file').hexdigest()})
+        self._call(server, 'upload_chunk', token, upload_id, b'dts fil')
+        error, _ = self._call(server, 'finish_upload', token, upload_id)
+        self.assertIn("hash mismatch", error)
+        self.assertTrue(mgr.uploads[-1].aborted)
+        error, _ = self._call(server, 'upload_chunk', token, upload_id, b'e')
+        self.assertIn("Unknown upload ID", error)
+        # Write failure
+        _, upload_id = self._call(server, 'begin_upload', token,
+                                  {'id': 'dts', 'filename': 'usrp.dts'})
+        mgr.uploads[-1].fail_writes = True
+        error, _ = self._call(server, 'upload_chunk', token, upload_id, b'a')
+        self.assertIn("No space left", error)
+        self.assertTrue(mgr.uploads[-1].aborted)
+        error, _ = self._call(server, 'finish_upload', token, upload_id)
+        self.assertIn("Unknown upload ID", error)
+        self.assertEqual(mgr.updates, [])
+
+    def test_abort_uploads(self):
+        """
+        Checks that incomplete uploads are aborted when the claim is released
+        """
+        server = self._make_server()
+        token = self._claim(server)
+        mgr = server.periph_manager
+        _, upload_id = self._call(server, 'begin_upload', token,
+                                  {'id': 'dts', 'filename': 'usrp.dts'})
+        self._call(server, 'upload_chunk', token, upload_id, b'dts ')
+        self._call(server, 'unclaim', token)
+        self.assertTrue(mgr.uploads[0].aborted)
+        token = self._claim(server)
+        error, _ = self._call(server, 'upload_chunk', token, upload_id, b'a')
+        self.assertIn("Unknown upload ID", error)
+        self.assertEqual(mgr.updates, [])
+
+    def test_rpc_stats_disabled(self):
+        """
+        Checks that get_rpc_stats() fails when statistics are disabled
+        """
+        server = self._make_server()
+        error, _ = self._call(server, 'get_rpc_stats')
+        self.assertIn("disabled", error)
+
+
+if __name__ == '__main__':
+    unittest.main()
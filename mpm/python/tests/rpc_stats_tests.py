@@ -0,0 +1,59 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the RPC call statistics
+"""
+import unittest
+from base_tests import TestBase
+from usrp_mpm.rpc_stats import RPCStats
+
+
+class TestRPCStats(TestBase):
+    """
+    Tests for RPCStats
+    """
+    def test_counters(self):
+        """
+        Checks call and error counters, and max/mean latency
+        """
+        stats = RPCStats()
+        stats.record('get_mb_sensor', 0.001, True)
+        stats.record('get_mb_sensor', 0.003, False)
+        stats.record('db_0_peek16', 0.0001, True)
+        result = stats.get_stats()
+        self.assertEqual(set(result.keys()), {'get_mb_sensor', 'db_0_peek16'})
+        self.assertEqual(result['get_mb_sensor']['calls'], 2)
+        self.assertEqual(result['get_mb_sensor']['errors'], 1)
+        self.assertAlmostEqual(result['get_mb_sensor']['mean'], 0.002)
+        self.assertAlmostEqual(result['get_mb_sensor']['max'], 0.003)
+        self.assertEqual(result['db_0_peek16']['errors'], 0)
+        stats.reset()
+        self.assertEqual(stats.get_stats(), {})
+
+    def test_percentiles(self):
+        """
+        Checks that the percentiles are within the histogram resolution
+        """
+        stats = RPCStats()
+        # 98 fast calls and 2 slow ones
+        for _ in range(98):
+            stats.record('update_component', 0.0005, True)
+        for _ in range(2):
+            stats.record('update_component', 2.0, True)
+        result = stats.get_stats()['update_component']
+        self.assertGreaterEqual(result['p50'], 0.0005)
+        self.assertLess(result['p50'], 0.0005 * 1.2)
+        self.assertGreaterEqual(result['p99'], 2.0)
+        self.assertLessEqual(result['p99'], result['max'])
+        # Latencies outside the histogram range are clamped
+        stats.record('slow', 1000.0, True)
+        stats.record('fast', 0.0, True)
+        self.assertEqual(stats.get_stats()['slow']['p99'], 1000.0)
+        self.assertEqual(stats.get_stats()['fast']['p50'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
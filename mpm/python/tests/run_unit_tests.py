@@ -10,8 +10,21 @@ USRP MPM Python Unit testing framework
 import unittest
 import sys
 import argparse
-from sys_utils_tests import TestNet
+from sys_utils_tests import TestNet, TestSysFSGPIO, TestDeviceIndex, \
+        TestNetMonitor, TestThermalSampler
 from mpm_utils_tests import TestMpmUtils
+from mpmlog_tests import TestLogRing, TestLogOverhead
+from rpc_stats_tests import TestRPCStats
+from rpc_server_tests import TestRPCServer
+from shadow_regs_tests import TestShadowRegs
+from profiler_tests import TestProfiler
+from eeprom_tests import TestEEPROM
+from bfrfs_tests import TestBufferFS, TestBfrfsEEPROM
+from gpsd_iface_tests import TestGPSDIface
+from eyescan_tests import TestEyeScan
+from discovery_tests import TestDiscovery
+from periph_manager_tests import TestPeriphManagerBase
+from xportmgr_udp_tests import TestXportMgrUDP
 
 import importlib.util
 if importlib.util.find_spec("xmlrunner"):
@@ -20,7 +33,25 @@ if importlib.util.find_spec("xmlrunner"):
 TESTS = {
     '__all__': {
         TestNet,
+        TestSysFSGPIO,
+        TestDeviceIndex,
+        TestNetMonitor,
+        TestThermalSampler,
         TestMpmUtils,
+        TestLogRing,
+        TestLogOverhead,
+        TestRPCStats,
+        TestRPCServer,
+        TestShadowRegs,
+        TestProfiler,
+        TestEEPROM,
+        TestBufferFS,
+        TestBfrfsEEPROM,
+        TestGPSDIface,
+        TestEyeScan,
+        TestDiscovery,
+        TestPeriphManagerBase,
+        TestXportMgrUDP,
     },
     'n3xx': set(),
 }
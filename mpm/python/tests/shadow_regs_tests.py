@@ -0,0 +1,134 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the shadow register layer
+"""
+import unittest
+from base_tests import TestBase
+from usrp_mpm.chips.shadow_regs import ShadowRegs
+
+
+class FakeRegsIface(object):
+    """
+    16-bit register interface which records all bus transactions
+    """
+    def __init__(self):
+        self.regs = {}
+        self.transactions = []
+
+    def peek16(self, addr):
+        " Read a register "
+        self.transactions.append(('peek', addr))
+        return self.regs.get(addr, 0)
+
+    def poke16(self, addr, data):
+        " Write a register "
+        self.transactions.append(('poke', addr, data))
+        self.regs[addr] = data
+
+
+class FakeUIO(object):
+    """
+    32-bit register interface with poke32_many(), which records all bus
+    transactions
+    """
+    def __init__(self):
+        self.transactions = []
+
+    def peek32(self, addr):
+        " Read a register "
+        self.transactions.append(('peek', addr))
+        return 0
+
+    def poke32(self, addr, data):
+        " Write a register "
+        self.transactions.append(('poke', addr, data))
+
+    def poke32_many(self, addr_vals):
+        " Write multiple registers "
+        self.transactions.append(('poke_many', list(addr_vals)))
+
+
+class TestShadowRegs(TestBase):
+    """
+    Tests for ShadowRegs
+    """
+    def test_read_modify_write(self):
+        """
+        Checks that reads of known registers are served from the shadow copy,
+        and redundant writes are skipped
+        """
+        iface = FakeRegsIface()
+        iface.regs[0x03] = 0x0100
+        regs = ShadowRegs(iface)
+        self.assertFalse(hasattr(regs, 'peek8'))
+        regs.poke16(0x03, regs.peek16(0x03) | 0x1)
+        regs.poke16(0x03, regs.peek16(0x03) | 0x1)
+        self.assertEqual(regs.peek16(0x03), 0x0101)
+        self.assertEqual(iface.transactions,
+                         [('peek', 0x03), ('poke', 0x03, 0x0101)])
+        self.assertEqual(regs.skipped_reads, 2)
+        self.assertEqual(regs.skipped_writes, 1)
+        regs.invalidate()
+        self.assertEqual(regs.peek16(0x03), 0x0101)
+        self.assertEqual(iface.transactions[-1], ('peek', 0x03))
+
+    def test_volatile(self):
+        """
+        Checks that volatile registers are always accessed
+        """
+        iface = FakeRegsIface()
+        regs = ShadowRegs(iface, volatile_regs=(0x02,))
+        regs.poke16(0x02, 0x2003)
+        regs.poke16(0x02, 0x2003)
+        iface.regs[0x02] = 0x2002
+        self.assertEqual(regs.peek16(0x02), 0x2002)
+        self.assertEqual(iface.transactions, [
+            ('poke', 0x02, 0x2003), ('poke', 0x02, 0x2003), ('peek', 0x02)])
+
+    def test_deferred(self):
+        """
+        Checks that deferred writes are combined, and are flushed before
+        volatile registers are accessed
+        """
+        iface = FakeRegsIface()
+        regs = ShadowRegs(iface, volatile_regs=(0x6C,))
+        regs.poke16(0x01, 0x0003)
+        with regs.deferred():
+            regs.poke16(0x00, 0x001B)
+            regs.poke16(0x00, 0x001C)
+            regs.poke16(0x01, 0x0003)
+            regs.poke16(0x04, 0x10000 | 0x5)
+            self.assertEqual(regs.peek16(0x00), 0x001C)
+            self.assertEqual(len(iface.transactions), 1)
+            regs.peek16(0x6C)
+            regs.poke16(0x05, 0x0001)
+        self.assertEqual(iface.transactions, [
+            ('poke', 0x01, 0x0003),
+            ('poke', 0x00, 0x001C),
+            ('poke', 0x04, 0x0005),
+            ('peek', 0x6C),
+            ('poke', 0x05, 0x0001),
+        ])
+
+    def test_deferred_batch(self):
+        """
+        Checks that deferred 32-bit writes are flushed with a single
+        poke32_many() call, and only if something changed
+        """
+        iface = FakeUIO()
+        regs = ShadowRegs(iface)
+        for _ in range(2):
+            with regs.deferred():
+                regs.poke32(0x10, 0x0203)
+                regs.poke32(0x14, 0x0001)
+                regs.poke32(0x20, 1)
+        self.assertEqual(iface.transactions, [
+            ('poke_many', [(0x10, 0x0203), (0x14, 0x0001), (0x20, 1)])])
+
+
+if __name__ == '__main__':
+    unittest.main()
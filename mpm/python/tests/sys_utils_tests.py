@@ -8,11 +8,55 @@ Tests related to usrp_mpm.sys_utils
 """
 
 from base_tests import TestBase
+import os
+import socket
+import tempfile
+import time
 import unittest
+from unittest import mock
+from usrp_mpm import bist
+from usrp_mpm import mpmlog
+from usrp_mpm.sys_utils import device_index
 from usrp_mpm.sys_utils import net
+from usrp_mpm.sys_utils import net_monitor
+from usrp_mpm.sys_utils import sysfs_gpio
+from usrp_mpm.sys_utils import sysfs_thermal
+from usrp_mpm.sys_utils import udev
 import platform
 
 
+class FakeProbeSocket(object):
+    """
+    UDP socket for net.probe_link_rate(), which sends datagrams at
+    link_rate (bits/s) by advancing the fake clock on every sendto()
+    """
+    link_rate = 1e9
+    now = 0.0
+    error = None
+
+    def __init__(self, family, sock_type):
+        self.options = {}
+        self.datagrams = []
+        self.closed = False
+        FakeProbeSocket.instance = self
+
+    def setsockopt(self, level, option, value):
+        " Record the socket option "
+        self.options[(level, option)] = value
+
+    def sendto(self, data, addr):
+        " Send a datagram, this takes as long as it takes to transmit it "
+        if self.error is not None:
+            raise self.error
+        self.datagrams.append((data, addr))
+        FakeProbeSocket.now += \
+            (len(data) + net.UDP_WIRE_OVERHEAD) * 8 / self.link_rate
+
+    def close(self):
+        " Close the socket "
+        self.closed = True
+
+
 class TestNet(TestBase):
     """
     Tests multiple functions defined in usrp_mpm.sys_utils.net.
@@ -133,5 +177,316 @@ class TestNet(TestBase):
         expected_string = '2F:16:AB:BF:90:63'
         self.assertEqual(expected_string, net.byte_to_mac(byte_str).upper())
 
+    def test_probe_link_rate(self):
+        """
+        Tests that probe_link_rate() measures the rate at which datagrams
+        can be sent through the interface, and that a failing probe returns
+        None.
+        """
+        mpmlog.get_main_logger(use_console=False)
+        with mock.patch.object(net.socket, 'socket', FakeProbeSocket), \
+                mock.patch.object(net.time, 'monotonic',
+                                  lambda: FakeProbeSocket.now):
+            link_rate = net.probe_link_rate(
+                'sfp0', '192.168.10.5', 9, 1472, 0.01)
+            sock = FakeProbeSocket.instance
+            self.assertAlmostEqual(link_rate / 1e9, 1, places=6)
+            self.assertTrue(sock.closed)
+            self.assertEqual(
+                sock.options[(socket.SOL_SOCKET, net.SO_BINDTODEVICE)],
+                b'sfp0')
+            data, addr = sock.datagrams[0]
+            self.assertEqual(addr, ('192.168.10.5', 9))
+            self.assertEqual(len(data), 1472)
+            self.assertTrue(data.startswith(net.LINK_PROBE_PREFIX))
+            # The first quarter of the burst only fills the queues, the rest
+            # is measured
+            self.assertAlmostEqual(
+                len(sock.datagrams) * 1538 * 8 / 1e9, 0.01, places=4)
+            FakeProbeSocket.error = OSError("Network is unreachable")
+            try:
+                self.assertIsNone(net.probe_link_rate(
+                    'sfp0', '192.168.10.5', 9, 1472, 0.01))
+            finally:
+                FakeProbeSocket.error = None
+            self.assertTrue(FakeProbeSocket.instance.closed)
+
+
+class TestSysFSGPIO(TestBase):
+    """
+    Tests SysFSGPIO and GPIOBank against a fake sysfs GPIO directory.
+    """
+    BASE_GPIO = 100
+    NUM_GPIOS = 8
+
+    def setUp(self):
+        mpmlog.get_main_logger(use_console=False)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for gpio_idx in range(self.NUM_GPIOS):
+            gpio_path = os.path.join(
+                self.tmp_dir.name, 'gpio{}'.format(self.BASE_GPIO + gpio_idx))
+            os.mkdir(gpio_path)
+            with open(os.path.join(gpio_path, 'value'), 'w') as value_file:
+                value_file.write('0\n')
+        patchers = [
+            mock.patch.object(sysfs_gpio, 'GPIO_SYSFS_BASE_DIR', self.tmp_dir.name),
+            mock.patch.object(
+                sysfs_gpio, 'find_gpio_device',
+                return_value=('gpiochip100', {
+                    'ngpio': self.NUM_GPIOS, 'sys_number': self.BASE_GPIO})),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def _read_value(self, gpio_idx):
+        " Read the fake value file of a GPIO "
+        with open(os.path.join(
+                self.tmp_dir.name, 'gpio{}'.format(self.BASE_GPIO + gpio_idx),
+                'value')) as value_file:
+            return int(value_file.read())
+
+    def _write_value(self, gpio_idx, value):
+        " Write the fake value file of a GPIO "
+        with open(os.path.join(
+                self.tmp_dir.name, 'gpio{}'.format(self.BASE_GPIO + gpio_idx),
+                'value'), 'w') as value_file:
+            value_file.write('{}\n'.format(value))
+
+    def test_set_get(self):
+        """
+        Checks single pin and whole bank accesses
+        """
+        gpios = sysfs_gpio.SysFSGPIO({'label': 'test'}, 0xFF, 0x0F, 0x01)
+        self.assertEqual(self._read_value(0), 0)
+        gpios.set(1)
+        gpios.reset(1)
+        gpios.set(2)
+        self.assertEqual([self._read_value(x) for x in range(4)], [0, 0, 1, 0])
+        gpios.set_all(0b1001)
+        self.assertEqual([self._read_value(x) for x in range(4)], [1, 0, 0, 1])
+        gpios.set_all(0b0110, 0b0010)
+        self.assertEqual([self._read_value(x) for x in range(4)], [1, 1, 0, 1])
+        self._write_value(5, 1)
+        self._write_value(7, 1)
+        self.assertEqual(gpios.get(5), 1)
+        self.assertEqual(gpios.get(6), 0)
+        self.assertEqual(gpios.get_all(), 0xA0)
+        self.assertEqual(gpios.get_all(0x7F), 0x20)
+        gpios.close()
+
+    def test_gpio_bank(self):
+        """
+        Checks that GPIOBank.set_all() maps bit N to pin N, and that get_all()
+        packs the input pins together
+        """
+        gpio_bank = sysfs_gpio.GPIOBank({'label': 'test'}, 2, 0xF, 0x3)
+        gpio_bank.set_all(0xF)
+        self.assertEqual([self._read_value(x) for x in range(8)],
+                         [0, 0, 1, 1, 0, 0, 0, 0])
+        gpio_bank.reset_all()
+        self.assertEqual(self._read_value(2) + self._read_value(3), 0)
+        self._write_value(4, 1)
+        self.assertEqual(gpio_bank.get_all(), 0b10)
+        gpio_bank.close()
+
+    def test_gpio_bist(self):
+        """
+        Runs the front panel GPIO BIST sequence (bist.gpio_set_all(), then
+        GPIOBank.get_all()) with pins 0-3 looped back to pins 4-7
+        """
+        for ddr in (0x0F, 0xF0):
+            gpio_bank = sysfs_gpio.GPIOBank({'label': 'test'}, 0, 0xFF, ddr)
+            for pattern in range(16):
+                bist.gpio_set_all(gpio_bank, pattern, 8, ddr)
+                for gpio_idx in range(8):
+                    if (1<<gpio_idx) & ddr:
+                        self._write_value(
+                            gpio_idx ^ 4, self._read_value(gpio_idx))
+                self.assertEqual(gpio_bank.get_all(), pattern)
+            gpio_bank.close()
+
+    def test_release_fds(self):
+        """
+        Checks that the value files are closed by close() and, if the owner
+        forgets to call it, when the object is destroyed
+        """
+        def count_fds():
+            " Count the open file descriptors of this process "
+            return len(os.listdir('/proc/self/fd'))
+        num_fds = count_fds()
+        gpios = sysfs_gpio.SysFSGPIO({'label': 'test'}, 0xFF, 0x0F)
+        self.assertEqual(count_fds(), num_fds + self.NUM_GPIOS)
+        gpios.close()
+        self.assertEqual(count_fds(), num_fds)
+        gpio_bank = sysfs_gpio.GPIOBank({'label': 'test'}, 2, 0xF, 0x3)
+        self.assertEqual(count_fds(), num_fds + 4)
+        del gpio_bank
+        self.assertEqual(count_fds(), num_fds)
+
+
+class TestDeviceIndex(TestBase):
+    """
+    Tests the device lookup cache in usrp_mpm.sys_utils.device_index
+    """
+    def setUp(self):
+        device_index.invalidate()
+        self.addCleanup(device_index.invalidate)
+
+    def test_lookup(self):
+        """
+        Checks that results are cached until invalidated, and that None is
+        never cached.
+        """
+        builder = mock.Mock(return_value=('/dev/uio3', {'size': 0x4000}))
+        for _ in range(3):
+            self.assertEqual(device_index.lookup('uio', 'mboard-regs', builder),
+                             ('/dev/uio3', {'size': 0x4000}))
+        self.assertEqual(builder.call_count, 1)
+        device_index.invalidate('gpio')
+        device_index.lookup('uio', 'mboard-regs', builder)
+        self.assertEqual(builder.call_count, 1)
+        device_index.invalidate('uio')
+        device_index.lookup('uio', 'mboard-regs', builder)
+        self.assertEqual(builder.call_count, 2)
+        missing_builder = mock.Mock(return_value=None)
+        for _ in range(2):
+            self.assertIsNone(
+                device_index.lookup('uio', 'missing', missing_builder))
+        self.assertEqual(missing_builder.call_count, 2)
+
+    def test_udev_lookups(self):
+        """
+        Checks that the udev helpers don't cache empty results, so devices
+        which show up later are found
+        """
+        context = mock.Mock()
+        context.list_devices.return_value = []
+        patchers = [
+            mock.patch.object(udev, 'pyudev'),
+            mock.patch.object(device_index, 'get_udev_context',
+                              return_value=context),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.assertEqual(udev.get_spidev_nodes('e0006000.spi'), [])
+        self.assertEqual(udev.get_eeprom_paths('e0004000.i2c'), [])
+        context.list_devices.return_value = [
+            mock.Mock(device_node='/dev/spidev0.0'),
+            mock.Mock(device_node='/dev/spidev0.1'),
+        ]
+        self.assertEqual(udev.get_spidev_nodes('e0006000.spi'),
+                         ['/dev/spidev0.0', '/dev/spidev0.1'])
+        self.assertEqual(context.list_devices.call_count, 3)
+        udev.get_spidev_nodes('e0006000.spi')
+        self.assertEqual(context.list_devices.call_count, 3)
+
+
+class FakeNetlinkMsg(dict):
+    """
+    Netlink message with the fields as dict entries, and the attributes in
+    attrs
+    """
+    def __init__(self, attrs, **fields):
+        dict.__init__(self, **fields)
+        self.attrs = attrs
+
+    def get_attr(self, name):
+        " Return an attribute, or None "
+        return self.attrs.get(name)
+
+
+class TestNetMonitor(TestBase):
+    """
+    Tests the network configuration snapshot in
+    usrp_mpm.sys_utils.net_monitor
+    """
+    @staticmethod
+    def _link_msg(event, index, ifname, operstate):
+        " Return an RTM_NEWLINK/RTM_DELLINK message "
+        return FakeNetlinkMsg({
+            'IFLA_IFNAME': ifname,
+            'IFLA_ADDRESS': '00:80:2f:00:00:0{}'.format(index),
+            'IFLA_OPERSTATE': operstate,
+            'IFLA_MTU': 1500,
+        }, event=event, index=index)
+
+    @staticmethod
+    def _addr_msg(event, index, addr):
+        " Return an RTM_NEWADDR/RTM_DELADDR message for an IPv4 address "
+        return FakeNetlinkMsg({'IFA_ADDRESS': addr},
+                              event=event, index=index,
+                              family=socket.AF_INET, prefixlen=24)
+
+    def test_apply_events(self):
+        """
+        Checks that events update the snapshot, and that the net helpers
+        read from it
+        """
+        snapshot = net_monitor.NetSnapshot({}, {}, 0)
+        snapshot = net_monitor.apply_events(snapshot, [
+            self._link_msg('RTM_NEWLINK', 2, 'sfp0', 'DOWN'),
+            self._link_msg('RTM_NEWLINK', 3, 'sfp1', 'UP'),
+            self._addr_msg('RTM_NEWADDR', 3, '192.168.20.2'),
+        ])
+        self.assertEqual(snapshot.generation, 1)
+        self.assertEqual(
+            net.get_valid_interfaces(['sfp0', 'sfp1', 'sfp2'], snapshot),
+            ['sfp1'])
+        # Events that don't change anything don't create a new snapshot
+        unchanged_snapshot = net_monitor.apply_events(
+            snapshot, [self._link_msg('RTM_NEWLINK', 3, 'sfp1', 'UP')])
+        self.assertIs(unchanged_snapshot, snapshot)
+        snapshot = net_monitor.apply_events(snapshot, [
+            self._link_msg('RTM_NEWLINK', 2, 'sfp0', 'UP'),
+            self._addr_msg('RTM_NEWADDR', 2, '192.168.10.2'),
+            self._addr_msg('RTM_DELADDR', 3, '192.168.20.2'),
+        ])
+        self.assertEqual(snapshot.generation, 2)
+        self.assertEqual(
+            net.get_valid_interfaces(['sfp0', 'sfp1', 'sfp2'], snapshot),
+            ['sfp0'])
+        with mock.patch.object(snapshot, 'get_speed', return_value=10000):
+            iface_info = net.get_iface_info('sfp0', snapshot)
+        self.assertEqual(iface_info['ip_addrs'], ['192.168.10.2'])
+        self.assertEqual(iface_info['mac_addr'], '00:80:2f:00:00:02')
+        self.assertFalse(iface_info['bridge'])
+        snapshot = net_monitor.apply_events(
+            snapshot, [self._link_msg('RTM_DELLINK', 2, 'sfp0', 'DOWN')])
+        self.assertIsNone(snapshot.get_link('sfp0'))
+        self.assertEqual(snapshot.get_addrs(), [])
+
+
+class TestThermalSampler(TestBase):
+    """
+    Tests sysfs_thermal.ThermalSampler against a fake sensor file
+    """
+    def test_sampling(self):
+        """
+        Checks that samples are cached, and that the history is limited
+        """
+        with tempfile.NamedTemporaryFile('w') as sensor_file, \
+                mock.patch.object(sysfs_thermal, 'get_thermal_sensor_path',
+                                  return_value=sensor_file.name):
+            sampler = sysfs_thermal.ThermalSampler(
+                0.01, mpmlog.get_main_logger(use_console=False), history_len=3)
+            sampler.add_sensor('temp', 'fpga-thermal-zone', 'temp')
+            self.assertTrue(sampler.has_sensor('temp'))
+            self.assertFalse(sampler.has_sensor('fan'))
+            for value in (40000, 41000, 42000, 43000):
+                sensor_file.seek(0)
+                sensor_file.write('{}\n'.format(value))
+                sensor_file.flush()
+                sampler.sample()
+            value, timestamp = sampler.get('temp')
+            self.assertEqual(value, 43000.0)
+            self.assertLessEqual(timestamp, time.time())
+            self.assertEqual([x[1] for x in sampler.get_history('temp')],
+                             [41000.0, 42000.0, 43000.0])
+            sampler.start()
+            sampler.stop()
+
 if __name__ == '__main__':
     unittest.main()
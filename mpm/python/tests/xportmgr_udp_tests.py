@@ -0,0 +1,173 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Tests for the UDP transport manager
+"""
+
+import socket
+import unittest
+from unittest import mock
+from base_tests import TestBase
+from usrp_mpm import mpmlog
+from usrp_mpm import prefs
+from usrp_mpm.sys_utils import net
+from usrp_mpm.sys_utils import net_monitor
+from usrp_mpm.xports import xportmgr_udp
+
+
+class StubXportMgrUDP(xportmgr_udp.XportMgrUDP):
+    """
+    UDP transport manager with one interface of every type
+    """
+    iface_config = {
+        'sfp0': {'label': 'misc-enet-regs0', 'type': 'sfp'},
+        'sfp1': {'label': 'misc-enet-regs1', 'type': 'sfp'},
+        'eth1': {'label': 'misc-enet-int-regs', 'type': 'forward'},
+        'int0': {'label': 'misc-enet-int-regs', 'type': 'internal'},
+    }
+
+
+def make_snapshot(ifaces):
+    """
+    Return a NetSnapshot with the given interfaces. ifaces is a list of
+    (ifname, MTU, IPv4 address, raw link speed) tuples.
+    """
+    links = {}
+    addrs = {}
+    for index, (ifname, mtu, addr, _) in enumerate(ifaces, start=2):
+        links[index] = {
+            'index': index,
+            'ifname': ifname,
+            'mac_addr': '00:80:2f:00:00:0{}'.format(index),
+            'operstate': 'UP',
+            'mtu': mtu,
+            'kind': None,
+        }
+        addrs[index] = [(socket.AF_INET, addr, 24)]
+    snapshot = net_monitor.NetSnapshot(links, addrs, 1)
+    # Link speeds are normally read from sysfs
+    for ifname, _, _, speed in ifaces:
+        snapshot._speeds[ifname] = speed
+    return snapshot
+
+
+class TestXportMgrUDP(TestBase):
+    """
+    Tests the link options reported by XportMgrUDP
+    """
+    def setUp(self):
+        self.snapshot = make_snapshot([
+            ('sfp0', 9000, '192.168.10.2', 10000),
+            # The 1GigE driver reports bogus speeds, so only the nominal
+            # speed is used (see net.get_link_speed())
+            ('sfp1', 1500, '192.168.20.2', 2500),
+            ('eth1', 1500, '10.2.0.2', 1000),
+            ('int0', 1500, '169.254.0.1', -1),
+        ])
+        for module in (net, net_monitor):
+            patcher = mock.patch.object(
+                module, 'get_snapshot', lambda: self.snapshot)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        mpm_prefs = prefs.get_prefs()
+        old_link_probe = mpm_prefs.get('mpm', 'chdr_link_probe')
+        self.addCleanup(
+            mpm_prefs.set, 'mpm', 'chdr_link_probe', old_link_probe)
+        mpm_prefs.set('mpm', 'chdr_link_probe', 'False')
+        self.xport_mgr = StubXportMgrUDP(
+            mpmlog.get_main_logger(use_console=False), {})
+
+    def test_link_options(self):
+        """
+        Checks the preference math, the order of the link options, and the
+        filtering by host location
+        """
+        link_options = self.xport_mgr.get_chdr_link_options()
+        self.assertEqual(
+            [(x['ipv4'], x['preference'], x['link_capacity'], x['link_rate'])
+             for x in link_options], [
+                 # 1250 MB/s * 8972 / 9038
+                 ('192.168.10.2', '1240', '1250000000', '1250000000'),
+                 # Unknown speed: Assumed to be 10 Gb/s
+                 ('169.254.0.2', '1196', '1250000000', '1250000000'),
+                 # 125 MB/s * 1472 / 1538
+                 ('192.168.20.2', '119', '125000000', '125000000'),
+                 # 125 MB/s * 1472 / 1538 * 0.25
+                 ('10.2.0.2', '29', '125000000', '125000000'),
+             ])
+        self.assertEqual(
+            [x['type'] for x in link_options],
+            ['sfp', 'internal', 'sfp', 'forward'])
+        self.assertEqual(
+            [x['ipv4'] for x in
+             self.xport_mgr.get_chdr_link_options('remote')],
+            ['192.168.10.2', '192.168.20.2', '10.2.0.2'])
+        self.assertEqual(
+            [x['ipv4'] for x in
+             self.xport_mgr.get_chdr_link_options('local')],
+            ['169.254.0.2'])
+        # The capacity follows speed changes, interfaces that went away
+        # since init() fall back to the link speed found by init()
+        self.snapshot = make_snapshot([
+            ('sfp0', 9000, '192.168.10.2', 1000),
+        ])
+        link_options = self.xport_mgr.get_chdr_link_options('remote')
+        self.assertEqual(
+            [(x['ipv4'], x['preference'], x['link_capacity'], x['link_rate'])
+             for x in link_options], [
+                 ('192.168.10.2', '124', '125000000', '1250000000'),
+                 ('192.168.20.2', '119', '125000000', '125000000'),
+                 ('10.2.0.2', '29', '125000000', '125000000'),
+             ])
+
+    def test_link_probe(self):
+        """
+        Checks that only links which are on the client's subnet are probed,
+        once per client, and that the measured rate is capped by the link
+        speed
+        """
+        prefs.get_prefs().set('mpm', 'chdr_link_probe', 'True')
+        with mock.patch.object(
+                net, 'probe_link_rate', return_value=4e9) as probe_link_rate:
+            link_options = self.xport_mgr.get_chdr_link_options(
+                client_addr='192.168.20.5')
+            probe_link_rate.assert_called_once_with(
+                'sfp1', '192.168.20.5', xportmgr_udp.LINK_PROBE_PORT,
+                1500 - xportmgr_udp.UDP_IP_HEADER_SIZE,
+                xportmgr_udp.LINK_PROBE_DURATION)
+            # The probe overshot the link speed
+            self.assertEqual(
+                {x['ipv4']: x['link_capacity'] for x in link_options}
+                ['192.168.20.2'], '125000000')
+            self.xport_mgr.get_chdr_link_options(client_addr='192.168.20.5')
+            self.assertEqual(probe_link_rate.call_count, 1)
+            probe_link_rate.return_value = 4e8
+            link_options = self.xport_mgr.get_chdr_link_options(
+                client_addr='192.168.10.5')
+            self.assertEqual(probe_link_rate.call_count, 2)
+            self.assertEqual(
+                [(x['ipv4'], x['link_capacity']) for x in link_options][:3], [
+                    ('169.254.0.2', '1250000000'),
+                    ('192.168.20.2', '125000000'),
+                    ('192.168.10.2', '50000000'),
+                ])
+            # A failed probe falls back to the link speed
+            probe_link_rate.return_value = None
+            link_options = self.xport_mgr.get_chdr_link_options(
+                client_addr='192.168.10.6')
+            self.assertEqual(link_options[0]['link_capacity'], '1250000000')
+            # Clients that are not on any CHDR subnet, or not IPv4 clients,
+            # are not probed
+            for client_addr in ('192.168.30.5', '/tmp/mpm.sock'):
+                self.xport_mgr.get_chdr_link_options(client_addr=client_addr)
+            self.assertEqual(probe_link_rate.call_count, 3)
+            prefs.get_prefs().set('mpm', 'chdr_link_probe', 'False')
+            self.xport_mgr.get_chdr_link_options(client_addr='192.168.20.7')
+            self.assertEqual(probe_link_rate.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
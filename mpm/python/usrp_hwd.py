@@ -15,6 +15,7 @@ from gevent import signal
 import usrp_mpm as mpm
 from usrp_mpm.mpmtypes import SharedState
 from usrp_mpm.sys_utils import watchdog
+from usrp_mpm import profiler
 
 # pylint: disable=wrong-import-order
 # We have to import threading here because it must be imported after
@@ -40,6 +41,16 @@ def setup_arg_parser():
         help="Don't start the RPC server, terminate after running initialization",
         action="store_true",
     )
+    parser.add_argument(
+        '--profile',
+        help="With --init-only: Print the duration of all initialization "
+             "phases as a tree. If a file name is given, the timings are "
+             "also written to that file as JSON.",
+        nargs='?',
+        const='',
+        default=None,
+        metavar='JSON_FILE',
+    )
     parser.add_argument(
         '--override-db-pids',
         help="Provide a comma-separated list of daughterboard PIDs that are " \
@@ -115,9 +126,13 @@ def kill_thread():
     log.info("System exiting")
     sys.exit(0)
 
-def init_only(log, default_args):
+def init_only(log, default_args, profile_json=None):
     """
     Run the full initialization immediately and return
+
+    If profile_json is not None, print the timings of all initialization
+    phases. If profile_json is also non-empty, write them to that file as
+    JSON.
     """
     # Create the periph_manager for this device
     # This call will be forwarded to the device specific implementation
@@ -129,11 +144,13 @@ def init_only(log, default_args):
     from usrp_mpm.periph_manager import periph_manager
     log.info("Spawning periph manager...")
     ctor_time_start = time.time()
-    mgr = periph_manager(default_args)
+    with profiler.span("periph manager ctor", root=True):
+        mgr = periph_manager(default_args)
     ctor_duration = time.time() - ctor_time_start
     log.info("Ctor Duration: {:.02f} s".format(ctor_duration))
     init_time_start = time.time()
-    init_result = mgr.init(default_args)
+    with profiler.span("init", root=True):
+        init_result = mgr.init(default_args)
     init_duration = time.time() - init_time_start
     if init_result:
         log.info("Initialization successful! Duration: {:.02f} s"
@@ -141,6 +158,12 @@ def init_only(log, default_args):
     else:
         log.warning("Initialization failed! Duration: {:.02f} s"
                     .format(init_duration))
+    if profile_json is not None:
+        profile = profiler.get_profile()
+        print(profiler.format_profile(profile))
+        if profile_json:
+            profiler.dump_profile(profile, profile_json)
+            log.info("Wrote initialization profile to %s", profile_json)
     log.info("Terminating on user request before launching RPC server.")
     mgr.deinit()
     return init_result
@@ -191,11 +214,14 @@ def main():
         # If --init-only is provided, we force disable init during boot time so
         # we can properly time it in init_only().
         args.default_args['skip_boot_init'] = "1"
+    if args.profile is not None and not args.init_only:
+        log.warning("--profile only works together with --init-only. Use "
+                    "the get_init_profile() RPC call instead.")
     if args.override_db_pids is not None:
         log.warning('Overriding daughterboard PIDs!')
         args.default_args['override_db_pids'] = args.override_db_pids
     if args.init_only:
-        return init_only(log, args.default_args)
+        return init_only(log, args.default_args, args.profile)
     return spawn_processes(log, args)
 
 if __name__ == '__main__':
@@ -16,6 +16,9 @@ from builtins import str
 from six import itervalues
 
 DEFAULT_ALIGNMENT = 1024 # bytes
+# Granularity of incremental writes (see BufferFS.get_dirty_ranges()). This is
+# the page size of typical I2C EEPROMs.
+DEFAULT_WRITE_BLOCK_SIZE = 32 # bytes
 
 def align_addr(addr, align_to):
     """
@@ -77,12 +80,24 @@ class BufferFS(object):
     entry = {
         0: ("!I I I 8s", ('base', 'length', 'CRC', 'id')),
     }
+    # Precompiled versions of the formats above
+    _header_struct = struct.Struct(default_header[0])
+    _u32_struct = struct.Struct('!I')
+    _entry_structs = {
+        version: struct.Struct(entry_format[0])
+        for version, entry_format in entry.items()
+    }
 
 
     def __init__(self, raw_data_buffer, max_size=None, alignment=None, log=None):
         assert isinstance(raw_data_buffer, bytes)
         self.max_size = len(raw_data_buffer) if max_size is None else max_size
-        self.raw_data_buffer = raw_data_buffer[:self.max_size]
+        self.raw_data_buffer = raw_data_buffer \
+            if len(raw_data_buffer) <= self.max_size \
+            else raw_data_buffer[:self.max_size]
+        # This is what's currently stored on the device. get_dirty_ranges()
+        # compares the buffer against this.
+        self._device_buffer = self.raw_data_buffer
         self.alignment = alignment or DEFAULT_ALIGNMENT
         self.pad = b'\xFF'
         if log is None:
@@ -111,7 +126,7 @@ class BufferFS(object):
         """
         Read the buffer and return header info as a list of dictionaries.
         """
-        default_hdr_struct = struct.Struct(self.default_header[0])
+        default_hdr_struct = self._header_struct
         if len(buf) < default_hdr_struct.size + 8:
             return {}
         default_hdr_unpacked = default_hdr_struct.unpack_from(buf)
@@ -127,33 +142,27 @@ class BufferFS(object):
         toc_version = int(hdr['version'])
         self.log.trace("Found ToC version: 0x{}".format(toc_version))
         assert toc_version == 0
-        num_entries_struct = struct.Struct('!I')
+        num_entries_struct = self._u32_struct
         num_entries = num_entries_struct.unpack_from(
             buf, offset=default_hdr_struct.size
         )[0]
         self.log.trace("Header declares num entries: {}".format(num_entries))
         toc_offset = default_hdr_struct.size + num_entries_struct.size
         self.log.trace("TOC offset: {}".format(toc_offset))
-        entry_struct = struct.Struct(self.entry[toc_version][0])
+        entry_struct = self._entry_structs[toc_version]
+        entry_keys = self.entry[toc_version][1]
         entries = []
-        for entry_idx in range(num_entries):
-            entry_offset = toc_offset+entry_idx*entry_struct.size
-            entry_unpacked = \
-                entry_struct.unpack_from(
-                    buf,
-                    offset=entry_offset
-                )
-            entries.append(
-                dict(list(zip(self.entry[toc_version][1], entry_unpacked)))
-            )
+        for entry_unpacked in entry_struct.iter_unpack(
+                memoryview(buf)[
+                    toc_offset:toc_offset+num_entries*entry_struct.size]):
+            entries.append(dict(zip(entry_keys, entry_unpacked)))
             entries[-1]['id'] = entries[-1]['id'].rstrip(b'\0')
         self.log.trace("TOC has %d entries (CRC un-checked)", len(entries))
         crc_offset = toc_offset + num_entries * entry_struct.size
         self.log.trace("TOC CRC offset: %d", crc_offset)
-        crc_struct = struct.Struct('!I')
-        crc = crc_struct.unpack_from(buf, offset=crc_offset)[0]
+        crc = self._u32_struct.unpack_from(buf, offset=crc_offset)[0]
         self.log.trace("Calculating TOC CRC32 on %d bytes...", crc_offset)
-        expected_crc = zlib.crc32(buf[:crc_offset])
+        expected_crc = zlib.crc32(memoryview(buf)[:crc_offset])
         if crc != expected_crc:
             self.log.warning(
                 "EEPROM-FS Header CRC failed! " \
@@ -187,7 +196,7 @@ class BufferFS(object):
         entry_info = entries[identifier]
         entry_base = entry_info['base']
         entry_len = entry_info['length']
-        entry_buf = buf[entry_base:entry_base+entry_len]
+        entry_buf = memoryview(buf)[entry_base:entry_base+entry_len]
         entry_crc = zlib.crc32(entry_buf)
         self.log.trace("Calculating blob CRC32 on %d bytes...", len(entry_buf))
         if entry_crc != entry_info['CRC']:
@@ -197,7 +206,7 @@ class BufferFS(object):
                     identifier, entry_crc, entry_info['CRC']
                 )
             )
-        return entry_buf
+        return entry_buf.tobytes()
 
     def has_blob(self, identifier):
         """
@@ -276,6 +285,57 @@ class BufferFS(object):
         )
 
 
+    def get_dirty_ranges(self, block_size=DEFAULT_WRITE_BLOCK_SIZE):
+        """
+        Return the parts of the buffer which differ from what's stored on the
+        device, i.e., what needs to be written to update the device. The
+        return value is a list of (offset, data) tuples, where data is a
+        memoryview into the buffer.
+
+        The buffer is compared block by block, and the ranges consist of
+        entire blocks (aligned to block_size), except for the last one,
+        which may end with the buffer. Adjacent dirty blocks are merged into
+        one range.
+
+        What's stored on the device is the buffer that this object was
+        created from, or the buffer that was last passed to mark_clean().
+        """
+        new_buf = memoryview(self.buffer)
+        old_buf = memoryview(self._device_buffer)
+        dirty_ranges = []
+        range_start = None
+        for block_start in range(0, len(new_buf), block_size):
+            block_end = block_start + block_size
+            if new_buf[block_start:block_end] != old_buf[block_start:block_end]:
+                if range_start is None:
+                    range_start = block_start
+            elif range_start is not None:
+                dirty_ranges.append(
+                    (range_start, new_buf[range_start:block_start]))
+                range_start = None
+        if range_start is not None:
+            dirty_ranges.append((range_start, new_buf[range_start:]))
+        self.log.trace("Found %d dirty range(s) totalling %d bytes.",
+                       len(dirty_ranges),
+                       sum(len(data) for _, data in dirty_ranges))
+        return dirty_ranges
+
+    def mark_clean(self, buf=None):
+        """
+        Declare that buf (by default, the current buffer) is what's stored on
+        the device. Call this when the ranges returned by get_dirty_ranges()
+        were written, with the buffer they were taken from.
+        """
+        self._device_buffer = self.buffer if buf is None else buf
+
+    def mark_dirty(self):
+        """
+        Declare that what's stored on the device is unknown, e.g., because
+        writing to it failed. The next call to get_dirty_ranges() returns the
+        entire buffer.
+        """
+        self._device_buffer = b''
+
     def _find_base(self, new_entry, entries, alignment):
         """
         Find a spot to park a new entry.
@@ -358,9 +418,9 @@ class BufferFS(object):
                         # Not a great example of generic SW design
         entries_sorted = sorted(entries.values(), key=lambda x: x['base'])
         new_toc = \
-                struct.Struct(self.default_header[0]).pack(self.magic, 0) + \
-                struct.Struct('!I').pack(len(entries))
-        entry_struct = struct.Struct(self.entry[toc_version][0])
+                self._header_struct.pack(self.magic, 0) + \
+                self._u32_struct.pack(len(entries))
+        entry_struct = self._entry_structs[toc_version]
         for entry_info in entries_sorted:
             new_toc += entry_struct.pack(
                 entry_info['base'],
@@ -370,7 +430,7 @@ class BufferFS(object):
             )
         self.log.trace("Calculating new TOC CRC32 on %d bytes...", len(new_toc))
         new_toc_crc = zlib.crc32(new_toc)
-        new_toc += struct.Struct('!I').pack(new_toc_crc)
+        new_toc += self._u32_struct.pack(new_toc_crc)
         assert len(new_toc) < self.entries_base
         return new_toc + toc_buf[len(new_toc):]
 
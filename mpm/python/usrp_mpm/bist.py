@@ -12,8 +12,6 @@ import re
 import sys
 import time
 import json
-import select
-import socket
 from datetime import datetime
 import argparse
 import subprocess
@@ -119,24 +117,6 @@ def post_results(results):
         separators=(',', ': ')
     ))
 
-def sock_read_line(my_sock, timeout=60, interval=0.1):
-    """
-    Read from a socket until newline. If there was no newline until the timeout
-    occurs, raise an error. Otherwise, return the line.
-    """
-    line = b''
-    end_time = time.time() + timeout
-    while time.time() < end_time:
-        socket_ready = select.select([my_sock], [], [], 0)[0]
-        if socket_ready:
-            next_char = my_sock.recv(1)
-            if next_char == b'\n':
-                return line.decode('ascii')
-            line += next_char
-        else:
-            time.sleep(interval)
-    raise RuntimeError("sock_read_line() exceeded read timeout!")
-
 def poll_with_timeout(state_check, timeout_ms, interval_ms):
     """
     Calls state_check() every interval_ms until it returns a positive value, or
@@ -305,23 +285,13 @@ def get_gpsd_tpv_result():
     Query gpsd via a socket and return the corresponding JSON result as a
     dictionary.
     """
-    my_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    my_sock.connect(('localhost', 2947))
-    sys.stderr.write("Connected to GPSDO socket.\n")
-    query_cmd = b'?WATCH={"enable":true,"json":true}'
-    my_sock.sendall(query_cmd)
-    sys.stderr.write("Sent query: {}\n".format(query_cmd))
-    sock_read_line(my_sock, timeout=10)
-    sys.stderr.write("Received initial newline.\n")
-    result = {}
-    while result.get('class', None) != 'TPV':
-        json_result = sock_read_line(my_sock, timeout=60)
-        sys.stderr.write(
-            "Received JSON response: {}\n\n".format(json_result)
-        )
-        result = json.loads(json_result)
-    my_sock.sendall(b'?WATCH={"enable":false}')
-    my_sock.close()
+    from usrp_mpm.gpsd_iface import GPSDIface
+    with GPSDIface() as gps_iface:
+        sys.stderr.write("Connected to GPSDO socket.\n")
+        result = gps_iface.get_report('TPV', timeout=60)
+        sys.stderr.write("Received TPV report: {}\n\n".format(result))
+    if not result:
+        raise RuntimeError("Timeout waiting for a TPV report from gpsd!")
     return result
 
 def get_ref_clock_prop(clock_source, time_source, extra_args=None):
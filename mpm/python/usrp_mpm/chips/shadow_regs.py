@@ -0,0 +1,164 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Shadow register layer for register interfaces
+"""
+
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+from builtins import object
+
+class ShadowRegs(object):
+    """
+    Wraps a register interface (anything with peek8/poke8, peek16/poke16
+    and/or peek32/poke32, e.g. a SPI regs_iface or a UIO object) and keeps a
+    shadow copy of the register values.
+
+    For registers which are not volatile, this means:
+    - Reads are served from the shadow copy once the register value is known
+      (because it was read or written before). Read-modify-write sequences
+      thus only cost a single bus transaction.
+    - Writes are skipped if the register already holds the value.
+    - Within a deferred() block, writes are only stored, and are sent to the
+      device when the block is left (or flush() is called). Multiple writes
+      to the same register are combined into one.
+
+    Volatile registers (status registers, self-clearing bits, resets, FIFOs,
+    anything the device changes by itself or where the write itself has side
+    effects) bypass the shadow copy. Accessing them flushes pending writes
+    first, so the ordering with respect to earlier writes is preserved.
+
+    When the device gets reset, call invalidate(), or the shadow copy will
+    be stale.
+
+    Arguments:
+    regs_iface -- The register interface to wrap
+    volatile_regs -- Addresses of the volatile registers
+    """
+    WIDTHS = (8, 16, 32)
+
+    def __init__(self, regs_iface, volatile_regs=None):
+        self.regs_iface = regs_iface
+        self._volatile_regs = set(volatile_regs or ())
+        # Map (width, addr) -> last known register value
+        self._shadow = {}
+        # Map (width, addr) -> value for writes which were not yet flushed
+        self._dirty = OrderedDict()
+        self._defer_count = 0
+        # Statistics on how many bus transactions were avoided
+        self.skipped_reads = 0
+        self.skipped_writes = 0
+        for width in self.WIDTHS:
+            if hasattr(regs_iface, 'peek{}'.format(width)):
+                setattr(self, 'peek{}'.format(width),
+                        functools.partial(self._peek, width))
+            if hasattr(regs_iface, 'poke{}'.format(width)):
+                setattr(self, 'poke{}'.format(width),
+                        functools.partial(self._poke, width))
+
+    def __getattr__(self, name):
+        # Everything else (e.g. transfer24_8) goes straight to the device.
+        # Flush first, so nothing overtakes pending writes.
+        if name.startswith('_') or name == 'regs_iface':
+            raise AttributeError(name)
+        attr = getattr(self.regs_iface, name)
+        if not callable(attr):
+            return attr
+        @functools.wraps(attr)
+        def _flush_and_call(*args, **kwargs):
+            self.flush()
+            return attr(*args, **kwargs)
+        return _flush_and_call
+
+    def _peek(self, width, addr):
+        " Read a register, from the shadow copy if possible "
+        key = (width, addr)
+        if addr not in self._volatile_regs:
+            if key in self._dirty:
+                self.skipped_reads += 1
+                return self._dirty[key]
+            if key in self._shadow:
+                self.skipped_reads += 1
+                return self._shadow[key]
+        self.flush()
+        value = getattr(self.regs_iface, 'peek{}'.format(width))(addr)
+        if addr not in self._volatile_regs:
+            self._shadow[key] = value
+        return value
+
+    def _poke(self, width, addr, value):
+        " Write a register, unless it already holds value "
+        value &= (1 << width) - 1
+        key = (width, addr)
+        if addr in self._volatile_regs:
+            self.flush()
+            getattr(self.regs_iface, 'poke{}'.format(width))(addr, value)
+            return
+        if self._defer_count:
+            self._dirty.pop(key, None)
+            if self._shadow.get(key) == value:
+                self.skipped_writes += 1
+            else:
+                self._dirty[key] = value
+            return
+        if self._shadow.get(key) == value:
+            self.skipped_writes += 1
+            return
+        getattr(self.regs_iface, 'poke{}'.format(width))(addr, value)
+        self._shadow[key] = value
+
+    def flush(self):
+        """
+        Write all pending (deferred) register values to the device, in the
+        order they were last written. If they are all 32-bit registers and
+        the interface has poke32_many() (e.g. UIO), they are written in a
+        single call.
+        """
+        if self._dirty and hasattr(self.regs_iface, 'poke32_many') and \
+                all(width == 32 for width, _ in self._dirty):
+            dirty = list(self._dirty.items())
+            self.regs_iface.poke32_many(
+                [(addr, value) for (_, addr), value in dirty])
+            self._dirty.clear()
+            self._shadow.update(dirty)
+            return
+        while self._dirty:
+            (width, addr), value = self._dirty.popitem(last=False)
+            getattr(self.regs_iface, 'poke{}'.format(width))(addr, value)
+            self._shadow[(width, addr)] = value
+
+    @contextmanager
+    def deferred(self):
+        """
+        Context manager: Writes to non-volatile registers inside the block
+        are collected and flushed as a batch when the block is left. Only use
+        this for registers where the order of the writes doesn't matter.
+        Blocks may be nested, the flush happens when the outermost block is
+        left.
+        """
+        self._defer_count += 1
+        try:
+            yield self
+        finally:
+            self._defer_count -= 1
+            if not self._defer_count:
+                self.flush()
+
+    def invalidate(self, addr=None):
+        """
+        Forget the shadow value of the register at addr, or of all registers
+        if addr is None. Pending writes are flushed first.
+        """
+        self.flush()
+        if addr is None:
+            self._shadow = {}
+        else:
+            self._shadow = {
+                key: value
+                for key, value in self._shadow.items()
+                if key[1] != addr
+            }
@@ -39,6 +39,8 @@ Important considerations:
   - Currently, a .pes (Python Eye Scan) custom binary file is generated, which includes
     metadata and the sample/error counters results at each offset for the scanned GT(s).
     This file is further processed and visualized with an internal set of LabVIEW VIs.
+  - If NumPy is available, the same results are also saved to a .npz file next to the
+    .pes file (see step 7), and the GTs are scanned in parallel (see theory of operation).
 
 
 Using the Eye Scan tool:
@@ -80,6 +82,13 @@ Using the Eye Scan tool:
          Valid range is -127 to 127 (full range), corresponding to 0.39 %
          increments.
          Definition example: {'start':-127, 'stop':127, 'step': 2}
+       Refine step (requires NumPy).
+         Enables coarse-to-fine sampling: Only every refine_step-th offset (in both
+         directions) is measured first, and then all offsets in the areas where the
+         coarse results change between error-free and errors (i.e. close to the eye
+         boundary). The skipped offsets get the counters of the nearest measured
+         offset. Note that eye features smaller than refine_step can be missed.
+         Valid values for this tool: 1 (measure every offset, default), 2, 4, 8, 16.
 
   3. Determine which GT(s) will be scanned.
      The tool supports single scan and parallel multi-lane scan. The previous GT
@@ -105,7 +114,7 @@ Using the Eye Scan tool:
      Assuming the EyeScanTool class has been imported to the calling file, here is
      an object creation example:
        args = {'rxout_div': 2, 'rx_int_datawidth': 20, 'eq_mode': 'LPM', 'prescale': 1,
-               'SAVE_DIR': "/home/root/my_dir/"}
+               'refine_step': 1, 'SAVE_DIR': "/home/root/my_dir/"}
        eyescan_tool = EyeScanTool(jesdcore=jesdcore_object,
                                   slot_idx=0,
                                   **args)
@@ -134,6 +143,12 @@ Using the Eye Scan tool:
          recommended to use the Multi-Lane VI to process/visualize the results.
      These VIs are for NI/Ettus internal use only. For further details, please contact
      Humberto Jimenez at humberto.jimenez@ni.com.
+     The .npz file (if any) has the same base name as the .pes file, and can be loaded
+     with numpy.load(). It contains the scan configuration (prescale, rxout_div,
+     rx_int_datawidth, eq_mode, refine_step, lanes, ...), the offsets (hor_offsets,
+     ver_offsets, ut_signs), and the counters as arrays indexed by
+     [lane, UT sign, horizontal offset, vertical offset] (samples, errors). The
+     measured array tells which offsets were actually measured.
 
 
 Theory of operation:
@@ -154,6 +169,14 @@ Theory of operation:
   eyescan_full_scan(...) method; which handles the measurement configuration, the binary
   file creation, the GT(s) configuration, and the measurement sweep across the ranges.
 
+  Without NumPy, the sweep measures one offset coordinate at a time: it starts the
+  measurement on all GTs, and waits until all of them are done before moving on. With
+  NumPy, each GT moves on to its next offset as soon as its own measurement is done, so
+  GTs with different measurement times don't wait for each other. The counters are
+  stored in preallocated arrays, and written to the .pes file in one go at the end.
+  In both cases, the eye scan attributes (offsets, control) are kept in a shadow copy,
+  so they are only read once, and only written when they change.
+
 
 Future work ideas:
 
@@ -169,8 +192,55 @@ import os
 import time
 import math
 import datetime
+from collections import deque
 from builtins import object
+from usrp_mpm.chips.shadow_regs import ShadowRegs
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.mpmlog import TRACE
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class _LaneDRPIface(object):
+    """
+    Register interface (peek16/poke16) to the DRP of a single GT, through
+    the EyeScanTool's JESD core. Selects the GT as DRP target before every
+    access, unless it is already selected.
+    """
+    def __init__(self, eyescan_tool, lane_num):
+        self._eyescan_tool = eyescan_tool
+        self._lane_num = lane_num
+
+    def peek16(self, addr):
+        " Read a DRP register "
+        self._eyescan_tool.set_global_lane(self._lane_num)
+        return self._eyescan_tool.jesdcore.drp_access(rd=True, addr=addr)
+
+    def poke16(self, addr, data):
+        " Write a DRP register "
+        self._eyescan_tool.set_global_lane(self._lane_num)
+        self._eyescan_tool.jesdcore.drp_access(rd=False, addr=addr, wr_data=data)
+
+def _coarse_indexes(num_points, step):
+    """
+    Returns the indexes of the coarse grid along one axis with num_points points:
+    every step-th index, plus the last one. Always returns at least two indexes
+    (repeating index 0 if num_points is 1), so they form at least one cell.
+    """
+    indexes = list(range(0, num_points, step))
+    if indexes[-1] != num_points - 1 or len(indexes) == 1:
+        indexes.append(num_points - 1)
+    return numpy.array(indexes)
+
+def _nearest_indexes(num_points, coarse_indexes):
+    """
+    Returns, for every index along one axis with num_points points, the nearest
+    index in coarse_indexes.
+    """
+    indexes = numpy.arange(num_points)
+    distances = numpy.abs(indexes[:, numpy.newaxis] - coarse_indexes[numpy.newaxis, :])
+    return coarse_indexes[distances.argmin(axis=1)]
 
 class EyeScanTool(object):
     """
@@ -186,6 +256,20 @@ class EyeScanTool(object):
     # E.g. PRINT_STATUS_EVERY = 1 will print a status message every offset measurement.
     PRINT_STATUS_EVERY = 10
 
+    # Max. number of status polls per acquisition before giving up.
+    WAIT_EXIT_AFTER = 10000
+
+    # DRP addresses which are changed by the GT itself, and thus must not be
+    # served from the shadow copy.
+    ES_ERROR_COUNT_ADDR = 0x14F
+    ES_SAMPLE_COUNT_ADDR = 0x150
+    ES_CONTROL_STATUS_ADDR = 0x151
+    VOLATILE_DRP_REGS = (ES_ERROR_COUNT_ADDR, ES_SAMPLE_COUNT_ADDR, ES_CONTROL_STATUS_ADDR)
+
+    # Eye scan control FSM states, as reported by ES_CONTROL_STATUS[3:1].
+    STATE_DECODE = {'WAIT': 0b000, 'RESET': 0b001, 'COUNT': 0b011, \
+                    'END' : 0b010, 'ARMED': 0b101, 'READ' : 0b100}
+
     lanes = None
     # Array that defines the available lanes to measure.
     lane_num = None
@@ -197,6 +281,9 @@ class EyeScanTool(object):
         """
         # Set the global variable and the DRP target with the given lane number.
         if lane_num is not None:
+            if lane_num == self.lane_num:
+                # DRP target is already set.
+                return
             self.log.trace("Setting lane %d as the global variable...", lane_num)
             # Set the global variable.
             self.lane_num = lane_num
@@ -209,6 +296,20 @@ class EyeScanTool(object):
             # Disable DRP target for the given lane number.
             self.jesdcore.disable_drp_target()
 
+    def _drp(self, lane_num=None):
+        """
+        Returns the shadowed DRP register interface of the given lane (default:
+        the current lane number). The eye scan attributes are only modified by
+        this tool, so read-modify-write sequences on them only cost a write.
+        """
+        if lane_num is None:
+            lane_num = self.lane_num
+        if lane_num not in self._drp_regs:
+            self._drp_regs[lane_num] = ShadowRegs(
+                _LaneDRPIface(self, lane_num),
+                volatile_regs=self.VOLATILE_DRP_REGS)
+        return self._drp_regs[lane_num]
+
 
     def __init__(self, jesdcore, slot_idx=0, **kwargs):
         def validate_config():
@@ -219,9 +320,11 @@ class EyeScanTool(object):
             assert self.rxout_div in (1, 2, 4, 8, 16)
             assert self.rx_int_datawidth in (16, 20, 32, 40)
             assert self.eq_mode.upper() in ('LPM', 'DFE')
+            assert self.refine_step in (1, 2, 4, 8, 16)
             self.log.debug("Valid Eye Scan configuration: prescale=%d rxout_div=%d"
-                           " rx_int_datawidth=%d eq_mode=%s",
-                           self.prescale, self.rxout_div, self.rx_int_datawidth, self.eq_mode)
+                           " rx_int_datawidth=%d eq_mode=%s refine_step=%d",
+                           self.prescale, self.rxout_div, self.rx_int_datawidth, self.eq_mode,
+                           self.refine_step)
         #
         self.slot_idx = slot_idx
         self.log = get_logger("EyeScanTool-{}".format(self.slot_idx))
@@ -254,12 +357,23 @@ class EyeScanTool(object):
         # Valid values = 'LPM', 'DFE'.
         self.eq_mode = 'LPM'
         #
+        # Coarse-to-fine sampling: The sweep first measures every
+        # refine_step-th offset in both directions, and then only measures
+        # the remaining offsets close to the eye boundary (i.e. where the
+        # coarse measurement changes between error-free and errors).
+        # Requires NumPy. 1 means that every offset is measured.
+        # Valid values: 1, 2, 4, 8, 16.
+        self.refine_step = 1
+        #
+        # Shadow copies of the DRP registers of each lane (see _drp()).
+        self._drp_regs = {}
+        #
         # Overwrite the default configuration parameters with the ones given
         # by the user (host) through kwargs.
         for key, new_val in list(kwargs.items()):
             if hasattr(self, key) and (new_val != getattr(self, key)):
-                self.log.trace("Overwriting {0}... default:{1} user:{2}"
-                               .format(key, getattr(self, key), new_val))
+                self.log.trace("Overwriting %s... default:%s user:%s",
+                               key, getattr(self, key), new_val)
                 setattr(self, key, new_val)
         # Validate configuration attributes' values.
         validate_config()
@@ -416,6 +530,8 @@ class EyeScanTool(object):
                                    .format(self.lane_num))
                     raise  RuntimeError('Eye Scan cicuitry is powered down, see log for details.')
             self.log.info("Configured GT #%d!", self.lane_num)
+        # The registers were written directly, drop any stale shadow copies.
+        self._drp_regs = {}
         self.set_global_lane(None)
         return
 
@@ -443,22 +559,23 @@ class EyeScanTool(object):
         EYE_SCAN_EN_VAL = 0b1
         self.log.trace("Eyescan state machine control for MGT #%d", self.lane_num)
         # Read the current register values.
-        drp_x03d_rb = self.jesdcore.drp_access(rd=True, addr=0x03D)
+        drp_x03d_rb = self._drp().peek16(0x03D)
         # Determine the GT Channel attributes to be changed.
         es_errdet_en   = int(err_det_en)
         es_eye_scan_en = EYE_SCAN_EN_VAL
         es_control     = (int(run)                         << 0) | \
                          (int(arm)                         << 1) | \
                          (ARM_TRIGGER_ON["error_detected"] << 2)
-        self.log.trace("Control attributes... ES_ERRDET_EN:0b{0:b}"
-                       " ES_EYE_SCAN_EN:0b{1:b} ES_CONTROL:0b{2:06b}"
-                       .format(es_errdet_en, es_eye_scan_en, es_control))
+        if self.log.isEnabledFor(TRACE):
+            self.log.trace("Control attributes... ES_ERRDET_EN:0b{0:b}"
+                           " ES_EYE_SCAN_EN:0b{1:b} ES_CONTROL:0b{2:06b}"
+                           .format(es_errdet_en, es_eye_scan_en, es_control))
         # Build and write the new register values.
         drp_x03d_wr = ((drp_x03d_rb & ~0x023F) << 0) | \
                       (es_errdet_en            << 9) | \
                       (es_eye_scan_en          << 8) | \
                       (es_control              << 0)
-        self.jesdcore.drp_access(rd=False, addr=0x03D, wr_data=drp_x03d_wr)
+        self._drp().poke16(0x03D, drp_x03d_wr)
         return drp_x03d_rb != drp_x03d_wr # Return True when the register changed.
 
 
@@ -476,31 +593,42 @@ class EyeScanTool(object):
           ut_sign    -> UT tap sign: '+UT' or '-UT'.
         """
         UT_SIGN_BIT = {'+UT': 0b0, '-UT': 0b1}
-        self.log.trace("Offset configuration for MGT #{}:".format(self.lane_num))
+        self.log.trace("Offset configuration for MGT #%s:", self.lane_num)
         # Do some input validation for the given parameters.
         assert ut_sign.upper() in ('+UT', '-UT')
         self.log.trace("GT #%d  Horizontal offset: %d  Vertical offset: %d  Tap: %s",
                        self.lane_num, hor_offset, ver_offset, ut_sign)
         # Read the current register values.
-        drp_x03b_rb = self.jesdcore.drp_access(rd=True, addr=0x03B)
-        drp_x03c_rb = self.jesdcore.drp_access(rd=True, addr=0x03C)
+        drp_x03b_rb = self._drp().peek16(0x03B)
+        drp_x03c_rb = self._drp().peek16(0x03C)
         # Determine the GT channel attributes to be changed.
         es_vert_offset = ((abs(ver_offset) & 0x007F) << 0) | \
                          ( int(ver_offset < 0)       << 7) | \
                          ( UT_SIGN_BIT[ut_sign]      << 8)
         es_horz_offset = (hor_offset & 0x0FFF)
-        self.log.trace("Offset attributes... ES_HORZ_OFFSET:0b{0:012b} ES_VERT_OFFSET:0b{1:09b}"
-                       .format(es_horz_offset, es_vert_offset))
+        if self.log.isEnabledFor(TRACE):
+            self.log.trace("Offset attributes... ES_HORZ_OFFSET:0b{0:012b} "
+                           "ES_VERT_OFFSET:0b{1:09b}"
+                           .format(es_horz_offset, es_vert_offset))
         # Build and write new register values.
         drp_x03b_wr = (drp_x03b_rb & ~0x01FF) | (es_vert_offset & 0x01FF)
         drp_x03c_wr = (drp_x03c_rb & ~0x0FFF) | (es_horz_offset & 0x0FFF)
-        self.jesdcore.drp_access(rd=False, addr=0x03B, wr_data=drp_x03b_wr)
-        self.jesdcore.drp_access(rd=False, addr=0x03C, wr_data=drp_x03c_wr)
+        self._drp().poke16(0x03B, drp_x03b_wr)
+        self._drp().poke16(0x03C, drp_x03c_wr)
         # Return True when at least one of the two registers changed.
         return (drp_x03b_rb != drp_x03b_wr) or (drp_x03c_rb != drp_x03c_wr)
 
 
-    def eyescan_wait(self, wait_for='END', exit_after=10000):
+    def _poll_delay(self):
+        """
+        Returns the time (in seconds) to wait between two polls of the eye scan
+        control FSM status. With high prescale values, a single acquisition takes
+        long, so there is no point in polling continuously.
+        """
+        return (2 ** (self.prescale - 13) if (self.prescale > 13) else 0) / 1000.0
+
+
+    def eyescan_wait(self, wait_for='END', exit_after=WAIT_EXIT_AFTER):
         """
         This function waits for the eye scan control FSM of the current lane
         number, to transition to the given state (wait_for).
@@ -510,8 +638,6 @@ class EyeScanTool(object):
           wait_for -> State which the function waits the FSM to transition to.
                       {'WAIT','RESET','COUNT','END','ARMED','READ'}
         """
-        STATE_DECODE = {'WAIT': 0b000, 'RESET': 0b001, 'COUNT': 0b011, \
-                        'END' : 0b010, 'ARMED': 0b101, 'READ' : 0b100}
         self.log.trace("Waiting for %s state at MGT #%d", wait_for, self.lane_num)
         # Validate the state input parameter.
         assert wait_for.upper() in ('WAIT', 'RESET', 'COUNT', 'END', 'ARMED', 'READ')
@@ -519,20 +645,23 @@ class EyeScanTool(object):
         # the given state.
         state_reached = False
         iterations = 0
-        delay = 2 ** (self.prescale - 13) if (self.prescale > 13) else 0
+        delay = self._poll_delay()
         while not state_reached:
             # Read the status register.
-            es_control_status = self.jesdcore.drp_access(rd=True, addr=0x151)
+            es_control_status = self.jesdcore.drp_access(
+                rd=True, addr=self.ES_CONTROL_STATUS_ADDR)
             done = es_control_status & 0x0001
             current_state = (es_control_status & 0x000E) >> 1
-            self.log.trace("Current state: 0b{0:03b}  Status: %s"
-                           .format(current_state), {0b0:'Not Done!', 0b1: 'Done!'}[done])
+            if self.log.isEnabledFor(TRACE):
+                self.log.trace("Current state: 0b{0:03b}  Status: %s"
+                               .format(current_state),
+                               {0b0:'Not Done!', 0b1: 'Done!'}[done])
             # Compare current state with expected state.
-            state_reached = (current_state == STATE_DECODE[wait_for])
+            state_reached = (current_state == self.STATE_DECODE[wait_for])
             if (iterations >= 100) and (not state_reached) and (iterations % 100 == 0):
                 self.log.debug("%s state has not been reached for GT #%d after %d iterations.",
                                wait_for, self.lane_num, iterations)
-            time.sleep(delay / 1000.0)
+            time.sleep(delay)
             # Exit after so many iterations, prevneting the application to hang.
             iterations += 1
             if exit_after == iterations:
@@ -554,10 +683,12 @@ class EyeScanTool(object):
         self.log.trace("Reading counters for GT #%d ...", self.lane_num)
         counters = {'error_count': 0x0000, 'sample_count': 0x0000}
         # Read the error counter.
-        counters['error_count' ] = self.jesdcore.drp_access(rd=True, addr=0x14F) & 0xFFFF
-        counters['sample_count'] = self.jesdcore.drp_access(rd=True, addr=0x150) & 0xFFFF
-        self.log.trace("es_error_count: 0x{:04X}   es_sample_count: 0x{:04X}"
-                       .format(counters['error_count'], counters['sample_count']))
+        counters['error_count' ] = \
+            self.jesdcore.drp_access(rd=True, addr=self.ES_ERROR_COUNT_ADDR) & 0xFFFF
+        counters['sample_count'] = \
+            self.jesdcore.drp_access(rd=True, addr=self.ES_SAMPLE_COUNT_ADDR) & 0xFFFF
+        self.log.trace("es_error_count: 0x%04X   es_sample_count: 0x%04X",
+                       counters['error_count'], counters['sample_count'])
         return counters
 
 
@@ -573,7 +704,7 @@ class EyeScanTool(object):
           ver_offset -> Vertical voltage offset.
                         [-127, 127] corresponding to 0.39% increments.
         """
-        self.log.trace("Starting acquisition for GTs {}".format(self.lanes))
+        self.log.trace("Starting acquisition for GTs %s", self.lanes)
         acq_counters = [] # Array that stores multiple sl_counters lists.
         for _ in range(0, max(self.lanes) + 1):
             acq_counters.append({})
@@ -673,8 +804,8 @@ class EyeScanTool(object):
             for current_lane in self.lanes:
                 # Write the counters for the current lane.
                 sl_counters = acq_counters[current_lane]
-                self.log.debug("Writing +UT counters for GT #{0}: {1}"
-                               .format(current_lane, sl_counters))
+                self.log.debug("Writing +UT counters for GT #%s: %s",
+                               current_lane, sl_counters)
                 byte_number = (sl_counters['+UT']['sample_count']).to_bytes(2, 'little')
                 bin_file.write(byte_number)
                 byte_number = (sl_counters['+UT']['error_count' ]).to_bytes(2, 'little')
@@ -711,6 +842,220 @@ class EyeScanTool(object):
                     self.log.info("Eye Scan progress for %s sweep: %.2f %%", gts_string, progress)
 
 
+    def _parallel_acquisitions(self, lane_points, results, description):
+        """
+        Performs the acquisitions at the given grid points, on all lanes in
+        parallel. Unlike eyescan_acquisition(), lanes do not wait for each other:
+        whenever the FSM of a lane reaches the END state, its counters are read
+        and the lane's next acquisition (next UT sign or next point) is started
+        right away, while the other lanes keep counting.
+
+        Parameters:
+          lane_points -> List (one element per lane in self.lanes) of lists of
+                         (hor_index, ver_index) tuples to measure.
+          results     -> Result dictionary as created by eyescan_parallel_sweep().
+                         The counters are stored into its arrays.
+          description -> Name of this pass, for status messages.
+        """
+        hor_offsets = results['hw_hor_offsets']
+        ver_offsets = results['ver_offsets']
+        ut_signs = results['ut_signs']
+        total_points = sum(len(points) for points in lane_points)
+        done_points = 0
+        # Map lane index -> [queue of remaining points, current point,
+        #                    current UT sign index, number of status polls]
+        active = {}
+        def start_acquisition(lane_idx):
+            """
+            Starts the acquisition of the current point and UT sign on the
+            given lane.
+            """
+            lane_state = active[lane_idx]
+            hor_idx, ver_idx = lane_state[1]
+            self.set_global_lane(self.lanes[lane_idx])
+            self.eyescan_control(err_det_en=True, run=False, arm=False)
+            self.eyescan_offset(int(hor_offsets[hor_idx]), int(ver_offsets[ver_idx]),
+                                ut_sign=ut_signs[lane_state[2]])
+            self.eyescan_control(err_det_en=True, run=True, arm=False)
+            lane_state[3] = 0
+        #
+        gts_string = "GTs {}".format(self.lanes)
+        self.log.trace("Starting %s pass for %s (%d points)...",
+                       description, gts_string, total_points)
+        for lane_idx, points in enumerate(lane_points):
+            queue = deque(points)
+            if queue:
+                active[lane_idx] = [queue, queue.popleft(), 0, 0]
+                start_acquisition(lane_idx)
+        end_state = self.STATE_DECODE['END']
+        delay = self._poll_delay()
+        while active:
+            any_done = False
+            for lane_idx in list(active):
+                lane_state = active[lane_idx]
+                self.set_global_lane(self.lanes[lane_idx])
+                es_control_status = self.jesdcore.drp_access(
+                    rd=True, addr=self.ES_CONTROL_STATUS_ADDR)
+                if (es_control_status & 0x000E) >> 1 != end_state:
+                    lane_state[3] += 1
+                    if lane_state[3] >= self.WAIT_EXIT_AFTER:
+                        self.log.error("END state was not reached at GT #%d after %d polls.",
+                                       self.lane_num, lane_state[3])
+                        raise Exception("Eyescan status timed out, see log for details.")
+                    continue
+                any_done = True
+                # Clear run & arm bits in the Eyescan control, and read counters.
+                self.eyescan_control(err_det_en=True, run=False, arm=False)
+                counters = self.eyescan_counters()
+                hor_idx, ver_idx = lane_state[1]
+                ut_idx = lane_state[2]
+                results['samples'][lane_idx, ut_idx, hor_idx, ver_idx] = \
+                    counters['sample_count']
+                results['errors'][lane_idx, ut_idx, hor_idx, ver_idx] = \
+                    counters['error_count']
+                # Continue with the next UT sign (DFE eq. only) or the next point.
+                if ut_idx + 1 < len(ut_signs):
+                    lane_state[2] = ut_idx + 1
+                    start_acquisition(lane_idx)
+                    continue
+                results['measured'][lane_idx, hor_idx, ver_idx] = True
+                done_points += 1
+                # Only print status messages every PRINT_STATUS_EVERY points.
+                if done_points % self.PRINT_STATUS_EVERY == 0:
+                    self.log.info("Eye Scan progress for %s %s pass: %.2f %%",
+                                  gts_string, description,
+                                  done_points / total_points * 100)
+                if lane_state[0]:
+                    lane_state[1] = lane_state[0].popleft()
+                    lane_state[2] = 0
+                    start_acquisition(lane_idx)
+                else:
+                    del active[lane_idx]
+            if not any_done:
+                time.sleep(delay)
+        self.set_global_lane(None)
+
+
+    def eyescan_parallel_sweep(self, parsed_ranges):
+        """
+        Performs the Eye Scan "measurement loop" across the given phase and voltage
+        offset ranges, like eyescan_sweep(), but with all lanes acquiring in parallel
+        (see _parallel_acquisitions()), and with coarse-to-fine sampling if
+        refine_step > 1. Requires NumPy.
+
+        Returns a dictionary with the following NumPy arrays:
+          samples        -> Sample counters, uint16, indexed by
+                            [lane index, UT sign index, hor. index, ver. index].
+          errors         -> Error counters, same layout as samples.
+          measured       -> Boolean, [lane index, hor. index, ver. index]. False for
+                            points which were skipped by the coarse-to-fine sampling.
+                            Their counters are copied from the nearest coarse point.
+          hor_offsets    -> Horizontal offsets (as given by the user).
+          hw_hor_offsets -> Horizontal offsets, as written to the GT.
+          ver_offsets    -> Vertical offsets.
+          ut_signs       -> UT signs ('+UT' and, in DFE eq. mode, '-UT').
+
+        Parameters:
+          parsed_ranges -> This is a keyed list with parsed parameters from parse_ranges().
+        """
+        assert numpy is not None
+        hw_hor_offsets = numpy.arange(parsed_ranges['hor_start'], parsed_ranges['hor_stop'] + 1,
+                                      parsed_ranges['hor_step'])
+        ver_offsets = numpy.arange(parsed_ranges['ver_start'], parsed_ranges['ver_stop'] + 1,
+                                   parsed_ranges['ver_step'])
+        ut_signs = ('+UT', '-UT') if self.eq_mode == 'DFE' else ('+UT',)
+        num_lanes = len(self.lanes)
+        counter_shape = (num_lanes, len(ut_signs), len(hw_hor_offsets), len(ver_offsets))
+        results = {
+            'samples': numpy.zeros(counter_shape, dtype=numpy.uint16),
+            'errors': numpy.zeros(counter_shape, dtype=numpy.uint16),
+            'measured': numpy.zeros(
+                (num_lanes, len(hw_hor_offsets), len(ver_offsets)), dtype=bool),
+            'hor_offsets': hw_hor_offsets // self.rxout_div,
+            'hw_hor_offsets': hw_hor_offsets,
+            'ver_offsets': ver_offsets,
+            'ut_signs': ut_signs,
+        }
+        # Coarse pass: Every refine_step-th point, plus the last ones. With
+        # refine_step=1, this is the full scan.
+        hor_coarse = _coarse_indexes(len(hw_hor_offsets), self.refine_step)
+        ver_coarse = _coarse_indexes(len(ver_offsets), self.refine_step)
+        coarse_points = [(hor_idx, ver_idx)
+                         for hor_idx in numpy.unique(hor_coarse)
+                         for ver_idx in numpy.unique(ver_coarse)]
+        self._parallel_acquisitions([coarse_points] * num_lanes, results,
+                                    "coarse" if self.refine_step > 1 else "full")
+        if self.refine_step == 1:
+            return results
+        # Fine pass: Measure all points in the coarse cells where the corners
+        # disagree on whether there were errors.
+        fine_points = []
+        for lane_idx in range(num_lanes):
+            has_errors = results['errors'][lane_idx].sum(axis=0) > 0
+            corners = has_errors[numpy.ix_(hor_coarse, ver_coarse)]
+            cell_corners = numpy.stack((corners[:-1, :-1], corners[1:, :-1],
+                                        corners[:-1, 1:], corners[1:, 1:]))
+            boundary_cells = cell_corners.any(axis=0) & ~cell_corners.all(axis=0)
+            refine = numpy.zeros(has_errors.shape, dtype=bool)
+            for cell_hor, cell_ver in numpy.argwhere(boundary_cells):
+                refine[hor_coarse[cell_hor]:hor_coarse[cell_hor + 1] + 1,
+                       ver_coarse[cell_ver]:ver_coarse[cell_ver + 1] + 1] = True
+            refine &= ~results['measured'][lane_idx]
+            fine_points.append([tuple(point) for point in numpy.argwhere(refine)])
+        self._parallel_acquisitions(fine_points, results, "fine")
+        # Fill in the points that were skipped from the nearest coarse point.
+        hor_nearest = _nearest_indexes(len(hw_hor_offsets), hor_coarse)
+        ver_nearest = _nearest_indexes(len(ver_offsets), ver_coarse)
+        skipped = ~results['measured'][:, numpy.newaxis, :, :]
+        for key in ('samples', 'errors'):
+            nearest = results[key][:, :, hor_nearest[:, numpy.newaxis], ver_nearest]
+            results[key] = numpy.where(skipped, nearest, results[key])
+        self.log.info("Eye Scan measured %d of %d points per lane.",
+                      results['measured'].sum() // num_lanes, results['measured'][0].size)
+        return results
+
+
+    def write_pes_data(self, bin_file, results):
+        """
+        Writes the counters of a eyescan_parallel_sweep() to the .pes file, in the
+        same format as eyescan_sweep() does, with a single write.
+
+        Parameters:
+          bin_file -> Binary file reference to write data to. Passed from top level function.
+          results  -> Result dictionary as returned by eyescan_parallel_sweep().
+        """
+        # eyescan_sweep() writes, for each point (horizontal outer loop, vertical
+        # inner loop), for each lane, for each UT sign: sample count, error count.
+        pes_data = numpy.stack((results['samples'], results['errors']), axis=-1)
+        bin_file.write(pes_data.transpose(2, 3, 0, 1, 4).astype('<u2').tobytes())
+
+
+    def save_npz_file(self, pes_file_name, results):
+        """
+        Saves the results of a eyescan_parallel_sweep(), plus the scan configuration,
+        to a compressed NumPy .npz file next to the .pes file. Returns the file name.
+
+        Parameters:
+          pes_file_name -> Name of the .pes file, as returned by create_pes_file().
+          results       -> Result dictionary as returned by eyescan_parallel_sweep().
+        """
+        file_name = os.path.splitext(pes_file_name)[0] + ".npz"
+        numpy.savez_compressed(
+            os.path.join(self.SAVE_DIR, file_name),
+            version="{}.{}".format(self.VER_MAJOR, self.VER_MINOR),
+            mgt_type=self.MGT_TYPE,
+            slot_idx=self.slot_idx,
+            lanes=numpy.array(self.lanes),
+            prescale=self.prescale,
+            rxout_div=self.rxout_div,
+            rx_int_datawidth=self.rx_int_datawidth,
+            eq_mode=self.eq_mode,
+            refine_step=self.refine_step,
+            **results)
+        self.log.info("Eye Scan results saved to %s", file_name)
+        return file_name
+
+
     def create_pes_file(self, hor_range, ver_range):
         """
         This function creates a .pes file and writes the metadata header.
@@ -770,7 +1115,7 @@ class EyeScanTool(object):
         #
         # Create the directory to save the pes files if it does not exist.
         if not os.path.isdir(self.SAVE_DIR):
-            self.log.trace("Creating directory: {}".format(self.SAVE_DIR))
+            self.log.trace("Creating directory: %s", self.SAVE_DIR)
             os.makedirs(self.SAVE_DIR)
         # Open the binary file which data will be saved to.
         file_name = build_file_name()
@@ -833,7 +1178,14 @@ class EyeScanTool(object):
         # Configure the requested lanes.
         self.eyescan_config()
         # Perform the sweep on the requested lanes.
-        self.eyescan_sweep(pes_file, parsed_ranges)
+        if numpy is not None:
+            results = self.eyescan_parallel_sweep(parsed_ranges)
+            self.write_pes_data(pes_file, results)
+            self.save_npz_file(file_name, results)
+        else:
+            if self.refine_step > 1:
+                self.log.warning("NumPy is not available, measuring all points.")
+            self.eyescan_sweep(pes_file, parsed_ranges)
         # Close the binary file.
         pes_file.close()
         return file_name
@@ -12,6 +12,7 @@ from six import iteritems
 from builtins import hex
 from builtins import object
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.mpmutils import poll_with_timeout
 
 class NIJESDCore(object):
     """
@@ -76,8 +77,8 @@ class NIJESDCore(object):
             setattr(self, key, kwargs.get(key, default_value))
             assert type(getattr(self, key)) == type(default_value), \
                 "Invalid type for attribute {}".format(key)
-            self.log.trace("Initialized attribute {0} = {1}."
-                           .format(key, getattr(self, key)))
+            self.log.trace("Initialized attribute %s = %s.",
+                           key, getattr(self, key))
         
 
     def check_core(self):
@@ -102,10 +103,13 @@ class NIJESDCore(object):
                            "(0x{:08X}) is too new for this MPM version (0x{:08X})."
                            .format(fpga_current_revision, self.CURRENT_VERSION))
             raise RuntimeError('The loaded FPGA version is too new for MPM. Please update MPM!')
-        self.log.trace("JESD Core current revision: 0x{:08X}".format(fpga_current_revision))
-        self.log.trace("JESD Core oldest compatible revision: 0x{:08X}".format(fpga_old_compat_revision))
-        self.log.trace("DB Slot #: {}".format( (self.regs.peek32(self.DB_ID) & 0x10000) >> 16  ))
-        self.log.trace("DB PID: {:X}" .format(  self.regs.peek32(self.DB_ID) & 0xFFFF ))
+        self.log.trace("JESD Core current revision: 0x%08X",
+                       fpga_current_revision)
+        self.log.trace("JESD Core oldest compatible revision: 0x%08X",
+                       fpga_old_compat_revision)
+        self.log.trace("DB Slot #: %s",
+                       (self.regs.peek32(self.DB_ID) & 0x10000) >> 16)
+        self.log.trace("DB PID: %X", self.regs.peek32(self.DB_ID) & 0xFFFF)
         return True
 
     def reset(self):
@@ -161,7 +165,7 @@ class NIJESDCore(object):
     def get_framer_status(self):
         " Return True if framer is in good status "
         rb = self.regs.peek32(self.MGT_TRANSMITTER_CONTROL)
-        self.log.trace("FPGA Framer status: {0}".format(hex(rb & 0xFF0)))
+        self.log.trace("FPGA Framer status: %s", hex(rb & 0xFF0))
         if rb & (0b1 << 8) == 0b1 << 8:
             self.log.warning("Framer warning: Framer is Idle!")
         elif rb & (0b1 << 6) == 0b0 << 6:
@@ -173,7 +177,7 @@ class NIJESDCore(object):
     def get_deframer_status(self, ignore_sysref=False):
         " Return True if deframer is in good status "
         rb = self.regs.peek32(self.MGT_RECEIVER_CONTROL) & 0xFFFFFFFF
-        self.log.trace("FPGA Deframer Status Readback: {0}".format(hex(rb)))
+        self.log.trace("FPGA Deframer Status Readback: %s", hex(rb))
         cgs_pass     =  (rb & (0b1 <<  2)) > 0
         ila_pass     =  (rb & (0b1 <<  3)) > 0
         sys_ref_pass = ((rb & (0b1 <<  5)) > 0) | ignore_sysref
@@ -232,7 +236,7 @@ class NIJESDCore(object):
                   ((self.rx_sysref_delay) << 16) | \
                   ((self.tx_sysref_delay) << 8) | \
                   (disable_bit << 6)
-        self.log.trace("Setting SYSREF Capture reg: 0x{:08X}".format(reg_val))
+        self.log.trace("Setting SYSREF Capture reg: 0x%08X", reg_val)
         self.regs.poke32(self.SYSREF_CAPTURE_CONTROL, reg_val)
 
     def send_sysref_pulse(self):
@@ -251,13 +255,15 @@ class NIJESDCore(object):
         self.regs.poke32(mgt_reg, 0x10)
         if not reset_only:
             self.regs.poke32(mgt_reg, 0x20)
-            rb = -1
-            for _ in range(20):
-                rb = self.regs.peek32(mgt_reg)
-                if rb & 0xFFFF0000 == 0x000F0000:
-                    self.log.trace("%s MGT Reset Cleared!" % tx_or_rx.upper())
-                    return True
-                time.sleep(0.001)
+            if poll_with_timeout(
+                    lambda: self.regs.peek32(mgt_reg) & 0xFFFF0000 == 0x000F0000,
+                    20,
+                    1,
+                    name="GT {} reset".format(tx_or_rx.upper()),
+                ):
+                self.log.trace("%s MGT Reset Cleared!" % tx_or_rx.upper())
+                return True
+            rb = self.regs.peek32(mgt_reg)
             raise RuntimeError('Timeout in GT {trx} Reset (Readback: 0x{rb:X})'.format(
                 trx=tx_or_rx.upper(),
                 rb=(rb & 0xFFFF0000),
@@ -268,7 +274,7 @@ class NIJESDCore(object):
         " Power down unused CPLLs and QPLLs "
         assert qplls in range(4+1) # valid is 0 - 4
         assert cplls in range(8+1) # valid is 0 - 8
-        self.log.trace("Powering up {} CPLLs and {} QPLLs".format(cplls, qplls))
+        self.log.trace("Powering up %s CPLLs and %s QPLLs", cplls, qplls)
         reg_val = 0xFFFF000F
         reg_val_on = 0x0
         # Power down state is when the corresponding bit is set. For the PLLs we wish to
@@ -312,8 +318,18 @@ class NIJESDCore(object):
                 self.regs.poke32(self.MGT_QPLL_CONTROL, reg_val)
                 self.log.trace("Clearing QPLL reset...")
 
-                # Check for lock a short time later.
-                time.sleep(0.010)
+                # Check for lock a short time later. We don't need to wait the
+                # full time if all of them report lock earlier.
+                locked_mask = 0x0
+                for nibble in range(qplls):
+                    locked_mask = locked_mask | 0x2 << nibble*4
+                poll_with_timeout(
+                    lambda: self.regs.peek32(self.MGT_QPLL_CONTROL) & locked_mask \
+                        == locked_mask,
+                    10,
+                    1,
+                    name="GT QPLL lock",
+                )
                 # Clear all QPLL sticky bits
                 self.regs.poke32(self.MGT_QPLL_CONTROL, 0b1 << 16)
                 # Check for lock on active quads only.
@@ -334,8 +350,8 @@ class NIJESDCore(object):
         # asserted when using Eye Scan; otherwise, the Eye Scan circuitry in the PMA
         # will be powered down.
         PMA_RSV2_DRP_ADDR = 0x082
-        self.log.debug("{} the eye scan circuitry in the PMA for the GTXs..."
-                       .format({True: "Enabling", False: "Disabling"}[enable]))
+        self.log.debug("%s the eye scan circuitry in the PMA for the GTXs...",
+                       {True: "Enabling", False: "Disabling"}[enable])
         for gt_num in range(0, self.rx_lanes):
             self.set_drp_target('mgt', gt_num)
             drp_x082_rb = self.drp_access(rd=True, addr=PMA_RSV2_DRP_ADDR)
@@ -353,9 +369,9 @@ class NIJESDCore(object):
                      'PRBS-31': 0b100, 'PCIE'   : 0b101,
                      'SQR-2UI': 0b110, 'SQR-xUI': 0b111}
         assert mode in TXPRBSSEL
-        self.log.debug("Setting TX pattern mode for all GTs: {}".format(mode))
-        self.log.trace("Writing MGT Test Register (offset 0x{:04X}) with 0x{:08X}"
-                       .format(self.JESD_MGT_TEST_CONTROL, TXPRBSSEL[mode]))
+        self.log.debug("Setting TX pattern mode for all GTs: %s", mode)
+        self.log.trace("Writing MGT Test Register (offset 0x%04X) with 0x%08X",
+                       self.JESD_MGT_TEST_CONTROL, TXPRBSSEL[mode])
         self.regs.poke32(self.JESD_MGT_TEST_CONTROL, TXPRBSSEL[mode])
 
 
@@ -368,8 +384,8 @@ class NIJESDCore(object):
         for key, new_value in iteritems(kwargs):
             assert key in self.JESDCORE_DEFAULTS, "{} is not a valid attribute".format(key)
             if getattr(self, key) != new_value:
-                self.log.trace("Changing TX PHY attribute {0} from {1} to {2}..."
-                               .format(key, getattr(self, key), new_value))
+                self.log.trace("Changing TX PHY attribute %s from %s to %s...",
+                               key, getattr(self, key), new_value)
                 setattr(self, key, new_value)
                 tx_settings_changed = True
         # MGT TX PHY control.
@@ -399,8 +415,8 @@ class NIJESDCore(object):
         drp_ch_sel = {'mgt': dev_num, 'qpll': dev_num + MAX_MGTS}[mgt_or_qpll.lower()]
         assert drp_ch_sel in range(MAX_MGTS + MAX_QPLLs)
         reg_val = (0b1 << drp_ch_sel) | (DRP_ENABLE_VAL << 16)
-        self.log.trace("Writing DRP Control Register (offset 0x{:04X}) with 0x{:08X}"
-                       .format(self.JESD_MGT_DRP_CONTROL, reg_val))
+        self.log.trace("Writing DRP Control Register (offset 0x%04X) with 0x%08X",
+                       self.JESD_MGT_DRP_CONTROL, reg_val)
         self.regs.poke32(self.JESD_MGT_DRP_CONTROL, reg_val)
 
     def disable_drp_target(self):
@@ -426,11 +442,11 @@ class NIJESDCore(object):
         core_offset = 0x2800 + (addr << 2)
         if rd:
             rd_data = self.regs.peek32(core_offset)
-            self.log.trace("Reading DRP register 0x{:04X} at DB Core offset 0x{:04X}... "
-                           "0x{:04X}"
-                           .format(addr, core_offset, rd_data))
+            self.log.trace("Reading DRP register 0x%04X at DB Core offset "
+                           "0x%04X... 0x%04X", addr, core_offset, rd_data)
         else:
-            self.log.trace("Writing DRP register 0x{:04X} with 0x{:04X}...".format(addr, wr_data))
+            self.log.trace("Writing DRP register 0x%04X with 0x%04X...",
+                           addr, wr_data)
             self.regs.poke32(core_offset, wr_data)
             if self.regs.peek32(core_offset) != wr_data:
                 self.log.error("DRP read after write failed to match!")
@@ -376,7 +376,8 @@ class ClockSynchronizer(object):
         if not poll_with_timeout(
                 lambda: bool(self.peek32(self.TDC_STATUS) == 0x10),
                 1100, # Try for 1.1 seconds
-                100, # Poll every 100 ms
+                10, # Poll at least every 10 ms
+                name="TDC PPS capture",
             ):
             # Try one last time, just in case there is weirdness with the polling loop.
             if self.peek32(self.TDC_STATUS) != 0x10:
@@ -10,6 +10,7 @@ AD9695 driver for use with Rhodium
 import time
 from builtins import object
 from ..mpmlog import get_logger
+from ..mpmutils import poll_with_timeout
 
 class AD9695Rh(object):
     """
@@ -129,11 +130,12 @@ class AD9695Rh(object):
         """
         Initialize the ADC's framer, and check the PLL for lock.
         """
-        def _check_pll_lock():
+        def _check_pll_lock(log_unlocked=True):
             pll_lock_status = self.regs.peek8(0x056F)
             if (pll_lock_status & 0x88) != 0x80:
-                self.log.debug("PLL reporting unlocked... Status: 0x{:x}"
-                               .format(pll_lock_status))
+                if log_unlocked:
+                    self.log.debug("PLL reporting unlocked... Status: 0x{:x}"
+                                   .format(pll_lock_status))
                 return False
             return True
 
@@ -150,15 +152,16 @@ class AD9695Rh(object):
         ))
 
         self.log.trace("Polling for PLL lock...")
-        locked = False
-        for _ in range(6):
-            time.sleep(0.001)
-            # Clear stickies possibly?
-            if _check_pll_lock():
-                locked = True
-                self.log.info("ADC PLL Locked!")
-                break
-        if not locked:
+        locked = poll_with_timeout(
+            lambda: _check_pll_lock(log_unlocked=False),
+            6,
+            1,
+            name="ADC PLL lock",
+        )
+        if locked:
+            self.log.info("ADC PLL Locked!")
+        else:
+            _check_pll_lock()
             raise RuntimeError("ADC PLL did not lock! Check the logs for details.")
 
         self.log.trace("ADC framer initialized.")
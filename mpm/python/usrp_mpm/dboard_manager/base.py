@@ -91,6 +91,13 @@ class DboardManagerBase(object):
         """
         self.log.debug("deinit() called, but not implemented.")
 
+    def tear_down(self):
+        """
+        Release all resources held by this object (e.g., open files) before
+        it is destroyed. Does not have to be implemented.
+        """
+        self.log.trace("tear_down() called, but not implemented.")
+
     def get_serial(self):
         """
         Return this daughterboard's serial number as a string. Will return an
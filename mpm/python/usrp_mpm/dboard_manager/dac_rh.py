@@ -10,6 +10,8 @@ DAC37J82 driver for use with Rhodium
 import time
 from builtins import object
 from ..mpmlog import get_logger
+from ..chips.shadow_regs import ShadowRegs
+from ..mpmutils import poll_with_timeout
 
 class DAC37J82Rh(object):
     """
@@ -18,12 +20,15 @@ class DAC37J82Rh(object):
 
     DAC_VENDOR_ID = 0b01
     DAC_VERSION_ID = 0b010 # Version used in Rhodium Rev. A
+    # Registers which must not be served from the shadow copy: SIF reset,
+    # SYSREF capture triggers, alarm registers and the chip ID.
+    VOLATILE_REGS = (0x02, 0x24, 0x5C) + tuple(range(0x64, 0x6E)) + (0x7F,)
 
     def __init__(self, slot_idx, regs_iface, parent_log=None):
         self.log = parent_log.getChild("DAC37J82") if parent_log is not None \
             else get_logger("DAC37J82-{}".format(slot_idx))
         self.slot_idx = slot_idx
-        self.regs = regs_iface
+        self.regs = ShadowRegs(regs_iface, self.VOLATILE_REGS)
         assert hasattr(self.regs, 'peek16')
         assert hasattr(self.regs, 'poke16')
 
@@ -85,19 +90,27 @@ class DAC37J82Rh(object):
         """
         self.regs.poke16(0x02, 0x2002) # Deassert the reset for the SIF registers
         self.regs.poke16(0x02, 0x2003) # Assert the reset for the SIF registers
+        # All registers are back to their defaults now
+        self.regs.invalidate()
 
     def config(self):
         """
         Check the clock status, and write configuration values!
         """
-        def _check_pll_lock():
+        def _check_pll_lock(log_unlocked=True):
             pll_ool_alarms = self.regs.peek16(0x6C)
             if (pll_ool_alarms & 0x0008) != 0x0000:
-                self.log.warning("PLL reporting unlocked... Status: 0x{:x}"
-                                 .format(pll_ool_alarms))
+                if log_unlocked:
+                    self.log.warning("PLL reporting unlocked... Status: 0x{:x}"
+                                     .format(pll_ool_alarms))
                 return False
             return True
 
+        def _clear_alarms_and_check_pll_lock():
+            # Clear stickies possibly?
+            self.regs.poke16(0x6C, 0x0000) # Clear alarm bits for PLLs
+            return _check_pll_lock(log_unlocked=False)
+
         self.log.trace("Reset DAC & Clear alarm bits")
         self.reset()
         self.regs.poke16(0x6C, 0x0000) # Clear alarm bits for PLLs
@@ -210,16 +223,12 @@ class DAC37J82Rh(object):
         self.log.trace("DAC register dump finished.")
 
         self.log.trace("Polling for PLL lock...")
-        locked = False
-        for _ in range(6):
-            time.sleep(0.001)
-            # Clear stickies possibly?
-            self.regs.poke16(0x6C, 0x0000) # Clear alarm bits for PLLs
-            if _check_pll_lock():
-                locked = True
-                self.log.info("DAC PLL Locked!")
-                break
-        if not locked:
+        locked = poll_with_timeout(
+            _clear_alarms_and_check_pll_lock, 6, 1, name="DAC PLL lock")
+        if locked:
+            self.log.info("DAC PLL Locked!")
+        else:
+            _check_pll_lock()
             raise RuntimeError("DAC PLL did not lock! Check the logs for details.")
 
 
@@ -8,6 +8,8 @@ Gain table control for Rhodium
 """
 
 from __future__ import print_function
+from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.chips.shadow_regs import ShadowRegs
 from usrp_mpm.dboard_manager.gaintables_rh import RX_LOWBAND_GAIN_TABLE
 from usrp_mpm.dboard_manager.gaintables_rh import RX_HIGHBAND_GAIN_TABLE
 from usrp_mpm.dboard_manager.gaintables_rh import TX_LOWBAND_GAIN_TABLE
@@ -55,8 +57,15 @@ class GainTableRh():
         self.gain_tbl_regs = gain_tbl_regs
         assert hasattr(self.cpld_regs, 'poke16')
         assert hasattr(self.gain_tbl_regs, 'poke16')
+        # Which table gets written depends on GAIN_TBL_SEL, so we keep one
+        # shadow copy per band. That way, reloading the same tables (e.g.,
+        # when the daughterboard gets re-initialized) costs no SPI writes.
+        self._band_regs = {
+            GAIN_TBL_SEL_HIGH_BAND: ShadowRegs(self.gain_tbl_regs),
+            GAIN_TBL_SEL_LOW_BAND: ShadowRegs(self.gain_tbl_regs),
+        }
 
-    def _load_default_table(self, table, gain_table):
+    def _load_default_table(self, table, gain_table, band):
         def _create_spi_loader_message(table, index, dsa1, dsa2):
             addr = 0
             data = 0
@@ -77,7 +86,7 @@ class GainTableRh():
                 i,
                 gain_table[i][0],
                 gain_table[i][1])
-            self.gain_tbl_regs.poke16(addr, data)
+            self._band_regs[band].poke16(addr, data)
 
     def init(self):
         """
@@ -85,9 +94,13 @@ class GainTableRh():
         """
         self.log.trace("Loading gain tables to CPLD")
         self.cpld_regs.poke16(GAIN_TBL_SEL_ADDR, GAIN_TBL_SEL_DATA_BOTH_HIGH)
-        self._load_default_table("rx", RX_HIGHBAND_GAIN_TABLE)
-        self._load_default_table("tx", TX_HIGHBAND_GAIN_TABLE)
+        self._load_default_table(
+            "rx", RX_HIGHBAND_GAIN_TABLE, GAIN_TBL_SEL_HIGH_BAND)
+        self._load_default_table(
+            "tx", TX_HIGHBAND_GAIN_TABLE, GAIN_TBL_SEL_HIGH_BAND)
         self.cpld_regs.poke16(GAIN_TBL_SEL_ADDR, GAIN_TBL_SEL_DATA_BOTH_LOW)
-        self._load_default_table("rx", RX_LOWBAND_GAIN_TABLE)
-        self._load_default_table("tx", TX_LOWBAND_GAIN_TABLE)
+        self._load_default_table(
+            "rx", RX_LOWBAND_GAIN_TABLE, GAIN_TBL_SEL_LOW_BAND)
+        self._load_default_table(
+            "tx", TX_LOWBAND_GAIN_TABLE, GAIN_TBL_SEL_LOW_BAND)
         self.log.trace("Gain tables loaded")
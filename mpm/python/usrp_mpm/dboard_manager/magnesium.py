@@ -203,6 +203,15 @@ class Magnesium(BfrfsEEPROM, DboardManagerBase):
         self._port_expander.reset("PWR-EN-5.5V")
         self._port_expander.reset("LED")
 
+    def tear_down(self):
+        """
+        Release the port expander GPIOs
+        """
+        self.log.trace("Tearing down Magnesium DB object!")
+        if self._port_expander is not None:
+            self._port_expander.close()
+            self._port_expander = None
+
     def _get_i2c_dev(self, slot_idx):
         " Return the I2C path for this daughterboard "
         import pyudev
@@ -503,10 +512,11 @@ class Magnesium(BfrfsEEPROM, DboardManagerBase):
             label="dboard-regs-{}".format(self.slot_idx),
             read_only=False
         ) as dboard_ctrl_regs:
-            for i in range(0x2000, 0x2110, 0x10):
-                print(("0x%04X " % i), end=' ')
-                for j in range(0, 0x10, 0x4):
-                    print(("%08X" % dboard_ctrl_regs.peek32(i + j)), end=' ')
+            jesd_regs = dboard_ctrl_regs.peek32_block(0x2000, (0x2110 - 0x2000) // 4)
+            for i in range(0, len(jesd_regs), 4):
+                print(("0x%04X " % (0x2000 + i * 4)), end=' ')
+                for reg_val in jesd_regs[i:i + 4]:
+                    print(("%08X" % reg_val), end=' ')
                 print("")
 
     def dbcore_peek(self, addr):
@@ -19,6 +19,7 @@ from usrp_mpm.dboard_manager.mg_periphs import DboardClockControl
 from usrp_mpm.cores import ClockSynchronizer
 from usrp_mpm.cores import nijesdcore
 from usrp_mpm.mpmutils import async_exec
+from usrp_mpm import profiler
 
 INIT_CALIBRATION_TABLE = {"TX_BB_FILTER"              :   0x0001,
                           "ADC_TUNER"                 :   0x0002,
@@ -538,27 +539,31 @@ class MagnesiumInitManager(object):
             db_clk_control.reset_mmcm()
             jesdcore.reset()
             self.log.trace("Initializing LMK...")
-            self.mg_class.lmk = self._init_lmk(
-                self._spi_ifaces['lmk'],
-                ref_clock_freq,
-                master_clock_rate,
-                self._spi_ifaces['phase_dac'],
-                self.INIT_PHASE_DAC_WORD,
-                self.PHASE_DAC_SPI_ADDR,
-            )
-            db_clk_control.enable_mmcm()
+            with profiler.span("init LMK"):
+                self.mg_class.lmk = self._init_lmk(
+                    self._spi_ifaces['lmk'],
+                    ref_clock_freq,
+                    master_clock_rate,
+                    self._spi_ifaces['phase_dac'],
+                    self.INIT_PHASE_DAC_WORD,
+                    self.PHASE_DAC_SPI_ADDR,
+                )
+            with profiler.span("enable MMCM"):
+                db_clk_control.enable_mmcm()
             # Synchronize DB Clocks
-            self._sync_db_clock(
-                dboard_ctrl_regs,
-                master_clock_rate,
-                ref_clock_freq,
-                args)
+            with profiler.span("sync dboard clocks"):
+                self._sync_db_clock(
+                    dboard_ctrl_regs,
+                    master_clock_rate,
+                    ref_clock_freq,
+                    args)
             self.log.debug(
                 "Sample Clocks and Phase DAC Configured Successfully!")
             # Clocks and PPS are now fully active!
             if args.get('skip_rfic', None) is None:
                 async_exec(self.mykonos, "set_master_clock_rate", master_clock_rate)
-                self.init_jesd(jesdcore, master_clock_rate, args)
+                with profiler.span("init JESD"):
+                    self.init_jesd(jesdcore, master_clock_rate, args)
             jesdcore = None # Help with garbage collection
             # That's all that requires access to the dboard regs!
         return True
@@ -31,6 +31,12 @@ class TCA6408(object):
             raise RuntimeError("Need to specify i2c device to use the TCA6408")
         self._gpios = SysFSGPIO({'device/name': 'tca6408'}, 0xBF, 0xAA, 0xAA, i2c_dev)
 
+    def close(self):
+        """
+        Release the underlying GPIO files
+        """
+        self._gpios.close()
+
     def set(self, name, value=None):
         """
         Assert a pin by name
@@ -15,7 +15,7 @@ from usrp_mpm.dboard_manager.rh_periphs import DboardClockControl
 from usrp_mpm.cores import ClockSynchronizer
 from usrp_mpm.cores import nijesdcore
 from usrp_mpm.cores.eyescan import EyeScanTool
-from usrp_mpm.dboard_manager.gain_rh import GainTableRh
+from usrp_mpm import profiler
 
 
 class RhodiumInitManager(object):
@@ -297,12 +297,6 @@ class RhodiumInitManager(object):
 
         # 1. Prerequisites
         # Open FPGA IP (Clock control and JESD core).
-        self.log.trace("Creating gain table object...")
-        self.gain_table_loader = GainTableRh(
-            self._spi_ifaces['cpld'],
-            self._spi_ifaces['cpld_gain_loader'],
-            self.log)
-
         with open_uio(
             label="dboard-regs-{}".format(self.rh_class.slot_idx),
             read_only=False
@@ -322,35 +316,41 @@ class RhodiumInitManager(object):
             jesdcore.reset()
             # Configure and bringup the LMK's clocks.
             self.log.trace("Initializing LMK...")
-            self.rh_class.lmk = self._init_lmk(
-                self._spi_ifaces['lmk'],
-                self.rh_class.ref_clock_freq,
-                self.rh_class.sampling_clock_rate,
-                self._spi_ifaces['phase_dac'],
-                self.INIT_PHASE_DAC_WORD,
-                self.PHASE_DAC_SPI_ADDR
-            )
+            with profiler.span("init LMK"):
+                self.rh_class.lmk = self._init_lmk(
+                    self._spi_ifaces['lmk'],
+                    self.rh_class.ref_clock_freq,
+                    self.rh_class.sampling_clock_rate,
+                    self._spi_ifaces['phase_dac'],
+                    self.INIT_PHASE_DAC_WORD,
+                    self.PHASE_DAC_SPI_ADDR
+                )
             self.log.trace("LMK Initialized!")
             # Deassert FPGA's MMCM reset, poll for lock, and enable outputs.
-            db_clk_control.enable_mmcm()
+            with profiler.span("enable MMCM"):
+                db_clk_control.enable_mmcm()
 
             # 3. Synchronize DB Clocks.
             # The clock synchronzation driver receives the master_clock_rate, which for
             # Rhodium is half the sampling_clock_rate.
-            self._sync_db_clock(
-                radio_regs,
-                self.rh_class.ref_clock_freq,
-                self.rh_class.sampling_clock_rate / 2,
-                args)
+            with profiler.span("sync dboard clocks"):
+                self._sync_db_clock(
+                    radio_regs,
+                    self.rh_class.ref_clock_freq,
+                    self.rh_class.sampling_clock_rate / 2,
+                    args)
 
             # 4. DAC Configuration.
-            self.dac.config()
+            with profiler.span("configure DAC"):
+                self.dac.config()
 
             # 5. ADC Configuration.
-            self.adc.config()
+            with profiler.span("configure ADC"):
+                self.adc.config()
 
             # 6-7. JESD204B Initialization.
-            self.init_jesd(jesdcore, self.rh_class.sampling_clock_rate)
+            with profiler.span("init JESD"):
+                self.init_jesd(jesdcore, self.rh_class.sampling_clock_rate)
             # [Optional] Perform RX eyescan.
             if perform_rx_eyescan:
                 self.log.info("Performing RX eye scan on ADC to FPGA link...")
@@ -364,7 +364,8 @@ class RhodiumInitManager(object):
             db_clk_control = None
 
         # 8. CPLD Gain Tables Initialization.
-        self.gain_table_loader.init()
+        with profiler.span("load gain tables"):
+            self.rh_class.gain_table_loader.init()
 
         return True
 
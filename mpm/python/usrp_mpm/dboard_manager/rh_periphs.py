@@ -29,6 +29,12 @@ class TCA6408(object):
         assert i2c_dev is not None
         self._gpios = SysFSGPIO({'device/name': 'tca6408'}, 0x3F, 0x00, 0x00, i2c_dev)
 
+    def close(self):
+        """
+        Release the underlying GPIO files
+        """
+        self._gpios.close()
+
     def set(self, name, value=None):
         """
         Assert a pin by name
@@ -115,6 +121,12 @@ class FPGAtoLoDist(object):
         self._gpios.set(self.pins.index('P6_5V_LDO_EN'), 1)
         self._gpios.set(self.pins.index('P3_3V_RF_EN'), 1)
 
+    def close(self):
+        """
+        Release the underlying GPIO files
+        """
+        self._gpios.close()
+
     def set(self, name, value=None):
         """
         Assert a pin by name
@@ -18,6 +18,7 @@ from usrp_mpm.dboard_manager.rh_periphs import DboardClockControl
 from usrp_mpm.cores import nijesdcore
 from usrp_mpm.dboard_manager.adc_rh import AD9695Rh
 from usrp_mpm.dboard_manager.dac_rh import DAC37J82Rh
+from usrp_mpm.dboard_manager.gain_rh import GainTableRh
 from usrp_mpm.mpmlog import get_logger
 from usrp_mpm.sys_utils.uio import open_uio
 from usrp_mpm.user_eeprom import BfrfsEEPROM
@@ -207,8 +208,10 @@ class Rhodium(BfrfsEEPROM, DboardManagerBase):
         # Predeclare some attributes to make linter happy:
         self.lmk = None
         self._port_expander = None
+        self._daughterboard_gpio = None
         self._lo_dist = None
         self.cpld = None
+        self.gain_table_loader = None
         # If _init_args is None, it means that init() hasn't yet been called.
         self._init_args = None
         # Now initialize all peripherals. If that doesn't work, put this class
@@ -257,6 +260,13 @@ class Rhodium(BfrfsEEPROM, DboardManagerBase):
         self.log.debug("Loaded SPI interfaces!")
         self.cpld = RhCPLD(self._spi_ifaces['cpld'], self.log)
         self.log.debug("Loaded CPLD interfaces!")
+        # The gain table loader is kept across re-inits, so unchanged gain
+        # tables don't get reloaded.
+        self.log.trace("Creating gain table object...")
+        self.gain_table_loader = GainTableRh(
+            self._spi_ifaces['cpld'],
+            self._spi_ifaces['cpld_gain_loader'],
+            self.log)
         # Create DAC interface (analog output is disabled).
         self.log.trace("Creating DAC control object...")
         self.dac = DAC37J82Rh(self.slot_idx, self._spi_ifaces['dac'], self.log)
@@ -278,6 +288,20 @@ class Rhodium(BfrfsEEPROM, DboardManagerBase):
         self._daughterboard_gpio.set(FPGAtoDbGPIO.DB_POWER_ENABLE, 0)
         self._daughterboard_gpio.set(FPGAtoDbGPIO.RF_POWER_ENABLE, 0)
 
+    def tear_down(self):
+        """
+        Release the port expander and daughterboard GPIOs
+        """
+        self.log.trace("Tearing down Rhodium DB object!")
+        for gpios in (self._port_expander,
+                      self._daughterboard_gpio,
+                      self._lo_dist):
+            if gpios is not None:
+                gpios.close()
+        self._port_expander = None
+        self._daughterboard_gpio = None
+        self._lo_dist = None
+
     def init(self, args):
         """
         Execute necessary init dance to bring up dboard
@@ -568,8 +592,9 @@ class Rhodium(BfrfsEEPROM, DboardManagerBase):
             label="dboard-regs-{}".format(self.slot_idx),
             read_only=False
         ) as radio_regs:
-            for i in range(0x2000, 0x2110, 0x10):
-                print(("0x%04X " % i), end=' ')
-                for j in range(0, 0x10, 0x4):
-                    print(("%08X" % radio_regs.peek32(i + j)), end=' ')
+            jesd_regs = radio_regs.peek32_block(0x2000, (0x2110 - 0x2000) // 4)
+            for i in range(0, len(jesd_regs), 4):
+                print(("0x%04X " % (0x2000 + i * 4)), end=' ')
+                for reg_val in jesd_regs[i:i + 4]:
+                    print(("%08X" % reg_val), end=' ')
                 print("")
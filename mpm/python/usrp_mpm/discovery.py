@@ -9,11 +9,16 @@ Code to run the discovery port
 
 from __future__ import print_function
 from multiprocessing import Process
+import collections
+import ipaddress
+import selectors
 import socket
+import time
 from builtins import bytes
 from usrp_mpm.mpmtypes import MPM_DISCOVERY_PORT
 from usrp_mpm.mpmlog import get_main_logger
 from usrp_mpm.mpmutils import to_binary_str
+from usrp_mpm.sys_utils import net
 
 RESPONSE_PREAMBLE = b"USRP-MPM"
 RESPONSE_SEP = b";"
@@ -24,6 +29,21 @@ MAX_MTU = 8000
 # For setsockopt
 IP_MTU_DISCOVER = 10
 IP_PMTUDISC_DO = 2
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+# Rate limiting: Every source address may receive up to RATE_LIMIT_BURST
+# discovery responses in a row, which are then refilled at RATE_LIMIT_RATE
+# responses per second.
+RATE_LIMIT_RATE = 10.0
+RATE_LIMIT_BURST = 20
+# Interval at which the list of network interfaces is checked for changes
+# (seconds)
+IFACE_REFRESH_INTERVAL = 5.0
+# Max number of datagrams read from a single socket in one go, so one busy
+# interface can't starve the others
+MAX_READS_PER_SOCKET = 32
+# Max number of pending MPM-ECHO responses. If more echo requests come in,
+# the oldest ones get dropped. Discovery responses are always sent first.
+MAX_PENDING_ECHOS = 64
 
 def spawn_discovery_process(shared_state, discovery_addr):
     """
@@ -44,58 +64,301 @@ def spawn_discovery_process(shared_state, discovery_addr):
     return proc
 
 
-def _discovery_process(state, discovery_addr):
+class DiscoveryResponder(object):
     """
-    The actual process for device discovery. Is spawned by
-    spawn_discovery_process().
+    Non-blocking responder for MPM-DISC and MPM-ECHO requests.
+
+    If discovery_addr is given, listens on one socket per network interface
+    which has an address on the same subnet (or on a single wildcard socket,
+    if binding to individual interfaces is not possible). Otherwise, listens
+    on a single wildcard socket and answers everyone, including routed
+    senders and requests on interfaces without an IPv4 address. A selector
+    serves all sockets from a single process. Responses are queued
+    and sent when the socket is writable, discovery responses have priority
+    over echo responses.
+
+    Arguments:
+    state -- Shared state of device (is it claimed, etc.). Is a SharedState()
+             object.
+    discovery_addr -- Only respond to requests from the subnet(s) this address
+                      is part of (e.g. '192.168.10.255'). Use '0.0.0.0' to
+                      respond to all requests.
+    log -- Logger object
     """
-    log = get_main_logger().getChild('discovery')
-    def create_response_string(state):
-        " Generate the string that gets sent back to the requester. "
-        return RESPONSE_SEP.join(
-            [RESPONSE_PREAMBLE] + \
-            [b"type="+state.dev_type.value] + \
-            [b"product="+state.dev_product.value] + \
-            [b"serial="+state.dev_serial.value] + \
-            [RESPONSE_CLAIMED_KEY+to_binary_str("={}".format(state.claim_status.value))]
+    def __init__(self, state, discovery_addr, log):
+        self.log = log
+        self._state = state
+        self._discovery_addr = None \
+            if discovery_addr in ('0.0.0.0', '', None) \
+            else ipaddress.IPv4Address(discovery_addr)
+        self._selector = selectors.DefaultSelector()
+        # Map ifname -> socket. The key None is used for a wildcard socket.
+        self._socks = {}
+        # Map ifname -> list of ipaddress.IPv4Network. Senders must be on one
+        # of these networks (None means: accept everyone).
+        self._iface_networks = {}
+        self._send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._send_sock.setsockopt(
+            socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        self._send_sock.setblocking(False)
+        self._send_registered = False
+        self._disc_queue = collections.deque()
+        self._echo_queue = collections.deque(maxlen=MAX_PENDING_ECHOS)
+        self._rate_buckets = {}
+        self._response_key = None
+        self._response = b''
+        self._next_refresh = 0.0
+
+    ###########################################################################
+    # Responses
+    ###########################################################################
+    def get_response(self):
+        """
+        Return the bytes that get sent back to the requester. The response is
+        only regenerated if the shared state has changed since the last call.
+        """
+        response_key = (
+            self._state.dev_type.value,
+            self._state.dev_product.value,
+            self._state.dev_serial.value,
+            self._state.claim_status.value,
         )
+        if response_key != self._response_key:
+            dev_type, dev_product, dev_serial, claim_status = response_key
+            self._response = RESPONSE_SEP.join(
+                [RESPONSE_PREAMBLE] + \
+                [b"type="+dev_type] + \
+                [b"product="+dev_product] + \
+                [b"serial="+dev_serial] + \
+                [RESPONSE_CLAIMED_KEY+to_binary_str("={}".format(claim_status))]
+            )
+            self._response_key = response_key
+            self.log.trace("Updated discovery response: %s", self._response)
+        return self._response
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    # FIXME really, we should only bind to the subnet but I haven't gotten that
-    # working yet
-    sock.bind((("0.0.0.0", MPM_DISCOVERY_PORT)))
-    send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    send_sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    def allow_response(self, sender_addr, now):
+        """
+        Token bucket rate limiter. Returns True if sender_addr may receive
+        another discovery response.
+        """
+        tokens, last_update = \
+            self._rate_buckets.get(sender_addr, (RATE_LIMIT_BURST, now))
+        tokens = min(RATE_LIMIT_BURST,
+                     tokens + (now - last_update) * RATE_LIMIT_RATE)
+        allow = tokens >= 1.0
+        if allow:
+            tokens -= 1.0
+        self._rate_buckets[sender_addr] = (tokens, now)
+        return allow
 
-    # TODO yeah I know that's not how you do this
-    discovery_addr_prefix = discovery_addr.replace('.255', '')
-    if discovery_addr == '0.0.0.0':
-        discovery_addr_prefix = ''
+    def _prune_rate_buckets(self, now):
+        " Remove rate limiter entries of sources which are fully refilled "
+        refill_time = RATE_LIMIT_BURST / RATE_LIMIT_RATE
+        self._rate_buckets = {
+            addr: (tokens, last_update)
+            for addr, (tokens, last_update) in self._rate_buckets.items()
+            if now - last_update < refill_time
+        }
 
-    try:
-        while True:
-            data, sender = sock.recvfrom(MAX_MTU)
-            log.debug("Got poked by: %s", sender[0])
-            # TODO this is still part of the awful subnet identification
-            if not sender[0].startswith(discovery_addr_prefix):
-                continue
-            if data.strip(b"\0") == b"MPM-DISC":
-                log.debug("Sending discovery response to %s port: %d",
-                          sender[0], sender[1])
-                resp_str = create_response_string(state)
-                send_data = resp_str
-                log.trace("Return data: %s", send_data)
-                send_sock.sendto(send_data, sender)
-            elif data.strip(b"\0").startswith(b"MPM-ECHO"):
-                log.debug("Received echo request from {sender}"
-                          .format(sender=sender[0]))
-                send_data = data
+    ###########################################################################
+    # Interface handling
+    ###########################################################################
+    def _get_iface_filters(self):
+        """
+        Return a dictionary ifname -> list of allowed sender networks for
+        every interface we want to listen on, i.e. the interfaces on the
+        subnet of the discovery address. If interfaces can't be enumerated,
+        or if there is no discovery address (i.e. we answer everyone on every
+        interface), returns None.
+        """
+        if self._discovery_addr is None:
+            return None
+        try:
+            iface_networks = net.get_iface_ipv4_networks()
+        except Exception as ex:
+            self.log.warning("Unable to enumerate network interfaces: %s",
+                             str(ex))
+            return None
+        return {
+            ifname: [
+                iface.network for iface in ifaces
+                if self._discovery_addr in iface.network
+            ]
+            for ifname, ifaces in iface_networks.items()
+            if any(self._discovery_addr in iface.network for iface in ifaces)
+        }
+
+    def _open_sock(self, ifname):
+        """
+        Create a non-blocking socket listening on the discovery port. If
+        ifname is given, the socket is bound to that interface.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if ifname is not None:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE,
+                                to_binary_str(ifname))
+            sock.bind(("0.0.0.0", MPM_DISCOVERY_PORT))
+        except OSError:
+            sock.close()
+            raise
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ, ifname)
+        self._socks[ifname] = sock
+        return sock
+
+    def _close_sock(self, ifname):
+        " Close and unregister the socket for ifname "
+        sock = self._socks.pop(ifname)
+        self._selector.unregister(sock)
+        sock.close()
+
+    def refresh_ifaces(self):
+        """
+        Check the available network interfaces, and open or close sockets
+        accordingly.
+
+        Without a discovery address, a single wildcard socket answers
+        everyone. (Sockets bound to interfaces would also receive every
+        broadcast that the wildcard socket gets, so they are only used when
+        requests need to be filtered.) If binding to individual interfaces
+        fails, we fall back to a single wildcard socket, and filter requests
+        by the union of all allowed networks.
+        """
+        iface_filters = self._get_iface_filters()
+        if iface_filters is None:
+            # Answer everyone, or we can't tell which interfaces there are.
+            # Either way, make sure we're listening on the wildcard socket.
+            if None not in self._socks:
+                for ifname in list(self._socks.keys()):
+                    self._close_sock(ifname)
+                self._open_sock(None)
+            self._iface_networks = {None: None}
+            return
+        if None not in self._socks:
+            for ifname in [x for x in self._socks if x not in iface_filters]:
+                self.log.debug("Stop listening on interface %s", ifname)
+                self._close_sock(ifname)
+            try:
+                for ifname in [x for x in iface_filters if x not in self._socks]:
+                    self.log.debug("Listening for discovery requests on "
+                                   "interface %s", ifname)
+                    self._open_sock(ifname)
+                self._iface_networks = iface_filters
+                return
+            except OSError as ex:
+                self.log.debug("Unable to bind discovery socket to "
+                               "interface (%s), using wildcard socket.",
+                               str(ex))
+                for ifname in list(self._socks.keys()):
+                    self._close_sock(ifname)
+                self._open_sock(None)
+        self._iface_networks = {
+            None: [network
+                   for networks in iface_filters.values()
+                   for network in networks]
+        }
+
+    def _sender_allowed(self, ifname, sender_addr):
+        " Check if sender_addr is on a network we serve on ifname "
+        networks = self._iface_networks.get(ifname)
+        if networks is None:
+            return ifname in self._iface_networks
+        try:
+            sender_addr = ipaddress.IPv4Address(sender_addr)
+        except ValueError:
+            return False
+        return any(sender_addr in network for network in networks)
+
+    ###########################################################################
+    # Main loop
+    ###########################################################################
+    def _handle_request(self, ifname, data, sender, now):
+        " Queue the response for a single request "
+        if not self._sender_allowed(ifname, sender[0]):
+            return
+        request = data.strip(b"\0")
+        if request == b"MPM-DISC":
+            if not self.allow_response(sender[0], now):
+                self.log.trace("Rate limiting discovery response to %s",
+                               sender[0])
+                return
+            self.log.debug("Sending discovery response to %s port: %d",
+                           sender[0], sender[1])
+            self._disc_queue.append((self.get_response(), sender))
+        elif request.startswith(b"MPM-ECHO"):
+            self.log.debug("Received echo request from %s", sender[0])
+            self._echo_queue.append((data, sender))
+
+    def _read_sock(self, sock, ifname, now):
+        " Read all pending requests from a socket "
+        for _ in range(MAX_READS_PER_SOCKET):
+            try:
+                data, sender = sock.recvfrom(MAX_MTU)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.log.trace("Got poked by: %s", sender[0])
+            self._handle_request(ifname, data, sender, now)
+
+    def _flush_queues(self):
+        """
+        Send queued responses. Discovery responses go first. Returns True if
+        all responses could be sent.
+        """
+        for queue, desc in ((self._disc_queue, "discovery"),
+                            (self._echo_queue, "ECHO")):
+            while queue:
+                send_data, sender = queue[0]
                 try:
-                    send_sock.sendto(send_data, sender)
+                    self._send_sock.sendto(send_data, sender)
+                except (BlockingIOError, InterruptedError):
+                    return False
                 except OSError as ex:
-                    log.warning("ECHO send error: %s", str(ex))
+                    self.log.warning("%s send error: %s", desc, str(ex))
+                queue.popleft()
+        return True
+
+    def run(self):
+        " Serve requests until an error occurs "
+        while True:
+            now = time.monotonic()
+            if now >= self._next_refresh:
+                self.refresh_ifaces()
+                self._prune_rate_buckets(now)
+                self._next_refresh = now + IFACE_REFRESH_INTERVAL
+            timeout = max(0, self._next_refresh - now)
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._send_sock:
+                    continue
+                self._read_sock(key.fileobj, key.data, now)
+            all_sent = self._flush_queues()
+            if all_sent and self._send_registered:
+                self._selector.unregister(self._send_sock)
+                self._send_registered = False
+            elif not all_sent and not self._send_registered:
+                self._selector.register(
+                    self._send_sock, selectors.EVENT_WRITE)
+                self._send_registered = True
+
+    def close(self):
+        " Close all sockets "
+        for ifname in list(self._socks.keys()):
+            self._close_sock(ifname)
+        self._selector.close()
+        self._send_sock.close()
+
+
+def _discovery_process(state, discovery_addr):
+    """
+    The actual process for device discovery. Is spawned by
+    spawn_discovery_process().
+    """
+    log = get_main_logger().getChild('discovery')
+    responder = DiscoveryResponder(state, discovery_addr, log)
+    try:
+        responder.run()
     except Exception as err:
         log.error("Unexpected error: `%s' Type: `%s'", str(err), type(err))
-        sock.close()
-        send_sock.close()
+        responder.close()
         exit(1)
@@ -5,15 +5,120 @@
 #
 """
 EEPROM management code
+
+EEPROM reads are cached per process, keyed by nvmem path and offset. The
+cache is filled by read_eeprom() and get_raw_data(), and must be invalidated
+(see invalidate_cache()) whenever the EEPROM gets written.
 """
 
 import struct
+import threading
 import zlib
 from builtins import zip
 from builtins import object
 
 EEPROM_DEFAULT_HEADER = struct.Struct("!I I")
 
+_cache_lock = threading.Lock()
+# Map (nvmem_path, offset) -> _CacheEntry
+_cache = {}
+
+class _CacheEntry(object):
+    " Cached contents of one EEPROM region "
+    def __init__(self):
+        # Raw bytes of the header region
+        self.header_data = None
+        # Map (header formats, expected magic) -> parsed header
+        self.headers = {}
+        # Raw bytes of the entire region, and the max_size they were read with
+        self.data = None
+        self.max_size = None
+
+def _get_cache_entry(nvmem_path, offset):
+    " Return the cache entry for (nvmem_path, offset). Call with lock held. "
+    key = (nvmem_path, offset)
+    if key not in _cache:
+        _cache[key] = _CacheEntry()
+    return _cache[key]
+
+def _read_region(nvmem_path, offset, max_size):
+    " Read the EEPROM region starting at offset, up to max_size (or EOF) "
+    with open(nvmem_path, "rb") as nvmem_file:
+        nvmem_file.seek(offset)
+        if max_size is None:
+            return nvmem_file.read()
+        return nvmem_file.read(max(max_size - offset, 0))
+
+def get_raw_data(nvmem_path, offset=0, max_size=None):
+    """
+    Return the raw EEPROM contents at nvmem_path, starting at offset, as a
+    bytes object. The contents are only read from the device once; later
+    calls return the cached copy until invalidate_cache() is called.
+
+    nvmem_path -- Path to readable file (typically something in sysfs)
+    offset -- Start of the region within the file
+    max_size -- End of the region within the file (i.e., this includes the
+                offset). If omitted, the region ends at the end of the file.
+    """
+    with _cache_lock:
+        entry = _get_cache_entry(nvmem_path, offset)
+        if entry.data is None or entry.max_size != max_size:
+            entry.data = _read_region(nvmem_path, offset, max_size)
+            entry.max_size = max_size
+        return entry.data
+
+def invalidate_cache(nvmem_path=None):
+    """
+    Drop cached EEPROM contents of nvmem_path (all offsets), or of all
+    EEPROMs if nvmem_path is None. Call this after writing to an EEPROM.
+    """
+    global _cache
+    with _cache_lock:
+        if nvmem_path is None:
+            _cache = {}
+        else:
+            _cache = {
+                key: entry
+                for key, entry in _cache.items()
+                if key[0] != nvmem_path
+            }
+
+class EEPROMData(object):
+    """
+    Raw contents of an EEPROM region, as returned by read_eeprom().
+
+    Behaves like a (read-only) bytes object, but the full region is only read
+    from the device when the contents are accessed for the first time.
+    """
+    def __init__(self, nvmem_path, offset, max_size):
+        self._nvmem_path = nvmem_path
+        self._offset = offset
+        self._max_size = max_size
+
+    def __bytes__(self):
+        return get_raw_data(self._nvmem_path, self._offset, self._max_size)
+
+    def __len__(self):
+        return len(bytes(self))
+
+    def __getitem__(self, index):
+        return bytes(self)[index]
+
+    def __iter__(self):
+        return iter(bytes(self))
+
+    def __eq__(self, other):
+        return bytes(self) == bytes(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "EEPROMData({!r}, offset={})".format(
+            self._nvmem_path, self._offset)
+
 class MboardEEPROM(object):
     """
     Given a nvmem path, read out EEPROM values from the motherboard's EEPROM.
@@ -139,7 +244,12 @@ def read_eeprom(
     """
     Read the EEPROM located at nvmem_path and return a tuple (header, data)
     Header is already parsed in the common header fields
-    Data contains the full eeprom data structure
+    Data contains the full eeprom data structure (see EEPROMData; the full
+    structure is only read from the device when it is accessed)
+
+    Only the header region is read from the device, and the result is
+    cached. Subsequent calls for the same nvmem_path and offset don't access
+    the device until invalidate_cache() is called.
 
     nvmem_path -- Path to readable file (typically something in sysfs)
     eeprom_header_format -- List of header formats, by version
@@ -170,17 +280,35 @@ def read_eeprom(
                     read_crc, expected_crc))
         return dict(list(zip(eeprom_keys, parsed_data)))
     # Dawaj, dawaj
-    max_size = max_size or -1
-    with open(nvmem_path, "rb") as nvmem_file:
-        data = nvmem_file.read(max_size)[offset:]
-    eeprom_magic, eeprom_version = EEPROM_DEFAULT_HEADER.unpack_from(data)
-    if eeprom_magic != expected_magic:
-        raise RuntimeError(
-            "Received incorrect EEPROM magic. " \
-            "Read: {:08X} Expected: {:08X}".format(
-                eeprom_magic, expected_magic))
-    if eeprom_version >= len(eeprom_header_format):
-        raise RuntimeError("Unexpected EEPROM version: `{}'".format(eeprom_version))
-    return (_parse_eeprom_data(data, eeprom_version), data)
-
-
+    header_key = (tuple(eeprom_header_format), expected_magic)
+    with _cache_lock:
+        entry = _get_cache_entry(nvmem_path, offset)
+        if header_key not in entry.headers:
+            if entry.data is not None and entry.max_size == max_size:
+                data = entry.data
+            else:
+                if entry.header_data is None:
+                    # The header region ends with the largest header we
+                    # might have to parse
+                    header_end = offset + max(
+                        struct.calcsize(header_format)
+                        for header_format in eeprom_header_format
+                        if header_format is not None)
+                    if max_size is not None:
+                        header_end = min(header_end, max_size)
+                    entry.header_data = \
+                        _read_region(nvmem_path, offset, header_end)
+                data = entry.header_data
+            eeprom_magic, eeprom_version = \
+                EEPROM_DEFAULT_HEADER.unpack_from(data)
+            if eeprom_magic != expected_magic:
+                raise RuntimeError(
+                    "Received incorrect EEPROM magic. " \
+                    "Read: {:08X} Expected: {:08X}".format(
+                        eeprom_magic, expected_magic))
+            if eeprom_version >= len(eeprom_header_format):
+                raise RuntimeError("Unexpected EEPROM version: `{}'".format(eeprom_version))
+            entry.headers[header_key] = \
+                _parse_eeprom_data(data, eeprom_version)
+        header = dict(entry.headers[header_key])
+    return (header, EEPROMData(nvmem_path, offset, max_size))
@@ -12,11 +12,16 @@ from builtins import object
 import netaddr
 from usrp_mpm.mpmlog import get_logger
 from usrp_mpm.sys_utils.uio import UIO
+from usrp_mpm.chips.shadow_regs import ShadowRegs
 
 
 class EthDispatcherCtrl(object):
     """
     Controls an Ethernet dispatcher.
+
+    All dispatcher registers are configuration registers, so this class keeps
+    track of what was programmed, and skips writes which would not change
+    anything. Keep the object around to benefit from this.
     """
     DEFAULT_VITA_PORT = (49153, 49154)
     # Address offsets:
@@ -33,14 +38,14 @@ class EthDispatcherCtrl(object):
     def __init__(self, label):
         self.log = get_logger(label)
         self._regs = UIO(label=label, read_only=False)
-        self.poke32 = self._regs.poke32
+        self._shadow_regs = ShadowRegs(self._regs)
+        self.poke32 = self._shadow_regs.poke32
         self.peek32 = self._regs.peek32
 
     def set_bridge_mode(self, bridge_mode):
         " Enable/Disable Bridge Mode "
-        self.log.trace("Bridge Mode {}".format(
-            "Enabled" if bridge_mode else "Disabled"
-        ))
+        self.log.trace("Bridge Mode %s",
+                       "Enabled" if bridge_mode else "Disabled")
         self.poke32(self.BRIDGE_INTERNAL_ENABLE_OFFSET, int(bridge_mode))
 
     def set_bridge_mac_addr(self, mac_addr):
@@ -48,16 +53,17 @@ class EthDispatcherCtrl(object):
         Set the bridge MAC address for this Ethernet dispatcher.
         Outgoing packets will have this MAC address.
         """
-        self.log.debug("Setting bridge MAC address to `{}'".format(mac_addr))
+        self.log.debug("Setting bridge MAC address to `%s'", mac_addr)
         mac_addr_int = int(netaddr.EUI(mac_addr))
-        self.log.trace("Writing to address 0x{:04X}: 0x{:04X}".format(
-            self.BRIDGE_INTERNAL_MAC_LO_OFFSET, mac_addr_int & 0xFFFFFFFF
-        ))
-        self.poke32(self.BRIDGE_INTERNAL_MAC_LO_OFFSET, mac_addr_int & 0xFFFFFFFF)
-        self.log.trace("Writing to address 0x{:04X}: 0x{:04X}".format(
-            self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_int >> 32
-        ))
-        self.poke32(self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_int >> 32)
+        self.log.trace("Writing to address 0x%04X: 0x%04X",
+                       self.BRIDGE_INTERNAL_MAC_LO_OFFSET,
+                       mac_addr_int & 0xFFFFFFFF)
+        self.log.trace("Writing to address 0x%04X: 0x%04X",
+                       self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_int >> 32)
+        with self._shadow_regs.deferred():
+            self.poke32(self.BRIDGE_INTERNAL_MAC_LO_OFFSET,
+                        mac_addr_int & 0xFFFFFFFF)
+            self.poke32(self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_int >> 32)
 
     def set_ipv4_addr(self, ip_addr, bridge_en=False):
         """
@@ -68,7 +74,7 @@ class EthDispatcherCtrl(object):
             own_ip_offset = self.BRIDGE_INTERNAL_IP_OFFSET
         else:
             own_ip_offset = self.ETH_IP_OFFSET
-        self.log.debug("Setting my own IP address to `{}'".format(ip_addr))
+        self.log.debug("Setting my own IP address to `%s'", ip_addr)
         ip_addr_int = int(netaddr.IPAddress(ip_addr))
         with self._regs:
             self.poke32(own_ip_offset, ip_addr_int)
@@ -87,7 +93,7 @@ class EthDispatcherCtrl(object):
             port_reg_addr = self.ETH_PORT_OFFSET
         with self._regs:
             self.poke32(port_reg_addr, port_value)
-        self.log.debug("Setting RFNOC UDP port to `{}'".format(port_value))
+        self.log.debug("Setting RFNOC UDP port to `%s'", port_value)
 
     def set_forward_policy(self, forward_eth, forward_bcast):
         """
@@ -95,9 +101,8 @@ class EthDispatcherCtrl(object):
         Forward broadcast packet to CPU and CROSSOVER
         """
         reg_value = int(bool(forward_eth) << 1) | int(bool(forward_bcast))
-        self.log.trace("Writing to address 0x{:04X}: 0x{:04X}".format(
-            self.FORWARD_ETH_BCAST_OFFSET, reg_value
-        ))
+        self.log.trace("Writing to address 0x%04X: 0x%04X",
+                       self.FORWARD_ETH_BCAST_OFFSET, reg_value)
         with self._regs:
             self.poke32(self.FORWARD_ETH_BCAST_OFFSET, reg_value)
 
@@ -105,21 +110,20 @@ class EthDispatcherCtrl(object):
         """
         Set up the FPGA side of the internal interface
         """
-        with self._regs:
-            self.log.debug("Setting internal MAC address to `{}'".format(mac_addr))
-            mac_addr_int = int(netaddr.EUI(mac_addr))
-            mac_addr_low = mac_addr_int & 0xFFFFFFFF
-            mac_addr_hi = mac_addr_int >> 32
-            self.log.trace("Writing to address 0x{:04X}: 0x{:04X}".format(
-                self.BRIDGE_INTERNAL_MAC_LO_OFFSET, mac_addr_low
-            ))
-            self.poke32(self.BRIDGE_INTERNAL_MAC_LO_OFFSET, mac_addr_low)
-            self.log.trace("Writing to address 0x{:04X}: 0x{:04X}".format(
-                self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_hi
-            ))
-            self.poke32(self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_hi)
-            self.log.debug("Setting internal IP address to `{}'".format(ip_addr))
-            ip_addr_int = int(netaddr.IPAddress(ip_addr))
-            self.poke32(self.BRIDGE_INTERNAL_IP_OFFSET, ip_addr_int)
-            self.log.debug("Setting internal Mode")
-            self.poke32(self.BRIDGE_INTERNAL_ENABLE_OFFSET, int(True))
+        self.log.debug("Setting internal MAC address to `%s'", mac_addr)
+        mac_addr_int = int(netaddr.EUI(mac_addr))
+        mac_addr_low = mac_addr_int & 0xFFFFFFFF
+        mac_addr_hi = mac_addr_int >> 32
+        self.log.debug("Setting internal IP address to `%s'", ip_addr)
+        ip_addr_int = int(netaddr.IPAddress(ip_addr))
+        self.log.debug("Setting internal Mode")
+        addr_vals = [
+            (self.BRIDGE_INTERNAL_MAC_LO_OFFSET, mac_addr_low),
+            (self.BRIDGE_INTERNAL_MAC_HI_OFFSET, mac_addr_hi),
+            (self.BRIDGE_INTERNAL_IP_OFFSET, ip_addr_int),
+            (self.BRIDGE_INTERNAL_ENABLE_OFFSET, int(True)),
+        ]
+        with self._regs, self._shadow_regs.deferred():
+            for addr, val in addr_vals:
+                self.log.trace("Writing to address 0x%04X: 0x%04X", addr, val)
+                self.poke32(addr, val)
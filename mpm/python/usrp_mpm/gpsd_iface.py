@@ -15,47 +15,83 @@ import select
 import datetime
 import math
 import re
+import threading
 from usrp_mpm.mpmlog import get_logger
 
+GPSD_HOST = 'localhost'
+GPSD_PORT = 2947
+# Max number of bytes read from the GPSd socket in one go
+GPSD_RECV_SIZE = 4096
+# Seconds to wait before trying to reconnect to GPSd after the connection was
+# lost
+GPSD_RECONNECT_INTERVAL = 1.0
+# Default timeout (in seconds) for the sensor getters to wait for a report
+GPS_INFO_TIMEOUT = 15
+# Cached reports older than this (in seconds) are considered outdated, e.g.
+# because GPSd stopped sending them, and are not returned anymore
+GPSD_REPORT_MAX_AGE = 5.0
+
+
+def _has_fix_mode(report):
+    " Return True if the TPV report has a non-trivial mode "
+    return report.get("mode", 0) > 0
+
 
 class GPSDIface(object):
     """
     Interface to the GPS service daemon (GPSd).
 
-    The GPSDIface implementation can be used as a context manager, and GPSD results should be
-    gotten with the get_gps_info() function. This will filter by the GPSD response class
-    (resp_class) and return that class message. If no filter is provided, this function will return
-    the first response (not counting the VERSION message).
-
-    The MPM SKY sensors returns the first available response- there shouldn't be anything tricky
-    about this. The MPM TPV sensor, however, returns an interesting value in the shortest time
-    possible. If the GPSD has received a TPV report since we connected (and sent the start
-    command), this function should return immediately. However, if no report is ready, the function
-    waits until an interesting result is ready and returns that. This is achieved by discarding
-    `mode=0` responses.
+    The GPSDIface implementation can be used as a context manager. After
+    open(), GPSd streams its reports (TPV, SKY, ...) to us (WATCH mode). The
+    latest report of every class is cached, and get_report() returns it, or
+    waits until a matching report arrives. Cached reports expire after
+    GPSD_REPORT_MAX_AGE seconds.
+
+    Reports can be read in two ways:
+    - If start() was called, a background thread reads the stream and keeps
+      the cache up to date. get_report() then returns immediately if the
+      cached report matches, and otherwise blocks until the thread received a
+      matching one.
+    - Otherwise, get_report() reads the stream itself until a matching report
+      arrives (or returns the cached one, if it matches).
+
+    The stream is read in chunks and split into lines, so reading does not
+    cost more than the actual data.
     """
-    def __init__(self):
+    def __init__(self, host=GPSD_HOST, port=GPSD_PORT):
         # Make a logger
         try:
             self.log = get_logger('GPSDIface')
         except AssertionError:
             from usrp_mpm.mpmlog import get_main_logger
             self.log = get_main_logger('GPSDIface')
+        self._address = (host, port)
         # Make a socket to connect to GPSD
         self.gpsd_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Received data which does not yet form a complete line
+        self._rx_buf = bytearray()
+        # Map report class (e.g. 'TPV') -> (receive time, latest report of
+        # that class)
+        self._reports = {}
+        # Guards _reports, and is notified when a new report arrives
+        self._reports_cond = threading.Condition()
+        self._watch_thread = None
+        self._stop_event = threading.Event()
 
     def __enter__(self):
         self.open()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
         self.disable_watch()
         self.close()
         return exc_type is None
 
     def open(self):
         """Open the socket to GPSD"""
-        self.gpsd_socket.connect(('localhost', 2947))
+        self.gpsd_socket.connect(self._address)
+        self._rx_buf = bytearray()
         version_str = self.read_class("VERSION")
         self.enable_watch()
         self.log.trace("GPSD version: %s", version_str)
@@ -67,57 +103,109 @@ class GPSDIface(object):
 
     def enable_watch(self):
         """Send a WATCH command, which starts operation"""
-        self.gpsd_socket.sendall(b'?WATCH={"enable":true};')
+        self.gpsd_socket.sendall(b'?WATCH={"enable":true,"json":true};')
         self.log.trace(self.read_class("DEVICES"))
         self.log.trace(self.read_class("WATCH"))
 
-    def poll_request(self, socket_timeout=60, num_retry=10):
-        """Send a POLL command
-
-        Raises
-        ------
-        json.JSONDecodeError
-            If the data returned from GPSd cannot be decoded with JSON.
-        RuntimeError
-            If unsuccessfully connecting to GPSD within num_retry.
-        """
-        query_cmd = b'?POLL;'
-        for _ in range(num_retry):
-            try:
-                self.gpsd_socket.sendall(query_cmd)
-                return self.read_class("POLL", socket_timeout)
-            except socket.error:
-                self.log.warning("Reconnecting to GPSD.")
-                try:
-                    self.gpsd_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    self.open()
-                except socket.error:
-                    self.log.warning("Error during GPSD reconnect.")
-                    continue
-        raise RuntimeError("Unsuccessfully connecting to GPSD  within {} tries".format(num_retry))
-
     def disable_watch(self):
         """Send the command to stop operation"""
         query_cmd = b'?WATCH={"enable":false};'
-        self.gpsd_socket.sendall(query_cmd)
+        try:
+            self.gpsd_socket.sendall(query_cmd)
+        except socket.error:
+            # Connection is already gone, nothing to stop
+            pass
 
-    def socket_read_line(self, timeout=60, interval=0):
+    def start(self):
+        """
+        Start the background thread which reads the reports from GPSd and
+        keeps the cache up to date. If the connection to GPSd is lost, the
+        thread keeps trying to reconnect. open() must have been called.
+        """
+        if self._watch_thread is not None:
+            return
+        self._stop_event.clear()
+        self._watch_thread = threading.Thread(
+            target=self._watch_loop, name="GPSDIface")
+        self._watch_thread.daemon = True
+        self._watch_thread.start()
+
+    def stop(self):
+        """Stop the background thread started by start()"""
+        if self._watch_thread is None:
+            return
+        self._stop_event.set()
+        if self._watch_thread is not threading.current_thread():
+            self._watch_thread.join()
+        self._watch_thread = None
+
+    def _watch_loop(self):
+        """Read the report stream until stop() is called"""
+        while not self._stop_event.is_set():
+            try:
+                self._handle_line(self.socket_read_line(timeout=1))
+            except socket.timeout:
+                continue
+            except ValueError as ex:
+                self.log.warning("Could not decode GPSD report: %s", str(ex))
+            except (socket.error, EOFError) as ex:
+                if self._stop_event.is_set():
+                    break
+                self.log.warning("Lost connection to GPSD: %s", str(ex))
+                with self._reports_cond:
+                    self._reports.clear()
+                self._reconnect()
+
+    def _reconnect(self):
+        """Reconnect to GPSd, until successful or stop() is called"""
+        while not self._stop_event.wait(GPSD_RECONNECT_INTERVAL):
+            self.log.debug("Reconnecting to GPSD.")
+            self.gpsd_socket.close()
+            self.gpsd_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                self.open()
+                return
+            except (socket.error, EOFError, ValueError):
+                continue
+
+    def socket_read_line(self, timeout=60):
         """
         Read from a socket until newline. If there was no newline until the timeout
         occurs, raise an error. Otherwise, return the line.
+
+        Raises
+        ------
+        socket.timeout
+            If no complete line arrived within timeout seconds.
+        EOFError
+            If GPSd closed the connection.
         """
-        line = b''
-        end_time = time.time() + timeout
-        while time.time() < end_time:
-            socket_ready = select.select([self.gpsd_socket], [], [], 0)[0]
-            if socket_ready:
-                next_char = self.gpsd_socket.recv(1)
-                if next_char == b'\n':
-                    return line.decode('ascii')
-                line += next_char
-            else:
-                time.sleep(interval)
-        raise socket.timeout
+        end_time = time.monotonic() + timeout
+        while True:
+            newline_pos = self._rx_buf.find(b'\n')
+            if newline_pos >= 0:
+                line = bytes(self._rx_buf[:newline_pos])
+                del self._rx_buf[:newline_pos + 1]
+                return line.decode('ascii').strip()
+            time_left = end_time - time.monotonic()
+            if time_left <= 0 or \
+                    not select.select([self.gpsd_socket], [], [], time_left)[0]:
+                raise socket.timeout
+            data = self.gpsd_socket.recv(GPSD_RECV_SIZE)
+            if not data:
+                raise EOFError("GPSD closed the connection")
+            self._rx_buf += data
+
+    def _handle_line(self, line):
+        """
+        Decode a line from GPSd, and store it as the latest report of its
+        class. Returns the report.
+        """
+        report = json.loads(line)
+        with self._reports_cond:
+            self._reports[report.get('class', '')] = (time.monotonic(), report)
+            self._reports_cond.notify_all()
+        return report
 
     def read_class(self, class_name, socket_timeout=60):
         """return json data for spcecfic key of 'class'
@@ -129,46 +217,65 @@ class GPSDIface(object):
             If the data returned from GPSd cannot be decoded with JSON.
         """
         while True:
-            json_result = json.loads(self.socket_read_line(socket_timeout))
+            json_result = self._handle_line(self.socket_read_line(socket_timeout))
             if json_result.get('class', '') == class_name:
                 return json_result
 
+    def get_report(self, class_name, timeout=GPS_INFO_TIMEOUT, predicate=None):
+        """
+        Return the latest report of class class_name (e.g. 'TPV' or 'SKY') for
+        which predicate(report) is true (any report, if predicate is None).
+        If the cached report doesn't match or is outdated, wait up to timeout
+        seconds for a new one. Returns an empty dictionary on timeout.
+        """
+        def _get_match():
+            recv_time, report = self._reports.get(class_name, (None, None))
+            if report is None \
+                    or time.monotonic() - recv_time > GPSD_REPORT_MAX_AGE:
+                return None
+            if predicate is None or predicate(report):
+                return dict(report)
+            return None
+        end_time = time.monotonic() + timeout
+        if self._watch_thread is not None:
+            with self._reports_cond:
+                result = self._reports_cond.wait_for(_get_match, timeout)
+            return result or {}
+        result = _get_match()
+        while result is None:
+            time_left = end_time - time.monotonic()
+            if time_left <= 0:
+                return {}
+            try:
+                self._handle_line(self.socket_read_line(time_left))
+            except socket.timeout:
+                return {}
+            except ValueError as ex:
+                self.log.warning("Could not decode GPSD report: %s", str(ex))
+            result = _get_match()
+        return result
+
     def get_gps_info(self, resp_class='', timeout=60):
         """
         This will do:
-        - Poll gpsd for info until we get a response that contains the requested
-          response class (tpv or sky)
-        - If no response class is requested, just return the entire dictionary
-        - Otherwise, filter out the response class value and return that
+        - Get the latest report of the requested response class (tpv or sky)
+        - If no response class is requested, return the latest TPV and SKY
+          reports in the same format as a POLL response (i.e., as lists in
+          the 'tpv' and 'sky' keys)
         - The return value is always a dictionary
         - If the request times out, we return an empty dictionary
         """
-        result = {}
-        end_time = time.time() + timeout
-        while not result.get(resp_class):
-            try:
-                # Do poll request with socket timeout of 5s here.
-                # It should not be that long, since GPSD should send POLL object promptly.
-                result = self.poll_request(5)
-                # If we don't have a response class filter, just return the
-                # first response
-                if not resp_class:
-                    return result
-                # If we time out, return nothing
-                if time.time() > end_time:
-                    self.log.warning(
-                        "Timeout trying to get GPS info (response class `{}')"
-                        .format(resp_class))
-                    return {}
-            except json.JSONDecodeError:
-                # If we get an incomplete packet, this will trigger
-                # In this case, just retry
-                self.log.warning("JSON decode error: %s", result)
-                continue
-        # Filter the result by resp_class or return the entire thing
-        # In the filtered case, the result contains a list of 'resp_class' responses,
-        # so we need to get one valid one.
-        return result.get(resp_class, [{}])[0]
+        if resp_class:
+            return self.get_report(resp_class.upper(), timeout)
+        tpv_result = self.get_report('TPV', timeout)
+        if not tpv_result:
+            return {}
+        sky_result = self.get_report('SKY', 0)
+        return {
+            'class': 'POLL',
+            'tpv': [tpv_result],
+            'sky': [sky_result] if sky_result else [],
+        }
 
 
 class GPSDIfaceExtension(object):
@@ -189,21 +296,43 @@ class GPSDIfaceExtension(object):
             # we can call `get_gps_time`
             print(self.get_gps_time())
     """
-    def __init__(self):
-        self._gpsd_iface = GPSDIface()
+    def __init__(self, host=GPSD_HOST, port=GPSD_PORT):
+        self._gpsd_iface = GPSDIface(host, port)
         self._log = self._gpsd_iface.log
         self._initialized = False
         try:
             self._gpsd_iface.open()
+            self._gpsd_iface.start()
             self._initialized = True
         except (ConnectionRefusedError, ConnectionResetError):
             self._log.warning(
                 "Could not connect to GPSd! None of the GPS sensors will work!")
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        """Stop reading reports from GPSd and close the connection"""
         if self._initialized:
+            self._initialized = False
+            self._gpsd_iface.stop()
+            self._gpsd_iface.disable_watch()
             self._gpsd_iface.close()
 
+    def _get_tpv(self, predicate=_has_fix_mode):
+        """
+        Return the latest TPV report for which predicate is true (by default,
+        one with a non-trivial mode). If there is none, wait until GPSd sends
+        one.
+        """
+        while True:
+            gps_info = self._gpsd_iface.get_report(
+                'TPV', GPS_INFO_TIMEOUT, predicate)
+            if gps_info:
+                return gps_info
+            self._log.warning(
+                "Timeout trying to get GPS info (response class `tpv')")
+
     def extend(self, context):
         """Register the GSPDIfaceExtension object's public function with `context`"""
         new_methods = [method_name for method_name in dir(self)
@@ -232,37 +361,28 @@ class GPSDIfaceExtension(object):
             time_dt = datetime.datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S.%fZ")
             epoch_dt = datetime.datetime(1970, 1, 1)
             return (time_dt - epoch_dt).total_seconds()
-        # Read responses from GPSD until we get a non-trivial mode and until next second.
-        gps_time_prev = 0
-        while True:
-            gps_info = self._gpsd_iface.get_gps_info(resp_class='tpv', timeout=15)
-            gps_mode = gps_info.get("mode", 0)
-            gps_time = parse_time(gps_info.get("time", ""))
-            if gps_mode == 0:
-                self._log.warning("GPSD reported invalid mode."
-                                  "Return from GPSD is %s", gps_info)
-                continue
-            if gps_time_prev == 0:
-                gps_time_prev = gps_time
-                continue
-            else:
-                if int(gps_time) - int(gps_time_prev) >= 1:
-                    return {
-                        'name': 'gps_time',
-                        'type': 'INTEGER',
-                        'unit': 'seconds',
-                        'value': str(int(gps_time)),
-                    }
+        def has_time(gps_info):
+            """Return True if gps_info is a TPV report with a valid time"""
+            return _has_fix_mode(gps_info) and "time" in gps_info
+        # The latest report tells us the current second. GPSd sends a TPV
+        # report for every fix, so we then only need to wait for the first
+        # report of the next second.
+        gps_time_prev = int(parse_time(self._get_tpv(has_time)["time"]))
+        gps_info = self._get_tpv(
+            lambda gps_info: has_time(gps_info) and \
+                int(parse_time(gps_info["time"])) > gps_time_prev)
+        return {
+            'name': 'gps_time',
+            'type': 'INTEGER',
+            'unit': 'seconds',
+            'value': str(int(parse_time(gps_info["time"]))),
+        }
 
     def get_gps_tpv_sensor(self):
         """Get a TPV response from GPSd as a sensor dict"""
-        self._log.trace("Polling GPS TPV results from GPSD")
-        # Read responses from GPSD until we get a non-trivial mode
-        while True:
-            gps_info = self._gpsd_iface.get_gps_info(resp_class='tpv', timeout=15)
-            self._log.trace("GPS info: {}".format(gps_info))
-            if gps_info.get("mode", 0) > 0:
-                break
+        # Get the latest report with a non-trivial mode
+        gps_info = self._get_tpv()
+        self._log.trace("GPS info: %s", gps_info)
         # Return the JSON'd results
         gps_tpv = json.dumps(gps_info)
         return {
@@ -274,9 +394,8 @@ class GPSDIfaceExtension(object):
 
     def get_gps_sky_sensor(self):
         """Get a SKY response from GPSd as a sensor dict"""
-        self._log.trace("Polling GPS SKY results from GPSD")
-        # Just get the first SKY result
-        gps_info = self._gpsd_iface.get_gps_info(resp_class='sky', timeout=15)
+        # Just get the latest SKY result
+        gps_info = self._gpsd_iface.get_report('SKY', GPS_INFO_TIMEOUT)
         # Return the JSON'd results
         gps_sky = json.dumps(gps_info)
         return {
@@ -304,16 +423,14 @@ class GPSDIfaceExtension(object):
 
             return checksum
 
-        self._log.trace("Polling GPS TPV and SKY results from GPSD")
-        # Read responses from GPSD until we get both a SKY response and TPV
-        # response in non-trivial mode
+        # Get the latest SKY report and TPV report in non-trivial mode
         while True:
-            gps_info = self._gpsd_iface.get_gps_info(resp_class='', timeout=15)
-            self._log.trace("GPS info: {}".format(gps_info))
-            tpv_sensor_data = gps_info.get('tpv', [{}])[0]
-            sky_sensor_data = gps_info.get('sky', [{}])[0]
-            if tpv_sensor_data and sky_sensor_data and tpv_sensor_data.get("mode", 0) > 0:
+            tpv_sensor_data = self._get_tpv()
+            sky_sensor_data = self._gpsd_iface.get_report('SKY', GPS_INFO_TIMEOUT)
+            if sky_sensor_data:
                 break
+            self._log.warning(
+                "Timeout trying to get GPS info (response class `sky')")
 
         gpgga = "$GPGGA,"
 
@@ -395,12 +512,8 @@ class GPSDIfaceExtension(object):
         if not self._initialized:
             self._log.warning("Cannot query GPS lock, GPSd not initialized!")
             return False
-        # Read responses from GPSD until we get a non-trivial mode
-        while True:
-            gps_info = self._gpsd_iface.get_gps_info(resp_class='tpv', timeout=15)
-            self._log.trace("GPS info: {}".format(gps_info))
-            if gps_info.get("mode", 0) > 0:
-                break
+        # Get the latest report with a non-trivial mode
+        gps_info = self._get_tpv()
         # 2 == 2D fix, 3 == 3D fix.
         # https://gpsd.gitlab.io/gpsd/gpsd_json.html
         return gps_info.get("mode", 0) >= 2
@@ -414,7 +527,8 @@ def main():
     def parse_args():
         """Parse the command-line arguments"""
         parser = argparse.ArgumentParser(description="Read messages from GPSD")
-        parser.add_argument("--timeout", help="Timeout for the GPSD read", default=20)
+        parser.add_argument("--timeout", help="Timeout for the GPSD read",
+                            type=float, default=20)
         return parser.parse_args()
 
     args = parse_args()
@@ -429,6 +543,7 @@ def main():
     gps_ext = GPSDIfaceExtension()
     for _ in range(10):
         print(gps_ext.get_gps_time_sensor().get('value'))
+    gps_ext.close()
 
 if __name__ == "__main__":
     main()
@@ -11,8 +11,7 @@ from __future__ import print_function
 import copy
 import logging
 from logging import CRITICAL, ERROR, WARNING, INFO, DEBUG
-from logging import handlers
-import collections
+import threading
 from builtins import str
 
 # Colors
@@ -55,23 +54,102 @@ class ColorStreamHandler(logging.StreamHandler):
         record_.msg = BOLD + color + str(record_.msg) + RESET
         logging.StreamHandler.emit(self, record_)
 
-class LossyQueueHandler(handlers.QueueHandler):
+class LogRing(object):
     """
-    Like QueueHandler, except it'll try and keep the youngest, not oldest,
-    entries.
+    Fixed-size ring buffer of log records.
+
+    Every record gets a sequence number. Reading from the ring does not remove
+    any records, so any number of readers can follow the log independently by
+    remembering the sequence number of the next record they want to read.
+    Records are stored as compact tuples (created, levelno, name, message).
     """
-    def enqueue(self, record):
+    def __init__(self, size):
+        assert size > 0
+        self._size = size
+        self._records = [None] * size
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._next_seq, self._size)
+
+    @property
+    def next_seq(self):
+        """
+        Sequence number of the next record that will be appended
+        """
+        return self._next_seq
+
+    def append(self, created, levelno, name, message):
+        """
+        Store a record, overwriting the oldest one if the ring is full.
+        """
+        with self._lock:
+            self._records[self._next_seq % self._size] = \
+                (created, levelno, name, message)
+            self._next_seq += 1
+
+    def get_since(self, seq, max_records=None):
         """
-        Replaces logging.handlers.QueueHandler.enqueue()
+        Return a tuple (first_seq, next_seq, records), where records is a list
+        of up to max_records record tuples, starting at sequence number seq.
+        If seq points to records that have already been overwritten, reading
+        starts at the oldest available record (first_seq). next_seq is the
+        sequence number to pass in on the next call.
         """
-        self.queue.appendleft(record)
+        with self._lock:
+            first_seq = max(seq, self._next_seq - self._size, 0)
+            last_seq = self._next_seq
+            if max_records is not None:
+                last_seq = min(last_seq, first_seq + max(max_records, 0))
+            records = [
+                self._records[idx % self._size]
+                for idx in range(first_seq, last_seq)
+            ]
+        return first_seq, last_seq, records
+
+
+class LogRingHandler(logging.Handler):
+    """
+    Handler that stores records in a LogRing
+    """
+    def __init__(self, ring):
+        logging.Handler.__init__(self)
+        self.ring = ring
+
+    def emit(self, record):
+        """
+        Store the record in the ring. Only the formatted message is kept, not
+        the record itself.
+        """
+        try:
+            self.ring.append(
+                record.created,
+                record.levelno,
+                record.name,
+                record.getMessage(),
+            )
+        except Exception:
+            self.handleError(record)
 
 class MPMLogger(logging.getLoggerClass()):
     """
     Extends the regular Python logging with level 'trace' (like UHD)
+
+    Log messages should always be passed as format strings with arguments,
+    e.g. log.trace("Writing 0x%08X to 0x%04X", value, addr). The message is
+    then only formatted when a handler actually emits it, so disabled log
+    statements cost little more than a dictionary lookup. Avoid calling
+    str.format() on the message, because that happens regardless of the log
+    level. If a message can't be written this way, guard it:
+    >>> if log.isEnabledFor(TRACE):
+    >>>     log.trace(expensive_message())
     """
     def __init__(self, *args, **kwargs):
         logging.Logger.__init__(self, *args, **kwargs)
+        # Newer Pythons provide this cache already, but we also want it when
+        # running older versions. See isEnabledFor().
+        self._cache = getattr(self, '_cache', {})
         self.cpp_log_buf = None
         try:
             import usrp_mpm.libpyusrp_periphs as lib
@@ -79,34 +157,87 @@ class MPMLogger(logging.getLoggerClass()):
         except ImportError:
             pass
         from usrp_mpm import prefs
-        self.py_log_buf = collections.deque(
-            maxlen=prefs.get_prefs().getint('mpm', 'log_buf_size')
+        self.log_ring = LogRing(
+            prefs.get_prefs().getint('mpm', 'log_buf_size')
         )
+        # Read position of get_log_buf()
+        self._log_buf_seq = 0
+
+    def isEnabledFor(self, level):
+        """
+        Returns True if a log message of this level would be processed.
+
+        The result is cached per level. The cache is cleared whenever the
+        level of any logger is changed.
+        """
+        if self.disabled:
+            return False
+        try:
+            return self._cache[level]
+        except KeyError:
+            is_enabled = self._cache[level] = \
+                self.manager.disable < level and \
+                level >= self.getEffectiveLevel()
+            return is_enabled
+
+    def setLevel(self, level):
+        """
+        Set the logging level of this logger, and clear the isEnabledFor()
+        caches of all loggers (child loggers inherit the level).
+        """
+        logging.Logger.setLevel(self, level)
+        for logger in list(self.manager.loggerDict.values()):
+            if isinstance(logger, MPMLogger):
+                logger._cache.clear()
 
-    def trace(self, *args, **kwargs):
+    def trace(self, msg, *args, **kwargs):
         """ Extends logging for super-high verbosity """
-        self.log(TRACE, *args, **kwargs)
+        if self.isEnabledFor(TRACE):
+            self._log(TRACE, msg, args, **kwargs)
 
     def get_log_buf(self):
         """
-        Return the contents of the logging queue, formatted as a list of
-        dictionaries.
-        """
-        records = []
-        # Note: This loop does not guarantee that all log items will be
-        # returned. The while loop is set up to be bounded, and to return as
-        # soon as is sensible.
-        while len(records) < self.py_log_buf.maxlen:
-            try:
-                records.append(self.py_log_buf.pop())
-            except IndexError:
-                break
+        Return all log records that were added since the last call to this
+        method, formatted as a list of str -> str dictionaries.
+
+        Note that there is only one read position for this method. Use
+        get_log_buf_since() to read records without affecting other readers.
+        """
+        _, self._log_buf_seq, records = \
+            self.log_ring.get_since(self._log_buf_seq)
         return [{
-            'name': record.name,
-            'message': record.message,
-            'levelname': record.levelname,
-            'msecs': int(record.msecs),
-        } for record in records]
+            'name': name,
+            'message': message,
+            'levelname': logging.getLevelName(levelno),
+            'msecs': str(int((created - int(created)) * 1000)),
+        } for created, levelno, name, message in records]
+
+    def get_log_buf_since(self, seq, max_records=None):
+        """
+        Return up to max_records log records, starting at sequence number
+        seq, without removing them from the log buffer.
+
+        The records are returned in a columnar format, i.e., as a dictionary
+        with the following keys:
+        - seq: Sequence number of the first returned record. If this is larger
+               than the requested sequence number, records were lost.
+        - next_seq: Sequence number to use for the next call
+        - created: List of timestamps (seconds since epoch, float)
+        - levelno: List of numeric log levels
+        - name: List of logger names
+        - message: List of log messages
+        """
+        first_seq, next_seq, records = \
+            self.log_ring.get_since(seq, max_records)
+        columns = tuple(zip(*records)) or ((), (), (), ())
+        return {
+            'seq': first_seq,
+            'next_seq': next_seq,
+            'created': list(columns[0]),
+            'levelno': list(columns[1]),
+            'name': list(columns[2]),
+            'message': list(columns[3]),
+        }
 
 
 LOGGER = None # Logger singleton
@@ -139,8 +270,8 @@ def get_main_logger(
         journal_handler.setFormatter(journal_formatter)
         LOGGER.addHandler(journal_handler)
     if use_logbuf:
-        queue_handler = LossyQueueHandler(LOGGER.py_log_buf)
-        LOGGER.addHandler(queue_handler)
+        ring_handler = LogRingHandler(LOGGER.log_ring)
+        LOGGER.addHandler(ring_handler)
     # Set default level:
     from usrp_mpm import prefs
     mpm_prefs = prefs.get_prefs()
@@ -7,35 +7,102 @@
 Miscellaneous utilities for MPM
 """
 
+import threading
 import time
 from contextlib import contextmanager
+from usrp_mpm import profiler
 
-def poll_with_timeout(state_check, timeout_ms, interval_ms):
+# poll_with_timeout() starts polling at this interval, and then backs off
+# exponentially up to the interval given by the caller
+POLL_MIN_INTERVAL_MS = 0.1
+POLL_BACKOFF_FACTOR = 2
+
+# Map wait name -> stats dictionary (see get_wait_stats())
+_wait_stats = {}
+_wait_stats_lock = threading.Lock()
+
+def _record_wait(name, duration, timeout, success):
+    " Add a single poll_with_timeout() call to the wait statistics "
+    with _wait_stats_lock:
+        stats = _wait_stats.get(name)
+        if stats is None:
+            stats = {
+                'calls': 0,
+                'timeouts': 0,
+                'total_wait': 0.0,
+                'max_wait': 0.0,
+                'timeout': timeout,
+            }
+            _wait_stats[name] = stats
+        stats['calls'] += 1
+        if not success:
+            stats['timeouts'] += 1
+        stats['total_wait'] += duration
+        stats['max_wait'] = max(stats['max_wait'], duration)
+        stats['timeout'] = timeout
+
+def get_wait_stats():
+    """
+    Return statistics on all poll_with_timeout() calls so far, as a
+    dictionary wait name -> stats. Every stats entry is a dictionary with the
+    keys 'calls', 'timeouts' (number of calls that timed out), 'total_wait'
+    and 'max_wait' (time spent waiting, in seconds) and 'timeout' (the most
+    recently used timeout, in seconds).
     """
-    Calls state_check() every interval_ms until it returns a positive value, or
-    until a timeout is exceeded.
+    with _wait_stats_lock:
+        return {name: dict(stats) for name, stats in _wait_stats.items()}
+
+def poll_with_timeout(state_check, timeout_ms, interval_ms, name=None, irq=None):
+    """
+    Calls state_check() until it returns a positive value, or until a timeout
+    is exceeded.
 
     Returns True if state_check() returned True within the timeout.
 
+    The first polls happen in quick succession, then the time between polls
+    doubles until it reaches interval_ms. This way, conditions which become
+    true quickly are detected quickly, without turning long waits into busy
+    loops. state_check() is always called one last time when the timeout
+    expires.
+
     Arguments:
     state_check -- Functor that returns a Boolean success value, and takes no
                    arguments.
     timeout_ms -- The total timeout in milliseconds. state_check() has to
                   return True within this time.
-    interval_ms -- Sleep time between calls to state_check(). Note that if
-                   interval_ms is larger than timeout_ms, state_check() will be
-                   called exactly once, and then poll_with_timeout() will still
-                   sleep for interval_ms milliseconds. Typically, interval_ms
-                   should be chosen much smaller than timeout_ms, but not too
-                   small for this to become a busy loop.
+    interval_ms -- Maximum sleep time between calls to state_check().
+                   Typically, interval_ms should be chosen much smaller than
+                   timeout_ms.
+    name -- Name of this wait in the wait statistics (see get_wait_stats())
+            and the profiler. Defaults to the qualified name of state_check.
+    irq -- Object with a wait_for_irq(timeout_s) method (e.g. a UIO object of
+           a core which raises an interrupt when the state changes). If
+           given, poll_with_timeout() waits for the interrupt instead of
+           sleeping, and calls state_check() as soon as it arrives.
     """
-    max_time = time.time() + (float(timeout_ms) / 1000)
-    interval_s = float(interval_ms) / 1000
-    while time.time() < max_time:
-        if state_check():
-            return True
-        time.sleep(interval_s)
-    return False
+    name = name or getattr(state_check, '__qualname__', 'state_check')
+    start_time = time.monotonic()
+    max_time = start_time + float(timeout_ms) / 1000
+    interval_s = min(POLL_MIN_INTERVAL_MS, interval_ms) / 1000
+    max_interval_s = float(interval_ms) / 1000
+    success = False
+    with profiler.span("poll_with_timeout: {}".format(name)):
+        while True:
+            if state_check():
+                success = True
+                break
+            remaining = max_time - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_s = min(interval_s, remaining)
+            if irq is not None:
+                irq.wait_for_irq(wait_s)
+            else:
+                time.sleep(wait_s)
+            interval_s = min(interval_s * POLL_BACKOFF_FACTOR, max_interval_s)
+    _record_wait(
+        name, time.monotonic() - start_time, float(timeout_ms) / 1000, success)
+    return success
 
 def to_native_str(str_or_bstr):
     """
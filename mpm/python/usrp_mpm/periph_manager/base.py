@@ -12,6 +12,7 @@ from __future__ import print_function
 import os
 from hashlib import md5
 from time import sleep
+from time import monotonic
 from concurrent import futures
 from builtins import str
 from builtins import object
@@ -21,9 +22,12 @@ from usrp_mpm.sys_utils.udev import get_eeprom_paths
 from usrp_mpm.sys_utils.udev import get_spidev_nodes
 from usrp_mpm.sys_utils import dtoverlay
 from usrp_mpm.sys_utils import net
+from usrp_mpm.sys_utils import net_monitor
 from usrp_mpm import eeprom
 from usrp_mpm.rpc_server import no_claim, no_rpc
 from usrp_mpm import prefs
+from usrp_mpm import profiler
+from usrp_mpm.mpmutils import str2bool
 
 def get_dboard_class_from_pid(pid):
     """
@@ -41,6 +45,41 @@ def get_dboard_class_from_pid(pid):
     return None
 
 
+class ComponentUpload(object):
+    """
+    A component file that is being uploaded. The file contents are written to
+    disk as they come in, and the MD5 hash is computed on the fly, so the
+    file is never held in memory as a whole.
+
+    Arguments:
+    metadata -- Component metadata dictionary (see update_component())
+    filepath -- Path to which the file gets written
+    """
+    def __init__(self, metadata, filepath):
+        self.metadata = metadata
+        self.filepath = filepath
+        self.size = 0
+        self._hash = md5()
+        self._file = open(filepath, 'wb')
+
+    def write(self, data):
+        " Append a chunk of data to the file "
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        " Close the file. Returns the MD5 hash of the file contents. "
+        self._file.close()
+        return self._hash.hexdigest()
+
+    def abort(self):
+        " Close and remove the file "
+        self._file.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+
 # We need to disable the no-self-use check, because we might require self to
 # become an RPC method, but PyLint doesnt' know that. We'll also disable
 # warnings about this being a god class.
@@ -216,13 +255,26 @@ class PeriphManagerBase(object):
         # Set up logging
         self.log = get_logger('PeriphManager')
         self.claimed = False
+        # Address of the client which claimed the device, see set_client_addr()
+        self.client_addr = None
+        # Caches for get_device_info(). The static part only changes when the
+        # device info itself changes (see invalidate_device_info()), the
+        # dynamic part also expires after device_info_ttl seconds.
+        self._device_info_ttl = \
+            prefs.get_prefs().getfloat('mpm', 'device_info_ttl')
+        self._device_info_static_cache = None
+        self._device_info_dyn_cache = None
+        self._device_info_dyn_timestamp = 0.0
+        self._device_info_dyn_net_generation = None
         try:
-            self._eeprom_head, self._eeprom_rawdata = \
-                self._read_mboard_eeprom()
+            with profiler.span("read mboard EEPROM"):
+                self._eeprom_head, self._eeprom_rawdata = \
+                    self._read_mboard_eeprom()
             self.mboard_info = self._get_mboard_info(self._eeprom_head)
             self.log.info("Device serial number: {}"
                           .format(self.mboard_info.get('serial', 'n/a')))
-            self.dboard_infos = self._get_dboard_eeprom_info()
+            with profiler.span("read dboard EEPROMs"):
+                self.dboard_infos = self._get_dboard_eeprom_info()
             self.device_info = \
                     self.generate_device_info(
                         self._eeprom_head,
@@ -263,6 +315,7 @@ class PeriphManagerBase(object):
         )
         self._device_initialized = True
         self._initialization_status = "No errors."
+        self.invalidate_device_info()
 
     def _read_mboard_eeprom(self):
         """
@@ -292,8 +345,6 @@ class PeriphManagerBase(object):
             )
             self.log.trace("Found EEPROM metadata: `{}'"
                            .format(str(eeprom_head)))
-            self.log.trace("Read {} bytes of EEPROM data."
-                           .format(len(eeprom_rawdata)))
             return eeprom_head, eeprom_rawdata
         # Nothing defined? Return defaults.
         self.log.trace("No mboard EEPROM path defined. "
@@ -388,8 +439,6 @@ class PeriphManagerBase(object):
             )
             self.log.trace("Found dboard EEPROM metadata: `{}'"
                            .format(str(dboard_eeprom_md)))
-            self.log.trace("Read %d bytes of dboard EEPROM data.",
-                           len(dboard_eeprom_rawdata))
             db_pid = dboard_eeprom_md.get('pid')
             if db_pid is None:
                 self.log.warning("No dboard PID found in dboard EEPROM!")
@@ -432,14 +481,17 @@ class PeriphManagerBase(object):
             requested_overlays
         ))
         for overlay in requested_overlays:
-            dtoverlay.apply_overlay_safe(overlay)
+            with profiler.span("apply overlay {}".format(overlay)):
+                dtoverlay.apply_overlay_safe(overlay)
         # Need to wait here a second to make sure the ethernet interfaces are up
         # TODO: Fine-tune this number, or wait for some smarter signal.
-        sleep(1)
+        with profiler.span("wait for network interfaces"):
+            sleep(1)
 
     def _init_dboards(self, dboard_infos, override_dboard_pids, default_args):
         """
-        Initialize all the daughterboards
+        Initialize all the daughterboards. The dboard objects are constructed
+        in parallel, unless the 'serialize_init' default arg is set.
 
         dboard_infos -- List of dictionaries as returned from
                        _get_dboard_eeprom_info()
@@ -454,8 +506,8 @@ class PeriphManagerBase(object):
                 len(override_dboard_pids) < len(dboard_infos):
             self.log.warning("--override-db-pids is going to skip dboards.")
             dboard_infos = dboard_infos[:len(override_dboard_pids)]
+        dboard_ctors = []
         for dboard_idx, dboard_info in enumerate(dboard_infos):
-            self.log.debug("Initializing dboard %d...", dboard_idx)
             db_pid = dboard_info.get('pid')
             db_class = get_dboard_class_from_pid(db_pid)
             if db_class is None:
@@ -473,8 +525,52 @@ class PeriphManagerBase(object):
                 'spi_nodes': spi_nodes,
                 'default_args': default_args,
             })
-            # This will actually instantiate the dboard class:
-            self.dboards.append(db_class(dboard_idx, **dboard_info))
+            dboard_ctors.append((dboard_idx, db_class, dboard_info))
+        def _construct_dboard(dboard_idx, db_class, dboard_info):
+            " This will actually instantiate the dboard class "
+            self.log.debug("Initializing dboard %d...", dboard_idx)
+            start_time = monotonic()
+            with profiler.span("dboard {} ctor".format(dboard_idx)):
+                dboard = db_class(dboard_idx, **dboard_info)
+            self.log.info("Initialized dboard %d (%s) in %.2f s.",
+                          dboard_idx, db_class.__name__,
+                          monotonic() - start_time)
+            return dboard
+        # Construct all dboards, even if one of them fails, so we can report
+        # all failures. For every slot, we get either the dboard object or the
+        # exception.
+        if str2bool(default_args.get('serialize_init', False)) \
+                or len(dboard_ctors) < 2:
+            results = []
+            for ctor_args in dboard_ctors:
+                try:
+                    results.append(_construct_dboard(*ctor_args))
+                except Exception as ex:
+                    results.append(ex)
+        else:
+            self.log.debug("Initializing dboards in parallel...")
+            with futures.ThreadPoolExecutor(
+                    max_workers=len(dboard_ctors)) as executor:
+                ctor_futures = [
+                    executor.submit(_construct_dboard, *ctor_args)
+                    for ctor_args in dboard_ctors
+                ]
+                results = [
+                    future.exception() or future.result()
+                    for future in ctor_futures
+                ]
+        failed_slots = []
+        for (dboard_idx, _, _), result in zip(dboard_ctors, results):
+            if isinstance(result, BaseException):
+                self.log.error("Failed to initialize dboard %d: %s",
+                               dboard_idx, str(result), exc_info=result)
+                failed_slots.append(dboard_idx)
+            else:
+                self.dboards.append(result)
+        if failed_slots:
+            raise RuntimeError(
+                "Failed to initialize daughterboard(s) in slot(s) {}".format(
+                    ", ".join(str(x) for x in failed_slots)))
         self.log.info("Initialized %d daughterboard(s).", len(self.dboards))
 
     ###########################################################################
@@ -507,15 +603,22 @@ class PeriphManagerBase(object):
             return False
         if not self.dboards:
             return True
+        def _init_dboard(dboard_idx, dboard):
+            " Run init() on a single dboard "
+            with profiler.span("dboard {} init".format(dboard_idx)):
+                return dboard.init(args)
         if args.get("serialize_init", False):
             self.log.debug("Initializing dboards serially...")
-            return all((dboard.init(args) for dboard in self.dboards))
+            return all((
+                _init_dboard(dboard_idx, dboard)
+                for dboard_idx, dboard in enumerate(self.dboards)
+            ))
         self.log.debug("Initializing dboards in parallel...")
         num_workers = len(self.dboards)
         with futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
             init_futures = [
-                executor.submit(dboard.init, args)
-                for dboard in self.dboards
+                executor.submit(_init_dboard, dboard_idx, dboard)
+                for dboard_idx, dboard in enumerate(self.dboards)
             ]
             return all([
                 x.result()
@@ -542,6 +645,8 @@ class PeriphManagerBase(object):
         deconstruction.
         """
         self.log.trace("Teardown called for Peripheral Manager base.")
+        for dboard in self.dboards:
+            dboard.tear_down()
 
     ###########################################################################
     # RFNoC & Device Info
@@ -621,17 +726,50 @@ class PeriphManagerBase(object):
         Return the device_info dict and add a claimed field.
 
         Will also call into get_device_info_dyn() for additional information.
+        Both the static device info and the result of get_device_info_dyn()
+        are cached. The dynamic part is refreshed at most every
+        device_info_ttl seconds (see mpm.conf), after
+        invalidate_device_info() was called, or when the network
+        configuration (links, IP addresses) changed.
         Don't override this function.
         """
+        if self._device_info_static_cache is None:
+            static_info = dict(self.device_info)
+            static_info.update({
+                'name': net.get_hostname(),
+                'description': self.description,
+            })
+            self._device_info_static_cache = static_info
+        now = monotonic()
+        net_generation = net_monitor.get_snapshot().generation
+        if self._device_info_dyn_cache is None or \
+                now - self._device_info_dyn_timestamp > self._device_info_ttl \
+                or net_generation != self._device_info_dyn_net_generation:
+            self._device_info_dyn_cache = self.get_device_info_dyn()
+            self._device_info_dyn_timestamp = now
+            self._device_info_dyn_net_generation = net_generation
         result = {"claimed": str(self.claimed)}
-        result.update(self.device_info)
-        result.update({
-            'name': net.get_hostname(),
-            'description': self.description,
-        })
-        result.update(self.get_device_info_dyn())
+        result.update(self._device_info_static_cache)
+        result.update(self._device_info_dyn_cache)
         return result
 
+    @no_rpc
+    def invalidate_device_info(self, static=False):
+        """
+        Drop the cached device info, so the next call to get_device_info() will
+        query get_device_info_dyn() again.
+
+        Call this whenever something changes that is reported by
+        get_device_info_dyn() (link state, IP addresses, FPGA image, ...).
+
+        Arguments:
+        static -- If True, also drop the cached static info (self.device_info,
+                  hostname). Use this when self.device_info was modified.
+        """
+        self._device_info_dyn_cache = None
+        if static:
+            self._device_info_static_cache = None
+
     @no_rpc
     def get_device_info_dyn(self):
         """
@@ -644,6 +782,15 @@ class PeriphManagerBase(object):
         self.log.trace("Called get_device_info_dyn(), but not implemented.")
         return {}
 
+    @no_rpc
+    def set_client_addr(self, client_addr):
+        """
+        Store the address of the client which claimed this device, or None
+        when the claim is released. The transport managers use it to probe
+        the CHDR links (see get_chdr_link_options()).
+        """
+        self.client_addr = client_addr
+
     @no_rpc
     def set_connection_type(self, conn_type):
         """
@@ -656,6 +803,7 @@ class PeriphManagerBase(object):
             self.device_info.pop('rpc_connection', None)
         else:
             self.device_info['rpc_connection'] = conn_type
+        self.invalidate_device_info(static=True)
 
     @no_claim
     def get_dboard_info(self):
@@ -686,47 +834,69 @@ class PeriphManagerBase(object):
             "update_component arguments must be the same length"
         # Iterate through the components, updating each in turn
         for metadata, data in zip(metadata_l, data_l):
-            id_str = metadata['id']
-            filename = os.path.basename(metadata['filename'])
-            if id_str not in self.updateable_components:
-                self.log.error("{0} not an updateable component ({1})".format(
-                    id_str, self.updateable_components.keys()
-                ))
-                raise KeyError("Update component not implemented for {}".format(id_str))
-            self.log.trace("Updating component: {}".format(id_str))
-            if 'md5' in metadata:
-                given_hash = metadata['md5']
-                comp_hash = md5()
-                comp_hash.update(data)
-                comp_hash = comp_hash.hexdigest()
-                if comp_hash == given_hash:
-                    self.log.trace("Component file hash matched: {}".format(
-                        comp_hash
-                    ))
-                else:
-                    self.log.error("Component file hash mismatched:\n"
-                                   "Calculated {}\n"
-                                   "Given      {}\n".format(
-                                       comp_hash, given_hash))
-                    raise RuntimeError("Component file hash mismatch")
-            else:
-                self.log.trace("Loading unverified {} image.".format(
-                    id_str
-                ))
-            basepath = os.path.join(os.sep, "tmp", "uploads")
-            filepath = os.path.join(basepath, filename)
-            if not os.path.isdir(basepath):
-                self.log.trace("Creating directory {}".format(basepath))
-                os.makedirs(basepath)
-            self.log.trace("Writing data to {}".format(filepath))
-            with open(filepath, 'wb') as comp_file:
-                comp_file.write(data)
-            update_func = \
-                getattr(self, self.updateable_components[id_str]['callback'])
-            self.log.info("Updating component `%s'", id_str)
-            update_func(filepath, metadata)
+            upload = self.start_component_upload(metadata)
+            upload.write(data)
+            self.finish_component_upload(upload)
         return True
 
+    @no_rpc
+    def start_component_upload(self, metadata):
+        """
+        Start uploading a component file. Returns a ComponentUpload object.
+        Write the file contents to it, and then call
+        finish_component_upload() to apply the update.
+
+        :param metadata: Dictionary of strings containing metadata (must
+                         contain 'id' and 'filename', may contain 'md5')
+        """
+        id_str = metadata['id']
+        filename = os.path.basename(metadata['filename'])
+        if id_str not in self.updateable_components:
+            self.log.error("{0} not an updateable component ({1})".format(
+                id_str, self.updateable_components.keys()
+            ))
+            raise KeyError("Update component not implemented for {}".format(id_str))
+        self.log.trace("Updating component: %s", id_str)
+        basepath = os.path.join(os.sep, "tmp", "uploads")
+        filepath = os.path.join(basepath, filename)
+        if not os.path.isdir(basepath):
+            self.log.trace("Creating directory %s", basepath)
+            os.makedirs(basepath)
+        self.log.trace("Writing data to %s", filepath)
+        return ComponentUpload(metadata, filepath)
+
+    @no_rpc
+    def finish_component_upload(self, upload):
+        """
+        Complete a component upload started with start_component_upload():
+        Verify the MD5 hash (if the metadata contains one) and update the
+        component from the uploaded file.
+
+        :param upload: ComponentUpload object
+        """
+        metadata = upload.metadata
+        id_str = metadata['id']
+        comp_hash = upload.close()
+        if 'md5' in metadata:
+            given_hash = metadata['md5']
+            if comp_hash == given_hash:
+                self.log.trace("Component file hash matched: %s", comp_hash)
+            else:
+                self.log.error("Component file hash mismatched:\n"
+                               "Calculated {}\n"
+                               "Given      {}\n".format(
+                                   comp_hash, given_hash))
+                upload.abort()
+                raise RuntimeError("Component file hash mismatch")
+        else:
+            self.log.trace("Loading unverified %s image.", id_str)
+        update_func = \
+            getattr(self, self.updateable_components[id_str]['callback'])
+        self.log.info("Updating component `%s'", id_str)
+        update_func(upload.filepath, metadata)
+        # Components such as the FPGA image are reported by get_device_info()
+        self.invalidate_device_info(static=True)
+
     @no_claim
     def get_component_info(self, component_name):
         """
@@ -867,6 +1037,8 @@ class PeriphManagerBase(object):
         - ipv4 (IP Address)
         - port (UDP port)
         - link_rate (bps of the link, e.g. 10e9 for 10GigE)
+        - link_capacity (Measured or reported capacity of the link)
+        - preference (Higher is better, the list is sorted by this)
 
         """
         raise NotImplementedError("get_chdr_link_options() not implemented.")
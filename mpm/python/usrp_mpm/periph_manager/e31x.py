@@ -525,7 +525,7 @@ class e31x(ZynqComponents, PeriphManagerBase):
             return []
         if xport_type == "udp":
             return self._xport_mgrs[xport_type].get_chdr_link_options(
-                self.mboard_info['rpc_connection'])
+                self.mboard_info['rpc_connection'], self.client_addr)
         else:
             return self._xport_mgrs[xport_type].get_chdr_link_options()
 
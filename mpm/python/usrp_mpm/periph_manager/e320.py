@@ -363,6 +363,7 @@ class e320(ZynqComponents, PeriphManagerBase):
             self._status_monitor_thread.join(3 * E320_MONITOR_THREAD_INTERVAL)
             if self._status_monitor_thread.is_alive():
                 self.log.error("Could not terminate monitor thread! This could result in resource leaks.")
+        super(e320, self).tear_down()
         active_overlays = self.list_active_overlays()
         self.log.trace("E320 has active device tree overlays: {}".format(
             active_overlays
@@ -392,6 +393,8 @@ class e320(ZynqComponents, PeriphManagerBase):
         - ipv4 (IP Address)
         - port (UDP port)
         - link_rate (bps of the link, e.g. 10e9 for 10GigE)
+        - link_capacity (Measured or reported capacity of the link)
+        - preference (Higher is better, the list is sorted by this)
 
         """
         if xport_type not in self._xport_mgrs:
@@ -400,7 +403,7 @@ class e320(ZynqComponents, PeriphManagerBase):
             return []
         if xport_type == "udp":
             return self._xport_mgrs[xport_type].get_chdr_link_options(
-                self.mboard_info['rpc_connection'])
+                self.mboard_info['rpc_connection'], self.client_addr)
         else:
             return self._xport_mgrs[xport_type].get_chdr_link_options()
 
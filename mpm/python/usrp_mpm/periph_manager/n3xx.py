@@ -17,11 +17,14 @@ from usrp_mpm.cores import WhiteRabbitRegsControl
 from usrp_mpm.components import ZynqComponents
 from usrp_mpm.gpsd_iface import GPSDIfaceExtension
 from usrp_mpm.periph_manager import PeriphManagerBase
+from usrp_mpm import prefs
+from usrp_mpm import profiler
 from usrp_mpm.mpmutils import assert_compat_number, str2bool, poll_with_timeout
-from usrp_mpm.rpc_server import no_rpc
+from usrp_mpm.rpc_server import no_rpc, blocking
 from usrp_mpm.sys_utils import dtoverlay
 from usrp_mpm.sys_utils import i2c_dev
 from usrp_mpm.sys_utils.sysfs_thermal import read_thermal_sensor_value
+from usrp_mpm.sys_utils.sysfs_thermal import ThermalSampler
 from usrp_mpm.xports import XportMgrUDP
 from usrp_mpm.periph_manager.n3xx_periphs import TCA6424
 from usrp_mpm.periph_manager.n3xx_periphs import BackpanelGPIO
@@ -205,10 +208,12 @@ class n3xx(ZynqComponents, PeriphManagerBase):
     def __init__(self, args):
         self._tear_down = False
         self._status_monitor_thread = None
+        self._thermal_sampler = None
         self._ext_clock_freq = None
         self._clock_source = None
         self._time_source = None
         self._bp_leds = None
+        self._gpios = None
         self._gpsd = None
         self._qsfp_retimer = None
         super(n3xx, self).__init__()
@@ -236,20 +241,24 @@ class n3xx(ZynqComponents, PeriphManagerBase):
                 )
             )
             # Apply overlay
-            self.overlay_apply()
+            with profiler.span("apply overlays"):
+                self.overlay_apply()
             # Run dboards init
-            self.init_dboards(args)
+            with profiler.span("init dboards"):
+                self.init_dboards(args)
             if not self._device_initialized:
                 # Don't try and figure out what's going on. Just give up.
                 return
-            self._init_peripherals(args)
+            with profiler.span("init peripherals"):
+                self._init_peripherals(args)
         except BaseException as ex:
             self.log.error("Failed to initialize motherboard: %s", str(ex))
             self._initialization_status = str(ex)
             self._device_initialized = False
         try:
             if not args.get('skip_boot_init', False):
-                self.init(args)
+                with profiler.span("boot init"):
+                    self.init(args)
         except BaseException as ex:
             self.log.warning("Failed to initialize device on boot: %s", str(ex))
 
@@ -346,10 +355,13 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         # Init clocking
         self.enable_ref_clock(enable=True)
         self._ext_clock_freq = None
-        self._init_ref_clock_and_time(args)
-        self._init_meas_clock()
+        with profiler.span("init ref clock and time"):
+            self._init_ref_clock_and_time(args)
+        with profiler.span("init measurement clock"):
+            self._init_meas_clock()
         # Init GPSd iface and GPS sensors
-        self._init_gps_sensors()
+        with profiler.span("init GPS sensors"):
+            self._init_gps_sensors()
         # Init QSFP board (if available)
         qsfp_i2c = i2c_dev.of_get_i2c_adapter(N32X_QSFP_I2C_LABEL)
         if qsfp_i2c:
@@ -387,9 +399,34 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             daemon=True,
         )
         self._status_monitor_thread.start()
+        self._init_thermal_sampler()
         # Init complete.
         self.log.debug("Device info: {}".format(self.device_info))
 
+    def _init_thermal_sampler(self):
+        """
+        Start sampling the temperature and fan sensors in the background, so
+        get_temp_sensor() and get_fan_sensor() can be answered from the cache.
+        """
+        sample_interval = \
+            prefs.get_prefs().getfloat('mpm', 'thermal_sample_interval')
+        if sample_interval <= 0:
+            self.log.debug("Thermal sampling is disabled.")
+            return
+        self._thermal_sampler = ThermalSampler(
+            sample_interval, self.log.getChild('ThermalSampler'))
+        for sensor_name, sensor_type, data_probe in (
+                ('temp', 'fpga-thermal-zone', 'temp'),
+                ('fan', 'ec-fan0', 'cur_state'),
+            ):
+            try:
+                self._thermal_sampler.add_sensor(
+                    sensor_name, sensor_type, data_probe)
+            except IndexError as ex:
+                self.log.warning("Can't sample sensor `%s': %s",
+                                 sensor_name, str(ex))
+        self._thermal_sampler.start()
+
     def _init_gps_sensors(self):
         "Init and register the GPSd Iface and related sensor functions"
         self.log.trace("Initializing GPSd interface")
@@ -429,7 +466,8 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         # successful clocking configuration).
         args['clock_source'] = args.get('clock_source', self._clock_source)
         args['time_source'] = args.get('time_source', self._time_source)
-        self.set_sync_source(args)
+        with profiler.span("set sync source"):
+            self.set_sync_source(args)
         # Uh oh, some hard coded product-related info: The N300 has no LO
         # source connectors on the front panel, so we assume that if this was
         # selected, it was an artifact from N310-related code. The user gets
@@ -448,8 +486,9 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             'pps_export',
             N3XX_DEFAULT_ENABLE_PPS_EXPORT
         ))
-        for xport_mgr in itervalues(self._xport_mgrs):
-            xport_mgr.init(args)
+        with profiler.span("init transport managers"):
+            for xport_mgr in itervalues(self._xport_mgrs):
+                xport_mgr.init(args)
         return result
 
     def deinit(self):
@@ -472,11 +511,18 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
         self.log.trace("Tearing down N3xx device...")
         self._tear_down = True
+        if self._thermal_sampler is not None:
+            self._thermal_sampler.stop()
         if self._device_initialized:
             self._status_monitor_thread.join(3 * N3XX_MONITOR_THREAD_INTERVAL)
             if self._status_monitor_thread.is_alive():
                 self.log.error("Could not terminate monitor thread! "
                                "This could result in resource leaks.")
+        super(n3xx, self).tear_down()
+        if self._bp_leds is not None:
+            self._bp_leds.close()
+        if self._gpios is not None:
+            self._gpios.close()
         active_overlays = self.list_active_overlays()
         self.log.trace("N3xx has active device tree overlays: {}".format(
             active_overlays
@@ -506,13 +552,15 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         - ipv4 (IP Address)
         - port (UDP port)
         - link_rate (bps of the link, e.g. 10e9 for 10GigE)
+        - link_capacity (Measured or reported capacity of the link)
+        - preference (Higher is better, the list is sorted by this)
         """
         if xport_type not in self._xport_mgrs:
             self.log.warning("Can't get link options for unknown link type: `{}'.".format(xport_type))
             return []
         if xport_type == "udp":
             return self._xport_mgrs[xport_type].get_chdr_link_options(
-                self.mboard_info['rpc_connection'])
+                self.mboard_info['rpc_connection'], self.client_addr)
         else:
             return self._xport_mgrs[xport_type].get_chdr_link_options()
 
@@ -548,6 +596,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         " Returns the currently selected clock source "
         return self._clock_source
 
+    @blocking
     def set_clock_source(self, *args):
         " Sets a new reference clock source "
         clock_source = args[0]
@@ -576,6 +625,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         " Return the currently selected time source "
         return self._time_source
 
+    @blocking
     def set_time_source(self, time_source):
         " Set a time source "
         clock_source = self._clock_source
@@ -595,6 +645,7 @@ class n3xx(ZynqComponents, PeriphManagerBase):
                  }
         self.set_sync_source(source)
 
+    @blocking
     def set_sync_source(self, args):
         """
         Selects reference clock and PPS sources. Unconditionally re-applies the time
@@ -678,7 +729,8 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             if not poll_with_timeout(
                     wr_regs_control.get_time_lock_status,
                     40000, # Try for x ms... this number is set from a few benchtop tests
-                    1000, # Poll every... second! why not?
+                    100, # Poll at least every 100 ms, so we don't oversleep the lock
+                    name="White Rabbit time lock",
                 ):
                 self.log.error("{} timebase failed to lock within 40 seconds. Status: 0x{:X}" \
                                .format(time_source, wr_regs_control.get_time_lock_status()))
@@ -888,8 +940,10 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
         self.log.trace("Reading FPGA temperature.")
         return_val = '-1'
+        timestamp = time.time()
         try:
-            raw_val = read_thermal_sensor_value('fpga-thermal-zone', 'temp')
+            raw_val, timestamp = \
+                self._read_thermal_sensor('temp', 'fpga-thermal-zone', 'temp')
             return_val = str(raw_val/1000)
         except ValueError:
             self.log.warning("Error when converting temperature value")
@@ -899,7 +953,8 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             'name': 'temperature',
             'type': 'REALNUM',
             'unit': 'C',
-            'value': return_val
+            'value': return_val,
+            'timestamp': str(timestamp),
         }
 
     def get_fan_sensor(self):
@@ -908,8 +963,10 @@ class n3xx(ZynqComponents, PeriphManagerBase):
         """
         self.log.trace("Reading FPGA cooling device.")
         return_val = '-1'
+        timestamp = time.time()
         try:
-            raw_val = read_thermal_sensor_value('ec-fan0', 'cur_state')
+            raw_val, timestamp = \
+                self._read_thermal_sensor('fan', 'ec-fan0', 'cur_state')
             return_val = str(raw_val)
         except ValueError:
             self.log.warning("Error when converting fan speed value")
@@ -919,9 +976,33 @@ class n3xx(ZynqComponents, PeriphManagerBase):
             'name': 'cooling fan',
             'type': 'INTEGER',
             'unit': 'rpm',
-            'value': return_val
+            'value': return_val,
+            'timestamp': str(timestamp),
         }
 
+    def get_thermal_history(self, sensor_name):
+        """
+        Return the recent samples of a thermal sensor ('temp' or 'fan') as a
+        list of (timestamp, raw value) pairs, oldest first. Timestamps are
+        seconds since the epoch. Returns an empty list if the sensor is not
+        being sampled (see thermal_sample_interval in mpm.conf).
+        """
+        if self._thermal_sampler is None \
+                or not self._thermal_sampler.has_sensor(sensor_name):
+            return []
+        return self._thermal_sampler.get_history(sensor_name)
+
+    def _read_thermal_sensor(self, sensor_name, sensor_type, data_probe):
+        """
+        Return a tuple (raw value, timestamp) for a thermal sensor. If the
+        sensor is being sampled, the most recent sample is returned,
+        otherwise the sensor is read right away.
+        """
+        if self._thermal_sampler is not None \
+                and self._thermal_sampler.has_sensor(sensor_name):
+            return self._thermal_sampler.get(sensor_name)
+        return read_thermal_sensor_value(sensor_type, data_probe), time.time()
+
     def get_gps_lock_sensor(self):
         """
         Get lock status of GPS as a sensor dict
@@ -104,6 +104,12 @@ class TCA6424(object):
         default_val = 0x860101 if rev == 2 else 0x860780
         self._gpios = SysFSGPIO({'device/name': 'tca6424', 'device/of_node/name': 'gpio'}, 0xFFF7FF, 0x86F7FF, default_val)
 
+    def close(self):
+        """
+        Release the underlying GPIO files
+        """
+        self._gpios.close()
+
     def set(self, name, value=None):
         """
         Assert a pin by name
@@ -17,6 +17,11 @@ _PREFS = None
 MPM_DEFAULT_CONFFILE_PATH = '/etc/uhd/mpm.conf'
 MPM_DEFAULT_LOG_LEVEL = 'info'
 MPM_DEFAULT_LOG_BUF_SIZE = 100 # Number of log records to buf
+MPM_DEFAULT_DEVICE_INFO_TTL = 5.0 # Seconds until cached device info expires
+MPM_DEFAULT_RPC_UNIX_SOCKET = '/run/usrp_hwd.sock' # Empty string disables it
+MPM_DEFAULT_RPC_STATS = False # Collect per-method RPC call statistics
+MPM_DEFAULT_THERMAL_SAMPLE_INTERVAL = 1.0 # Seconds, 0 disables sampling
+MPM_DEFAULT_CHDR_LINK_PROBE = False # Measure CHDR link capacity on request
 
 # ConfigParser has too many parents for PyLint's liking, but we don't control
 # that, so disable that warning
@@ -39,6 +44,11 @@ class _MPMPrefs(configparser.ConfigParser):
         'mpm': {
             'log_level': MPM_DEFAULT_LOG_LEVEL,
             'log_buf_size': MPM_DEFAULT_LOG_BUF_SIZE,
+            'device_info_ttl': MPM_DEFAULT_DEVICE_INFO_TTL,
+            'rpc_unix_socket': MPM_DEFAULT_RPC_UNIX_SOCKET,
+            'rpc_stats': MPM_DEFAULT_RPC_STATS,
+            'thermal_sample_interval': MPM_DEFAULT_THERMAL_SAMPLE_INTERVAL,
+            'chdr_link_probe': MPM_DEFAULT_CHDR_LINK_PROBE,
         },
         'overrides': {
             'override_db_pids': '',
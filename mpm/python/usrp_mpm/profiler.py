@@ -0,0 +1,163 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Hierarchical timing of MPM phases (e.g., device initialization)
+
+Code annotates phases with the span() context manager, or the timed()
+decorator:
+
+>>> with span("init LMK"):
+...     lmk.init()
+
+Spans are only recorded while a root span is open, i.e., inside a
+span(name, root=True) block. Everywhere else, span() does nothing, so
+annotations are cheap in code which also runs outside of profiled phases.
+
+A span becomes a child of the innermost span which is open on the same
+thread. Threads that have no open span of their own (e.g., the workers
+of a thread pool) attach their spans to the innermost span open on the
+thread which opened the current root span.
+"""
+
+import collections
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from builtins import object
+
+# Number of root spans (e.g., init() calls) that are kept
+MAX_ROOT_SPANS = 16
+
+class Span(object):
+    """
+    A single timed phase
+    """
+    def __init__(self, name):
+        self.name = name
+        self.thread_name = threading.current_thread().name
+        self.start = time.monotonic()
+        self.duration = None
+        self.children = []
+
+    def to_dict(self):
+        """
+        Return this span and its children as a dictionary. 'start' is in
+        seconds since this module was loaded (i.e., roughly since MPM was
+        started), 'duration' is in seconds. If the span is still open,
+        'duration' is the time elapsed so far, and 'running' is True.
+        """
+        return {
+            'name': self.name,
+            'thread': self.thread_name,
+            'start': self.start - _EPOCH,
+            'duration': self.duration if self.duration is not None \
+                        else time.monotonic() - self.start,
+            'running': self.duration is None,
+            'children': [child.to_dict() for child in list(self.children)],
+        }
+
+_EPOCH = time.monotonic()
+_root_spans = collections.deque(maxlen=MAX_ROOT_SPANS)
+# Stack of open spans of the thread which opened the current root span. If
+# no root span is open, this is None.
+_root_stack = None
+# Stack of open spans per thread
+_local = threading.local()
+
+def _get_parent(stack):
+    " Return the span that a new span opened on this thread is a child of "
+    if stack:
+        return stack[-1]
+    root_stack = _root_stack
+    try:
+        return root_stack[-1] if root_stack is not None else None
+    except IndexError:
+        # Root span was closed in the meantime
+        return None
+
+@contextmanager
+def span(name, root=False):
+    """
+    Context manager: Time the code inside the block, and record it as a span
+    called name.
+
+    Arguments:
+    name -- Name of the phase, e.g. "init LMK"
+    root -- If True, start a new top-level span. Otherwise, nothing is
+            recorded unless a root span is open.
+    """
+    global _root_stack
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = []
+        _local.stack = stack
+    parent = None if root else _get_parent(stack)
+    if parent is None and not root:
+        yield None
+        return
+    new_span = Span(name)
+    if root:
+        _root_spans.append(new_span)
+        prev_root_stack = _root_stack
+        _root_stack = stack
+    else:
+        parent.children.append(new_span)
+    stack.append(new_span)
+    try:
+        yield new_span
+    finally:
+        new_span.duration = time.monotonic() - new_span.start
+        stack.pop()
+        if root:
+            _root_stack = prev_root_stack
+
+def timed(name=None):
+    """
+    Decorator: Record every call of the decorated function as a span. The
+    span name defaults to the function's qualified name.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_profile():
+    """
+    Return the recorded root spans as a list of dictionaries (see
+    Span.to_dict()), oldest first.
+    """
+    return [root_span.to_dict() for root_span in list(_root_spans)]
+
+def format_profile(profile):
+    """
+    Format a profile as returned by get_profile() as a text tree, one span
+    per line, with durations in seconds. Returns a string.
+    """
+    lines = []
+    def _format_span(span_dict, depth, parent_thread):
+        label = "  " * depth + span_dict['name']
+        if span_dict['thread'] != parent_thread:
+            label += " [{}]".format(span_dict['thread'])
+        lines.append("{:<60} {:9.3f} s{}".format(
+            label,
+            span_dict['duration'],
+            " (running)" if span_dict['running'] else ""))
+        for child in span_dict['children']:
+            _format_span(child, depth + 1, span_dict['thread'])
+    for span_dict in profile:
+        _format_span(span_dict, 0, span_dict['thread'])
+    return "\n".join(lines)
+
+def dump_profile(profile, json_path):
+    " Write a profile as returned by get_profile() to a JSON file "
+    with open(json_path, 'w') as json_file:
+        json.dump(profile, json_file, indent=2)
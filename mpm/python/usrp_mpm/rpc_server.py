@@ -13,8 +13,10 @@ import copy
 from random import choice
 from string import ascii_letters, digits
 from multiprocessing import Process
+import os
 import threading
 import sys
+import time
 from gevent.server import StreamServer
 from gevent.pool import Pool
 from gevent import signal
@@ -22,10 +24,19 @@ from gevent import spawn_later
 from gevent import Greenlet
 from gevent import monkey
 monkey.patch_all()
+from gevent.local import local
+from gevent.lock import RLock
+from gevent.threadpool import ThreadPool
+from gevent import socket
 from contextlib import contextmanager
+import msgpack
 from mprpc import RPCServer
+from mprpc.constants import MSGPACKRPC_REQUEST, MSGPACKRPC_RESPONSE
 from usrp_mpm.mpmlog import get_main_logger
-from usrp_mpm.mpmutils import to_binary_str
+from usrp_mpm.mpmutils import to_binary_str, get_wait_stats
+from usrp_mpm import prefs
+from usrp_mpm import profiler
+from usrp_mpm.rpc_stats import RPCStats
 from usrp_mpm.sys_utils import watchdog
 from usrp_mpm.sys_utils import net
 
@@ -33,6 +44,19 @@ TIMEOUT_INTERVAL = 5.0 # Seconds before claim expires (default value)
 TOKEN_LEN = 16 # Length of the token string
 # Compatibility number for MPM
 MPM_COMPAT_NUM = (3, 0)
+# Parameters for the msgpack packer and unpacker
+RPC_PACK_PARAMS = {'use_bin_type': True}
+RPC_UNPACK_PARAMS = {'max_buffer_size': 50000000, 'raw': False}
+# Max number of bytes read from an RPC connection at once
+RPC_RECV_SIZE = 1024 * 1024
+# Clients connecting through the Unix domain socket are on this device, so we
+# report them as connecting from localhost
+UNIX_SOCKET_CLIENT_ADDR = ('127.0.0.1', 0)
+# Number of worker threads for methods decorated with @blocking
+RPC_WORKER_THREADS = 2
+
+# Cache for get_rpc_method_table(): Maps class -> RPC method table
+_RPC_METHOD_TABLES = {}
 
 def no_claim(func):
     " Decorator for functions that require no token check "
@@ -44,6 +68,63 @@ def no_rpc(func):
     func._norpc = True
     return func
 
+def blocking(func):
+    """
+    Decorator for functions that may take a long time to complete. They get
+    executed in a worker thread, so the RPC server can keep serving other
+    calls (e.g., @no_claim status queries or reclaims) in the meantime.
+    Calls that require a claim are still executed one at a time.
+    """
+    func._blocking = True
+    return func
+
+def get_rpc_method_table(cls):
+    """
+    Return the RPC method table for a periph manager or dboard class. This is
+    a dictionary method name -> requires claim, which contains all public,
+    callable class attributes which are not decorated with @no_rpc. Methods
+    decorated with @no_claim do not require a claim.
+
+    The table only depends on the class, so it is computed once per class.
+    Properties are never considered RPC methods.
+    """
+    table = _RPC_METHOD_TABLES.get(cls)
+    if table is None:
+        table = {}
+        for method_name in dir(cls):
+            if method_name.startswith('_'):
+                continue
+            attr = getattr(cls, method_name, None)
+            if isinstance(attr, property) \
+                    or not callable(attr) \
+                    or getattr(attr, '_norpc', False):
+                continue
+            table[method_name] = not getattr(attr, '_notok', False)
+        _RPC_METHOD_TABLES[cls] = table
+    return table
+
+def _get_instance_rpc_method_table(component):
+    """
+    Return the RPC method table (see get_rpc_method_table()) for an object.
+    On top of the class' methods, this includes callables which were assigned
+    to the object itself (e.g., peek32 = self.regs.peek32).
+    """
+    table = get_rpc_method_table(type(component))
+    instance_attrs = [
+        (attr_name, attr)
+        for attr_name, attr in getattr(component, '__dict__', {}).items()
+        if not attr_name.startswith('_')
+    ]
+    if not instance_attrs:
+        return table
+    table = table.copy()
+    for attr_name, attr in instance_attrs:
+        if callable(attr) and not getattr(attr, '_norpc', False):
+            table[attr_name] = not getattr(attr, '_notok', False)
+        else:
+            table.pop(attr_name, None)
+    return table
+
 class MPMServer(RPCServer):
     """
     Main MPM RPC class which holds the periph_manager object and translates
@@ -51,7 +132,9 @@ class MPMServer(RPCServer):
     """
     # This is a list of methods in this class which require a claim
     default_claimed_methods = ['init', 'update_component', 'reclaim', 'unclaim',
-                               'get_log_buf']
+                               'get_log_buf', 'get_log_buf_since',
+                               'batch_call', 'begin_upload', 'upload_chunk',
+                               'finish_upload', 'reset_rpc_stats']
 
     ###########################################################################
     # RPC Server Initialization
@@ -70,6 +153,21 @@ class MPMServer(RPCServer):
             TIMEOUT_INTERVAL
         ))
         self.session_id = None
+        # Address of the client for the current connection. Every connection
+        # is handled by its own greenlet, so this is greenlet-local.
+        self._client = local()
+        # Maps method name -> bound method, see _get_rpc_method()
+        self._rpc_method_cache = {}
+        # Worker threads for @blocking methods
+        self._executor = ThreadPool(RPC_WORKER_THREADS)
+        # Serializes all calls that require a claim. Methods which don't
+        # require a claim are not affected by this lock.
+        self._claimed_call_lock = RLock()
+        # Pending chunked component uploads: upload ID -> ComponentUpload
+        self._uploads = {}
+        # Per-method call statistics, only collected if enabled in mpm.conf
+        self._rpc_stats = RPCStats() \
+            if prefs.get_prefs().getboolean('mpm', 'rpc_stats') else None
         # Create the periph_manager for this device
         # This call will be forwarded to the device specific implementation
         # e.g. in periph_manager/n3xx.py
@@ -79,7 +177,8 @@ class MPMServer(RPCServer):
         # (see periph_manager/base.py)
         from usrp_mpm.periph_manager import periph_manager
         self._mgr_generator = lambda: periph_manager(default_args)
-        self.periph_manager = self._mgr_generator()
+        with profiler.span("periph manager ctor", root=True):
+            self.periph_manager = self._mgr_generator()
         device_info = self.periph_manager.get_device_info()
         self._state.dev_type.value = \
                 to_binary_str(device_info.get("type", "n/a"))
@@ -89,14 +188,16 @@ class MPMServer(RPCServer):
                 to_binary_str(device_info.get("serial", "n/a"))
         self._db_methods = []
         self._mb_methods = []
+        # Maps command name -> unwrapped callable, for use by batch_call()
+        self._rpc_functions = {}
         self.claimed_methods = copy.copy(self.default_claimed_methods)
         self._last_error = ""
         self._init_rpc_calls(self.periph_manager)
         # We call the server __init__ function here, and not earlier, because
         # first the commands need to be registered
         super(MPMServer, self).__init__(
-            pack_params={'use_bin_type': True},
-            unpack_params={'max_buffer_size': 50000000, 'raw': False},
+            pack_params=RPC_PACK_PARAMS,
+            unpack_params=RPC_UNPACK_PARAMS,
         )
         self._state.system_ready.value = True
         self.log.info("RPC server ready!")
@@ -125,6 +226,8 @@ class MPMServer(RPCServer):
                     )
         self._db_methods = []
         self._mb_methods = []
+        self._rpc_functions = {}
+        self._rpc_method_cache = {}
         # Register new ones:
         self._update_component_commands(mgr, '', '_mb_methods')
         for db_slot, dboard in enumerate(mgr.dboards):
@@ -141,22 +244,22 @@ class MPMServer(RPCServer):
         Detect available methods for an object and add them to the RPC server.
 
         We skip all private methods, and all methods that use the @no_rpc
-        decorator.
-        """
-        for method_name in (
-                m for m in dir(component)
-                if not m.startswith('_') \
-                    and callable(getattr(component, m)) \
-                    and not hasattr(self, m) \
-                    and not getattr(getattr(component, m), '_norpc', False)
-            ):
+        decorator. The list of methods is taken from the precomputed method
+        table of the object's class (see get_rpc_method_table()), so this only
+        needs to bind the methods to the object.
+        """
+        method_table = _get_instance_rpc_method_table(component)
+        for method_name in sorted(method_table):
+            if hasattr(self, method_name):
+                continue
             new_rpc_method = getattr(component, method_name)
             command_name = namespace + method_name
-            if getattr(new_rpc_method, '_notok', False):
-                self._add_safe_command(new_rpc_method, command_name)
-            else:
+            if method_table[method_name]:
                 self._add_claimed_command(new_rpc_method, command_name)
                 self.claimed_methods.append(command_name)
+            else:
+                self._add_safe_command(new_rpc_method, command_name)
+            self._rpc_functions[command_name] = new_rpc_method
             getattr(self, storage).append(command_name)
 
 
@@ -169,6 +272,7 @@ class MPMServer(RPCServer):
         If the method does not require a token, use _add_safe_command().
         """
         self.log.trace("adding command %s pointing to %s", command, function)
+        run_blocking = getattr(function, '_blocking', False)
         def new_claimed_function(token, *args):
             " Define a function that requires a claim token check "
             if not self._check_token_valid(token):
@@ -181,7 +285,10 @@ class MPMServer(RPCServer):
                 # Because we can only reach this point with a valid claim,
                 # there's no harm in resetting the timer
                 self._reset_timer()
-                return function(*args)
+                with self._claimed_call_lock:
+                    if run_blocking:
+                        return self._run_blocking(function, *args)
+                    return function(*args)
             except Exception as ex:
                 self.log.error(
                     "Uncaught exception in method %s :%s \n %s ",
@@ -203,9 +310,12 @@ class MPMServer(RPCServer):
         _add_claimed_command().
         """
         self.log.trace("adding safe command %s pointing to %s", command, function)
+        run_blocking = getattr(function, '_blocking', False)
         def new_unclaimed_function(*args):
             " Define a function that does not require a claim token check "
             try:
+                if run_blocking:
+                    return self._run_blocking(function, *args)
                 return function(*args)
             except Exception as ex:
                 self.log.error(
@@ -217,6 +327,115 @@ class MPMServer(RPCServer):
         new_unclaimed_function.__doc__ = function.__doc__
         setattr(self, command, new_unclaimed_function)
 
+    def _run_blocking(self, function, *args):
+        """
+        Execute function(*args) in a worker thread and return its result (or
+        raise its exception). Only the calling greenlet waits for the result,
+        all other greenlets keep running.
+        """
+        return self._executor.spawn(function, *args).get()
+
+    ###########################################################################
+    # Connection handling
+    ###########################################################################
+    @property
+    def client_host(self):
+        " Host address of the client of the current connection "
+        return getattr(self._client, 'host', None)
+
+    @property
+    def client_port(self):
+        " Port of the client of the current connection "
+        return getattr(self._client, 'port', None)
+
+    def __call__(self, sock, address):
+        """
+        Connection handler, called by the StreamServer for every new
+        connection (TCP or Unix domain socket).
+
+        Unlike the mprpc implementation, this will process all requests
+        that are available on the socket, so clients may pipeline requests
+        (send multiple requests before reading the responses). Responses are
+        sent in the order of the requests.
+        """
+        if sock.family == socket.AF_UNIX:
+            address = UNIX_SOCKET_CLIENT_ADDR
+        else:
+            # Responses to pipelined requests must not wait for the ACK of
+            # the previous response
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._client.host, self._client.port = address[0], address[1]
+        unpacker = msgpack.Unpacker(**RPC_UNPACK_PARAMS)
+        packer = msgpack.Packer(**RPC_PACK_PARAMS)
+        try:
+            while True:
+                data = sock.recv(RPC_RECV_SIZE)
+                if not data:
+                    break
+                unpacker.feed(data)
+                responses = []
+                for request in unpacker:
+                    response = self._handle_request(request)
+                    try:
+                        responses.append(packer.pack(response))
+                    except Exception as ex:
+                        responses.append(packer.pack((
+                            MSGPACKRPC_RESPONSE, response[1],
+                            "Unable to serialize result: {}".format(ex), None
+                        )))
+                    if response[1] == -1:
+                        # Reset the unpacker, it may contain garbage data
+                        unpacker = msgpack.Unpacker(**RPC_UNPACK_PARAMS)
+                        break
+                if responses:
+                    sock.sendall(b''.join(responses))
+        finally:
+            sock.close()
+
+    def _handle_request(self, request):
+        """
+        Execute a single msgpack-rpc request and return the response tuple.
+        """
+        if not isinstance(request, (tuple, list)) \
+                or len(request) != 4 \
+                or request[0] != MSGPACKRPC_REQUEST:
+            return (MSGPACKRPC_RESPONSE, -1, "Invalid protocol", None)
+        _, msg_id, method_name, args = request
+        method = self._get_rpc_method(method_name)
+        if method is None:
+            return (MSGPACKRPC_RESPONSE, msg_id,
+                    "Method not found: {}".format(method_name), None)
+        # Call statistics are recorded here rather than in the method wrappers
+        # so they cover all RPC methods, including those of the server itself
+        start_time = time.perf_counter()
+        success = False
+        try:
+            result = method(*args)
+            success = True
+            return (MSGPACKRPC_RESPONSE, msg_id, None, result)
+        except Exception as ex:
+            return (MSGPACKRPC_RESPONSE, msg_id, str(ex), None)
+        finally:
+            if self._rpc_stats is not None:
+                self._rpc_stats.record(
+                    method_name, time.perf_counter() - start_time, success)
+
+    def _get_rpc_method(self, method_name):
+        """
+        Return the method that gets called for RPC method_name, or None if
+        there is no such method. Lookups are cached until the method registry
+        is cleared.
+        """
+        method = self._rpc_method_cache.get(method_name)
+        if method is None:
+            if not isinstance(method_name, str) or method_name.startswith('_'):
+                return None
+            method = getattr(self, method_name, None)
+            if not callable(method):
+                return None
+            self._rpc_method_cache[method_name] = method
+        return method
+
     ###########################################################################
     # Diagnostics and introspection
     ###########################################################################
@@ -237,6 +456,51 @@ class MPMServer(RPCServer):
                     and callable(getattr(self, method))
         ]
 
+    def get_rpc_stats(self):
+        """
+        Return call statistics for all RPC methods which were called since
+        the last reset.
+
+        Returns a dictionary method name -> stats. Every stats entry is a
+        dictionary with the keys 'calls' (number of calls), 'errors' (number
+        of calls that raised an exception), and 'mean', 'p50', 'p99', 'max'
+        (latencies in seconds). p50 and p99 are computed from a histogram and
+        are accurate to about 20%.
+
+        Statistics are only collected if 'rpc_stats' is enabled in the [mpm]
+        section of mpm.conf. Otherwise, this raises a RuntimeError.
+        """
+        if self._rpc_stats is None:
+            raise RuntimeError("RPC statistics are disabled (see mpm.conf).")
+        return self._rpc_stats.get_stats()
+
+    def get_init_profile(self):
+        """
+        Return the timings of the most recent initialization phases (the
+        construction of the periph manager at MPM startup, and init() calls),
+        as a list of spans, oldest first. Every span is a dictionary with the
+        keys 'name', 'thread', 'start' (seconds since MPM startup), 'duration'
+        (seconds), 'running' (True if the phase hasn't finished yet) and
+        'children' (list of sub-phases, same format).
+        """
+        return profiler.get_profile()
+
+    def get_wait_stats(self):
+        """
+        Return how long MPM has spent in its wait loops (e.g., for PLL locks)
+        compared to their timeouts. See mpmutils.get_wait_stats() for the
+        format.
+        """
+        return get_wait_stats()
+
+    def reset_rpc_stats(self, token):
+        """
+        Clear all RPC call statistics (see get_rpc_stats()).
+        """
+        self._check_claim(token, "reset_rpc_stats")
+        if self._rpc_stats is not None:
+            self._rpc_stats.reset()
+
     def ping(self, data=None):
         """
         Take in data as argument and send it back
@@ -288,6 +552,7 @@ class MPMServer(RPCServer):
         self._state.claim_status.value = True
         self.periph_manager.claimed = True
         self.periph_manager.claim()
+        self.periph_manager.invalidate_device_info()
         if self.periph_manager.clear_rpc_registry_on_unclaim:
             self._init_rpc_calls(self.periph_manager)
         self._state.lock.release()
@@ -302,6 +567,7 @@ class MPMServer(RPCServer):
             self.periph_manager.set_connection_type("local")
         else:
             self.periph_manager.set_connection_type("remote")
+        self.periph_manager.set_client_addr(self.client_host)
         return self._state.claim_token.value
 
     def reclaim(self, token):
@@ -335,19 +601,20 @@ class MPMServer(RPCServer):
 
         Resets and deinitalizes the periph manager as well.
         """
-        self.log.debug("Releasing claim on session `{}'".format(
-            self.session_id
-        ))
+        self.log.debug("Releasing claim on session `%s'", self.session_id)
         self._state.claim_status.value = False
         self._state.claim_token.value = b''
         self.session_id = None
+        self._abort_uploads()
         if self.periph_manager.clear_rpc_registry_on_unclaim:
             self.clear_method_registry()
         try:
             self.periph_manager.claimed = False
             self.periph_manager.unclaim()
             self.periph_manager.set_connection_type(None)
+            self.periph_manager.set_client_addr(None)
             self.periph_manager.deinit()
+            self.periph_manager.invalidate_device_info()
         except BaseException as ex:
             self._last_error = str(ex)
             self.log.error("deinit() failed: %s", str(ex))
@@ -360,7 +627,9 @@ class MPMServer(RPCServer):
         token
         """
         if self._check_token_valid(token):
-            self._unclaim()
+            # Let a claimed call that is currently executing finish first
+            with self._claimed_call_lock:
+                self._unclaim()
             return True
         self.log.warning("Attempt to unclaim session with invalid token!")
         return False
@@ -372,7 +641,8 @@ class MPMServer(RPCServer):
             self._reset_timer()
         else:
             self.log.warning("A timeout event occured!")
-            self._unclaim()
+            with self._claimed_call_lock:
+                self._unclaim()
 
     def _reset_timer(self):
         """
@@ -420,22 +690,104 @@ class MPMServer(RPCServer):
         """
         Return the contents of the log buffer as a list of str -> str
         dictionaries.
+
+        Only returns records which were not already returned by a previous
+        call to this method.
         """
+        self._check_claim(token, "get_log_buf")
+        log_records = get_main_logger().get_log_buf()
+        self.log.trace("Returning %d log records.", len(log_records))
+        return log_records
+
+    def get_log_buf_since(self, token, seq, max_records):
+        """
+        Return up to max_records log records, starting at sequence number seq.
+
+        Unlike get_log_buf(), this does not remove records from the log buffer,
+        so multiple clients can read the logs independently. The return value
+        is a dictionary of columns, see MPMLogger.get_log_buf_since(). Its
+        'next_seq' value is the seq argument for the next call. To start
+        reading at the oldest available record, pass in 0.
+        """
+        self._check_claim(token, "get_log_buf_since")
+        return get_main_logger().get_log_buf_since(seq, max_records)
+
+    def _check_claim(self, token, method_name):
+        " Raise if token is not valid for calling method_name "
         if not self._check_token_valid(token):
             self.log.warning(
-                "Attempt to read logs without valid claim from {}".format(
-                    self.client_host
-                )
+                "Attempt to call %s() without valid claim from %s",
+                method_name, self.client_host
             )
-            err_msg = "get_log_buf() called without valid claim."
+            err_msg = "{}() called without valid claim.".format(method_name)
             self._last_error = err_msg
             raise RuntimeError(err_msg)
-        log_records = get_main_logger().get_log_buf()
-        self.log.trace("Returning %d log records.", len(log_records))
-        return [
-            {k: str(v) for k, v in iter(record.items())}
-            for record in log_records
-        ]
+
+    ###########################################################################
+    # Batched calls
+    ###########################################################################
+    def batch_call(self, token, calls):
+        """
+        Execute a list of motherboard and daughterboard RPC calls within a
+        single round trip.
+
+        The token is checked and the claim timer is reset only once for the
+        entire batch. Calls are executed in order. A failing call does not
+        abort the batch.
+
+        Arguments:
+        token -- Claim token
+        calls -- List of (method_name, args) pairs, where method_name is the
+                 name of any registered motherboard or daughterboard RPC
+                 method (e.g. 'get_mb_sensor', 'db_0_peek16') and args is a
+                 list of positional arguments (without the token).
+
+        Returns a list with one (success, value) pair per call. On success,
+        value is the return value of the call, on failure, it is a string
+        describing the exception.
+        """
+        if not self._check_token_valid(token):
+            self.log.warning(
+                "Attempt to run batch_call() without valid claim from {}"
+                .format(self.client_host)
+            )
+            err_msg = "batch_call() called without valid claim."
+            self._last_error = err_msg
+            raise RuntimeError(err_msg)
+        self._reset_timer()
+        self.log.trace("Executing batch of %d calls.", len(calls))
+        with self._claimed_call_lock:
+            return self._run_batch(calls)
+
+    def _run_batch(self, calls):
+        " Execute the calls of a batch_call(), see there "
+        results = []
+        for method_name, args in calls:
+            function = self._rpc_functions.get(method_name)
+            if function is None:
+                err_msg = "Unknown method in batch: `{}'".format(method_name)
+                self.log.error(err_msg)
+                self._last_error = err_msg
+                results.append((False, "KeyError: " + err_msg))
+                continue
+            try:
+                if getattr(function, '_blocking', False):
+                    results.append((True, self._run_blocking(function, *args)))
+                else:
+                    results.append((True, function(*args)))
+            except Exception as ex:
+                self.log.error(
+                    "Uncaught exception in batched method %s :%s\n %s ",
+                    method_name, str(ex), traceback.format_exc()
+                )
+                self._last_error = str(ex)
+                results.append(
+                    (False, "{}: {}".format(type(ex).__name__, str(ex))))
+            if not self._state.claim_status.value:
+                self.log.error("Lost claim during batched API call to `%s'!",
+                               method_name)
+                break
+        return results
 
     ###########################################################################
     # Session initialization
@@ -454,12 +806,16 @@ class MPMServer(RPCServer):
             self._last_error = "init() called without valid claim."
             raise RuntimeError("init() called without valid claim.")
         try:
-            result = self.periph_manager.init(args)
+            # Initialization (e.g., JESD bring-up) takes a while, so we run it
+            # in a worker thread to keep serving other calls in the meantime
+            with self._claimed_call_lock, profiler.span("init", root=True):
+                result = self._run_blocking(self.periph_manager.init, args)
         except Exception as ex:
             self._last_error = str(ex)
             self.log.error("init() failed with error: %s", str(ex))
         finally:
-            self.log.debug("init() result: {}".format(result))
+            self.periph_manager.invalidate_device_info()
+            self.log.debug("init() result: %s", result)
         return result
 
     ###########################################################################
@@ -469,16 +825,10 @@ class MPMServer(RPCServer):
         """
         Clear all the methods in the RPC server method cache.
         """
-        # RPCServer caches RPC methods, but that cache is not accessible here
-        # (because Cython). Re-running `RPCServer.__init__` clears that cache,
-        # and allows us to register new RPC methods.
-        # A note on maintenance: This has been deemed safe through inspection of
-        # the RPCServer source code. However, this is not typical Python, and
-        # changes in future versions of RPCServer may cause issues.
-        super(MPMServer, self).__init__(
-            pack_params={'use_bin_type': True},
-            unpack_params={'max_buffer_size': 50000000, 'raw': False},
-        )
+        # Requests are dispatched by __call__(), which uses our own method
+        # cache, so there is no need to touch the (inaccessible) method cache
+        # of RPCServer.
+        self._rpc_method_cache = {}
 
     def reset_mgr(self):
         """
@@ -487,7 +837,8 @@ class MPMServer(RPCServer):
         self.log.info("Resetting peripheral manager.")
         self.periph_manager.tear_down()
         self.periph_manager = None
-        self.periph_manager = self._mgr_generator()
+        with profiler.span("periph manager ctor", root=True):
+            self.periph_manager = self._mgr_generator()
         self._init_rpc_calls(self.periph_manager)
         # Clear the method cache in order to remove stale references to
         # methods from the old peripheral manager (the one before reset)
@@ -507,53 +858,179 @@ class MPMServer(RPCServer):
                 )
             self.log.error(self._last_error)
             raise RuntimeError("Attempt to update component without valid claim.")
-        with self._timeout_disabler():
-            result = self.periph_manager.update_component(file_metadata_l, data_l)
+        with self._timeout_disabler(), self._claimed_call_lock:
+            # Writing files and loading images or overlays takes a while, so
+            # this runs in a worker thread. Resetting the peripheral manager
+            # (see below) is done here, because it replaces the RPC methods.
+            result = self._run_blocking(
+                self.periph_manager.update_component, file_metadata_l, data_l)
             if not result:
                 component_ids = [metadata['id'] for metadata in file_metadata_l]
                 raise RuntimeError("Failed to update components: {}".format(component_ids))
 
-            # Check if we need to reset the peripheral manager
-            reset_now = False
-            for metadata, data in zip(file_metadata_l, data_l):
-                # Make sure the component is in the updateable_components
-                component_id = metadata['id']
-                if component_id in self.periph_manager.updateable_components:
-                    # Check if that updating that component means the PM should be reset
-                    if self.periph_manager.updateable_components[component_id]['reset']:
-                        reset_now = True
-                else:
-                    self.log.debug("ID {} not in updateable components ({})".format(
-                        component_id, self.periph_manager.updateable_components))
+            self._reset_mgr_after_update(file_metadata_l)
+
+        self.log.debug("End of update_component")
+        self._reset_timer()
+
+    def _reset_mgr_after_update(self, file_metadata_l):
+        """
+        Reset the peripheral manager if any of the updated components require
+        it.
+        """
+        # Check if we need to reset the peripheral manager
+        reset_now = False
+        for metadata in file_metadata_l:
+            # Make sure the component is in the updateable_components
+            component_id = metadata['id']
+            if component_id in self.periph_manager.updateable_components:
+                # Check if that updating that component means the PM should be reset
+                if self.periph_manager.updateable_components[component_id]['reset']:
+                    reset_now = True
+            else:
+                self.log.debug("ID %s not in updateable components (%s)",
+                               component_id,
+                               self.periph_manager.updateable_components)
 
+        try:
+            self.log.trace("Reset after updating component? %s", reset_now)
+            if reset_now:
+                self.reset_mgr()
+                self.log.debug("Reset the periph manager")
+        except Exception as ex:
+            self.log.error(
+                "Error in update_component while resetting: {}".format(
+                    ex
+                ))
+            self._last_error = str(ex)
+
+    ###########################################################################
+    # Chunked component upload
+    ###########################################################################
+    def begin_upload(self, token, file_metadata):
+        """
+        Start a chunked component upload. This is an alternative to
+        update_component() for large files: The file is sent in chunks using
+        upload_chunk(), and is written to disk as it comes in, so it never
+        needs to be held in memory as a whole.
+
+        :param file_metadata: Dictionary of strings containing metadata, same
+                              as for update_component()
+        Returns an upload ID, which is passed to upload_chunk() and
+        finish_upload().
+        """
+        self._check_claim(token, "begin_upload")
+        self._reset_timer()
+        upload = self.periph_manager.start_component_upload(file_metadata)
+        upload_id = ''.join(
+            choice(ascii_letters + digits) for _ in range(TOKEN_LEN))
+        self._uploads[upload_id] = upload
+        self.log.debug("Starting upload %s of component `%s'",
+                       upload_id, file_metadata['id'])
+        return upload_id
+
+    def upload_chunk(self, token, upload_id, data):
+        """
+        Append a chunk of binary data to the upload upload_id (see
+        begin_upload()). Returns the number of bytes received so far.
+        """
+        self._check_claim(token, "upload_chunk")
+        self._reset_timer()
+        upload = self._get_upload(upload_id)
+        try:
+            upload.write(data)
+        except Exception as ex:
+            self._last_error = str(ex)
+            self.log.error("Writing to upload %s failed: %s", upload_id, str(ex))
+            del self._uploads[upload_id]
+            upload.abort()
+            raise
+        return upload.size
+
+    def finish_upload(self, token, upload_id):
+        """
+        Complete the upload upload_id (see begin_upload()): Verify the MD5
+        hash, if one was given in the metadata, and update the component.
+        """
+        self._check_claim(token, "finish_upload")
+        upload = self._get_upload(upload_id)
+        del self._uploads[upload_id]
+        self.log.debug("Finishing upload %s (%d bytes)", upload_id, upload.size)
+        with self._timeout_disabler(), self._claimed_call_lock:
             try:
-                self.log.trace("Reset after updating component? {}".format(reset_now))
-                if reset_now:
-                    self.reset_mgr()
-                    self.log.debug("Reset the periph manager")
+                self._run_blocking(
+                    self.periph_manager.finish_component_upload, upload)
             except Exception as ex:
-                self.log.error(
-                    "Error in update_component while resetting: {}".format(
-                        ex
-                    ))
                 self._last_error = str(ex)
-
-        self.log.debug("End of update_component")
+                self.log.error("Failed to update component `%s': %s",
+                               upload.metadata['id'], str(ex))
+                raise
+            self._reset_mgr_after_update([upload.metadata])
         self._reset_timer()
 
+    def _get_upload(self, upload_id):
+        " Return the ComponentUpload object for upload_id "
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            err_msg = "Unknown upload ID: `{}'".format(upload_id)
+            self._last_error = err_msg
+            raise KeyError(err_msg)
+        return upload
+
+    def _abort_uploads(self):
+        " Abort all pending uploads and remove their files "
+        for upload_id, upload in self._uploads.items():
+            self.log.warning("Aborting incomplete upload %s of component `%s'",
+                             upload_id, upload.metadata['id'])
+            try:
+                upload.abort()
+            except OSError as ex:
+                self.log.error("Failed to remove `%s': %s",
+                               upload.filepath, str(ex))
+        self._uploads = {}
+
 
 ###############################################################################
 # Process control
 ###############################################################################
+def _make_unix_listener(path):
+    """
+    Return a listening Unix domain socket, bound to path. A stale socket file
+    from a previous run gets removed first.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(StreamServer.backlog or 256)
+    return listener
+
+
 def _rpc_server_process(shared_state, port, default_args):
     """
     This is the actual process that's running the RPC server.
+
+    The RPC server is reachable via TCP on the given port, and, unless
+    disabled in mpm.conf, via a Unix domain socket for local clients. Both
+    listeners share the same MPMServer object, and thus the same claim.
     """
+    log = get_main_logger().getChild('RPCProcess')
     connections = Pool(1000)
-    server = StreamServer(
-        ('0.0.0.0', port),
-        handle=MPMServer(shared_state, default_args),
-        spawn=connections)
+    handler = MPMServer(shared_state, default_args)
+    servers = [StreamServer(('0.0.0.0', port), handle=handler, spawn=connections)]
+    unix_socket_path = prefs.get_prefs().get('mpm', 'rpc_unix_socket')
+    if unix_socket_path:
+        try:
+            servers.append(StreamServer(
+                _make_unix_listener(unix_socket_path),
+                handle=handler,
+                spawn=connections))
+            log.debug("Serving RPC on Unix domain socket %s", unix_socket_path)
+        except OSError as ex:
+            log.warning("Unable to open Unix domain socket %s: %s",
+                        unix_socket_path, str(ex))
     # catch signals and stop the stream server
     # Previously, the signal callbacks simply called server.stop()
     # gevent doesn't like this because server.stop() may block waiting
@@ -561,12 +1038,17 @@ def _rpc_server_process(shared_state, port, default_args):
     stop_event = threading.Event()
     def stop_worker():
         stop_event.wait()
-        server.stop()
+        for server in servers:
+            server.stop()
+        if unix_socket_path and os.path.exists(unix_socket_path):
+            os.unlink(unix_socket_path)
         sys.exit(0)
     threading.Thread(target=stop_worker, daemon=True).start()
     signal(signal.SIGTERM, lambda *args: stop_event.set())
     signal(signal.SIGINT, lambda *args: stop_event.set())
-    server.serve_forever()
+    for server in servers[1:]:
+        server.start()
+    servers[0].serve_forever()
 
 
 def spawn_rpc_process(state, udp_port, default_args):
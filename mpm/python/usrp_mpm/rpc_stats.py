@@ -0,0 +1,128 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+RPC call statistics: Call counters and latency histograms per RPC method
+"""
+
+import math
+import threading
+
+# Latency histogram buckets are logarithmically spaced: Bucket n covers
+# latencies up to HIST_MIN_LATENCY * HIST_BUCKET_FACTOR**n seconds, i.e.,
+# every bucket is ~19% wider than the previous one.
+HIST_MIN_LATENCY = 1e-6
+HIST_BUCKETS_PER_OCTAVE = 4
+HIST_BUCKET_FACTOR = 2 ** (1 / HIST_BUCKETS_PER_OCTAVE)
+# Enough buckets to cover latencies up to ~134 seconds. Anything slower ends
+# up in the last bucket.
+HIST_NUM_BUCKETS = 27 * HIST_BUCKETS_PER_OCTAVE + 1
+
+
+def _get_bucket_index(latency):
+    " Return the histogram bucket index for a latency value (in seconds) "
+    if latency <= HIST_MIN_LATENCY:
+        return 0
+    index = math.ceil(
+        math.log2(latency / HIST_MIN_LATENCY) * HIST_BUCKETS_PER_OCTAVE)
+    return min(index, HIST_NUM_BUCKETS - 1)
+
+
+def _get_bucket_limit(index):
+    " Return the upper latency limit of a histogram bucket (in seconds) "
+    return HIST_MIN_LATENCY * HIST_BUCKET_FACTOR ** index
+
+
+class RPCMethodStats(object):
+    """
+    Call counter and latency histogram for a single RPC method.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.histogram = [0] * HIST_NUM_BUCKETS
+
+    def record(self, latency, success):
+        " Add a single call "
+        self.calls += 1
+        if not success:
+            self.errors += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.histogram[_get_bucket_index(latency)] += 1
+
+    def get_percentile(self, percentile):
+        """
+        Return the latency (in seconds) below which the given percentage of
+        calls completed. This is the upper limit of the corresponding
+        histogram bucket, but never more than the max latency. The last bucket
+        has no upper limit.
+        """
+        if not self.calls:
+            return 0.0
+        threshold = self.calls * percentile / 100
+        count = 0
+        for index, bucket_count in enumerate(self.histogram):
+            count += bucket_count
+            if count >= threshold:
+                break
+        if index == HIST_NUM_BUCKETS - 1:
+            return self.max_latency
+        return min(_get_bucket_limit(index), self.max_latency)
+
+    def to_dict(self):
+        " Summarize these stats into a dictionary "
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'mean': self.total_latency / self.calls if self.calls else 0.0,
+            'p50': self.get_percentile(50),
+            'p99': self.get_percentile(99),
+            'max': self.max_latency,
+        }
+
+
+class RPCStats(object):
+    """
+    Collects RPCMethodStats for all RPC methods. Thread-safe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def record(self, method_name, latency, success):
+        """
+        Add a single call.
+
+        Arguments:
+        method_name -- Name of the RPC method
+        latency -- Time it took to execute the call, in seconds
+        success -- False if the call raised an exception
+        """
+        with self._lock:
+            method_stats = self._methods.get(method_name)
+            if method_stats is None:
+                method_stats = RPCMethodStats()
+                self._methods[method_name] = method_stats
+            method_stats.record(latency, success)
+
+    def get_stats(self):
+        """
+        Return a dictionary method name -> stats dictionary, which has the
+        keys 'calls', 'errors', 'mean', 'p50', 'p99' and 'max'. All latencies
+        are in seconds.
+        """
+        with self._lock:
+            return {
+                method_name: method_stats.to_dict()
+                for method_name, method_stats in self._methods.items()
+            }
+
+    def reset(self):
+        " Clear all stats "
+        with self._lock:
+            self._methods = {}
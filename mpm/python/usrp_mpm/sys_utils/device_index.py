@@ -0,0 +1,121 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Process-wide index of device lookups (UIO, GPIO, nvmem, spidev, thermal)
+
+Finding a device by its label or other identifiers requires scanning sysfs,
+which is slow, and happens many times during MPM initialization. This module
+caches the results of these lookups. The cache is invalidated when device
+tree overlays are applied or removed (see dtoverlay), or when udev reports
+that devices of one of the indexed subsystems were added or removed.
+"""
+
+import os
+import threading
+import pyudev
+
+# udev subsystems of the devices stored in the index
+INDEXED_SUBSYSTEMS = ('uio', 'gpio', 'nvmem', 'spidev', 'thermal')
+
+_lock = threading.RLock()
+# Map (kind, key) -> cached lookup result
+_index = {}
+# pyudev context which is shared by all lookups
+_context = None
+# udev monitor which is used to detect added or removed devices. False if
+# monitoring is not available. The monitor socket must not be shared between
+# processes, so we remember which process created it.
+_monitor = None
+_monitor_pid = None
+
+def get_udev_context():
+    """
+    Return a pyudev.Context object which is shared within this process.
+    """
+    global _context
+    if _context is None:
+        _context = pyudev.Context()
+    return _context
+
+def invalidate(kind=None):
+    """
+    Drop cached lookup results. If kind is given (e.g. 'uio'), only results
+    for that kind of lookup are dropped, otherwise everything.
+    """
+    global _index
+    with _lock:
+        if kind is None:
+            _index = {}
+        else:
+            _index = {
+                index_key: value
+                for index_key, value in _index.items()
+                if index_key[0] != kind
+            }
+
+def _start_monitor():
+    """
+    Start monitoring udev for added or removed devices of the indexed
+    subsystems. If that is not possible, the index is only invalidated
+    explicitly.
+    """
+    global _monitor, _monitor_pid
+    _monitor_pid = os.getpid()
+    try:
+        monitor = pyudev.Monitor.from_netlink(get_udev_context())
+        for subsystem in INDEXED_SUBSYSTEMS:
+            monitor.filter_by(subsystem)
+        monitor.start()
+        _monitor = monitor
+    except Exception:
+        _monitor = False
+
+def _check_udev_events():
+    """
+    Drain pending udev events. If any devices were added or removed, drop the
+    entire index.
+    """
+    if _monitor_pid != os.getpid():
+        _start_monitor()
+        # Devices may have changed while nobody was watching
+        invalidate()
+    if not _monitor:
+        return
+    got_events = False
+    try:
+        while True:
+            device = _monitor.poll(timeout=0)
+            if device is None:
+                break
+            if device.action in ('add', 'remove'):
+                got_events = True
+    except Exception:
+        got_events = True
+    if got_events:
+        invalidate()
+
+def lookup(kind, key, builder):
+    """
+    Return the cached result for the lookup (kind, key). If there is none,
+    call builder() to look it up, and store the result.
+
+    Results which are None are not stored, so lookups for devices which don't
+    exist (yet) are repeated every time.
+
+    Arguments:
+    kind -- Kind of lookup, e.g. 'uio'. See invalidate().
+    key -- Hashable value which identifies the lookup (e.g. the label)
+    builder -- Callable without arguments which does the actual lookup
+    """
+    with _lock:
+        _check_udev_events()
+        index_key = (kind, key)
+        if index_key in _index:
+            return _index[index_key]
+        result = builder()
+        if result is not None:
+            _index[index_key] = result
+        return result
@@ -5,40 +5,58 @@
 #
 """
 Network utilities for MPM
+
+Lookups are served from the process-wide snapshot of the network
+configuration (see net_monitor). Functions which do several lookups accept
+a snapshot argument, so callers can get a consistent view.
 """
-import itertools
+import ipaddress
 import socket
-import pyudev
+import time
 from six import iteritems
-from pyroute2 import IPRoute, IPDB
+from pyroute2 import IPRoute
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.sys_utils.net_monitor import get_snapshot
+
+# Bytes on the wire per UDP datagram on top of the payload: UDP and IPv4
+# headers, Ethernet header and FCS, preamble and inter-frame gap
+UDP_WIRE_OVERHEAD = 8 + 20 + 18 + 20
+# Payload prefix of link probe datagrams, so they can be told apart from
+# other traffic (e.g. in Wireshark)
+LINK_PROBE_PREFIX = b"MPM-ECHO;probe;"
+# Send buffer size for the link probe. It's kept small, so the send rate
+# quickly settles to the link rate.
+LINK_PROBE_SNDBUF = 64 * 1024
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
 
 def get_hostname():
     """Return the current device's hostname"""
     return socket.gethostname()
 
-def get_valid_interfaces(iface_list):
+def get_valid_interfaces(iface_list, snapshot=None):
     """
     Given a list of interfaces (['eth1', 'eth2'] for example), return the
     subset that contains actually valid entries.
-    Interfaces are checked for if they actually exist, and if so, if they're up.
+    Interfaces are checked for if they actually exist, and if so, if they're up
+    and have an IPv4 address.
+
+    Arguments:
+    iface_list -- List of interface names
+    snapshot -- NetSnapshot to use. If omitted, uses the current one.
     """
+    snapshot = snapshot or get_snapshot()
     valid_ifaces = []
-    with IPRoute() as ipr:
-        for iface in iface_list:
-            valid_iface_idx = ipr.link_lookup(ifname=iface)
-            if len(valid_iface_idx) == 0:
-                continue
-            valid_iface_idx = valid_iface_idx[0]
-            link_info = ipr.get_links(valid_iface_idx)[0]
-            if link_info.get_attr('IFLA_OPERSTATE') == 'UP' \
-                    and len(get_iface_addrs(link_info.get_attr('IFLA_ADDRESS'))):
-                assert link_info.get_attr('IFLA_IFNAME') == iface
-                valid_ifaces.append(iface)
+    for iface in iface_list:
+        link_info = snapshot.get_link(iface)
+        if link_info is None:
+            continue
+        if link_info['operstate'] == 'UP' \
+                and snapshot.get_addrs(iface, family=socket.AF_INET):
+            valid_ifaces.append(iface)
     return valid_ifaces
 
 
-def get_iface_info(ifname):
+def get_iface_info(ifname, snapshot=None):
     """
     Given an interface name (e.g. 'eth1'), return a dictionary with the
     following keys:
@@ -47,35 +65,28 @@ def get_iface_info(ifname):
     - mac_addr: MAC address
 
     All values are stored as strings.
+
+    Arguments:
+    ifname -- Interface name
+    snapshot -- NetSnapshot to use. If omitted, uses the current one.
     """
-    def is_bridge(link_info_info):
-        " Returns True if link_info_ is a bridge "
-        return (link_info_info is not None) and \
-                (link_info_info.get_attr('IFLA_INFO_KIND') == 'bridge')
-    try:
-        with IPRoute() as ipr:
-            links = ipr.link_lookup(ifname=ifname)
-            if len(links) == 0:
-                raise LookupError("No interfaces known with name `{}'!"
-                                  .format(ifname))
-            link_info = ipr.get_links(links)[0]
-            link_speed = get_link_speed(ifname)
-    except IndexError:
-        raise LookupError("Could not get links for interface `{}'"
+    snapshot = snapshot or get_snapshot()
+    link_info = snapshot.get_link(ifname)
+    if link_info is None:
+        raise LookupError("No interfaces known with name `{}'!"
                           .format(ifname))
-    mac_addr = link_info.get_attr('IFLA_ADDRESS')
-    ip_addrs = get_iface_addrs(mac_addr)
+    ip_addrs = snapshot.get_addrs(ifname, family=socket.AF_INET)
     return {
-        'mac_addr': mac_addr,
+        'mac_addr': link_info['mac_addr'],
         'ip_addr': ip_addrs[0] if ip_addrs else '',
         'ip_addrs': ip_addrs,
-        'link_speed': link_speed,
-        'bridge': is_bridge(link_info.get_attr('IFLA_LINKINFO')),
-        'mtu': link_info.get_attr('IFLA_MTU'),
+        'link_speed': get_link_speed(ifname, snapshot),
+        'bridge': link_info['kind'] == 'bridge',
+        'mtu': link_info['mtu'],
     }
 
 
-def get_link_speed(ifname):
+def get_link_speed(ifname, snapshot=None):
     """
     Given an interface name (e.g 'eth0'), return link speed
     of that interface as unsigned integer.
@@ -83,10 +94,8 @@ def get_link_speed(ifname):
     The speed is Megabits/sec
     (from kernel at https://www.kernel.org/doc/Documentation/ABI/testing/sysfs-class-net)
     """
-    net_sysfs = [device for device in pyudev.Context().list_devices(subsystem='net')
-                 if device.sys_name == ifname][0]
-
-    speed = net_sysfs.attributes.asint('speed')
+    snapshot = snapshot or get_snapshot()
+    speed = snapshot.get_speed(ifname)
     # FIXME: This sysfs call occasionally returns -1 as the speed if the connection is at all
     #        flaky. Returning 10 Gbs rather than 1 Gbs in this case mitigates negative side
     #        effects in the driver when this occurs on 10GbE ports without breaking mpm
@@ -99,6 +108,65 @@ def get_link_speed(ifname):
     return speed if speed >= 10000 else 1000
 
 
+def probe_link_rate(ifname, dst_addr, dst_port, payload_size, duration):
+    """
+    Estimate the capacity of the interface ifname by sending a timed burst of
+    UDP datagrams to dst_addr:dst_port through it. Once the socket buffer and
+    the NIC queue are full, datagrams can only be sent as fast as the link
+    transmits them, so the rate at which sends complete is the link rate.
+    The first quarter of the burst is spent filling the queues, and is not
+    counted.
+
+    The receiver doesn't need to do anything with the datagrams, but it does
+    receive them, so only use this against a host that asked for it.
+
+    Returns the link rate in bits per second (including Ethernet overhead),
+    or None if the probe failed.
+
+    Arguments:
+    ifname -- Interface to probe, e.g. 'sfp0'
+    dst_addr -- IPv4 address of the remote host
+    dst_port -- UDP port on the remote host
+    payload_size -- Size of the UDP payload. Should be such that the
+                    datagrams fill the MTU.
+    duration -- Duration of the burst in seconds
+    """
+    payload = LINK_PROBE_PREFIX + \
+        b'\0' * max(payload_size - len(LINK_PROBE_PREFIX), 0)
+    wire_size = len(payload) + UDP_WIRE_OVERHEAD
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    except OSError:
+        return None
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE,
+                        ifname.encode('ascii'))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, LINK_PROBE_SNDBUF)
+        start_time = time.monotonic()
+        measure_start_time = start_time + duration / 4
+        end_time = start_time + duration
+        num_bytes = 0
+        now = start_time
+        while now < end_time:
+            # Note: We don't connect() the socket, or ICMP errors from the
+            # remote host would make the next send fail
+            sock.sendto(payload, (dst_addr, dst_port))
+            prev_now, now = now, time.monotonic()
+            if prev_now >= measure_start_time:
+                num_bytes += wire_size
+            elif now >= measure_start_time:
+                measure_start_time = now
+    except OSError as ex:
+        get_logger('probe_link_rate').debug(
+            "Link probe on %s failed: %s", ifname, str(ex))
+        return None
+    finally:
+        sock.close()
+    if now <= measure_start_time or not num_bytes:
+        return None
+    return num_bytes * 8 / (now - measure_start_time)
+
+
 def ip_addr_to_iface(ip_addr, iface_list):
     """
     Return an Ethernet interface (e.g. 'eth1') given an IP address.
@@ -124,14 +192,31 @@ def get_iface_addrs(mac_addr):
     Arguments:
     mac_addr -- A MAC address as a string, input format: "aa:bb:cc:dd:ee:ff"
     """
-    with IPRoute() as ip2:
-        [link_index] = ip2.link_lookup(address=mac_addr)
-        # Only get v4 addresses
-        addresses = [addr.get_attrs('IFA_ADDRESS')
-                     for addr in ip2.get_addr(family=socket.AF_INET)
-                     if addr.get('index', None) == link_index]
-        # flatten possibly nested list
-        return list(itertools.chain.from_iterable(addresses))
+    snapshot = get_snapshot()
+    [link_info] = snapshot.get_links_by_mac(mac_addr)
+    # Only get v4 addresses
+    return snapshot.get_addrs(link_info['ifname'], family=socket.AF_INET)
+
+
+def get_iface_ipv4_networks():
+    """
+    Return a dictionary interface name -> list of IPv4 interfaces, one for
+    every IPv4 address assigned to that interface. The list entries are of
+    type ipaddress.IPv4Interface, so they carry both the address and the
+    netmask (e.g. to check if a remote address is on the same subnet).
+    """
+    snapshot = get_snapshot()
+    iface_networks = {}
+    for index, addr_list in iteritems(snapshot.addrs):
+        link_info = snapshot.links.get(index)
+        if link_info is None:
+            continue
+        for family, addr, prefixlen in addr_list:
+            if family != socket.AF_INET:
+                continue
+            iface_networks.setdefault(link_info['ifname'], []).append(
+                ipaddress.IPv4Interface('{}/{}'.format(addr, prefixlen)))
+    return iface_networks
 
 
 def byte_to_mac(byte_str):
@@ -146,47 +231,40 @@ def get_mac_addr(ip_addr):
     return MAC address of a remote host already discovered
     or None if no host entry was found
     """
-    with IPRoute() as ip2:
-        def _get_local_mac_addr(ip_addr):
-            " Lookup MAC addr of local device "
-            if_addr = ip2.get_addr(
-                match=lambda x: x.get_attr('IFA_ADDRESS') == ip_addr
+    def _get_local_mac_addr(ip_addr):
+        " Lookup MAC addr of local device "
+        snapshot = get_snapshot()
+        if_infos = [
+            snapshot.links[index]
+            for index, addr_list in iteritems(snapshot.addrs)
+            if index in snapshot.links
+            and any(addr == ip_addr for _, addr, _ in addr_list)
+        ]
+        if len(if_infos) == 0:
+            return None
+        if len(if_infos) > 1:
+            get_logger('get_mac_addr').warning(
+                "More than one device with the same IP address `{}' found. "
+                "Picking entry at random.".format(ip_addr)
             )
-            if len(if_addr) == 0:
-                return None
-            if len(if_addr) > 1:
-                get_logger('get_mac_addr').warning(
-                    "More than one device with the same IP address `{}' found. "
-                    "Picking entry at random.".format(ip_addr)
-                )
-            iface_idx = if_addr[0]['index']
-            if_info = ip2.get_links(iface_idx)[0]
-            return if_info.get_attr('IFLA_ADDRESS')
-        def _get_remote_mac_addr(remote_addr):
-            " Basically an ARP lookup "
+        return if_infos[0]['mac_addr']
+    def _get_remote_mac_addr(remote_addr):
+        " Basically an ARP lookup "
+        with IPRoute() as ip2:
             addrs = ip2.get_neighbours(dst=remote_addr)
-            if len(addrs) > 1:
-                get_logger('get_mac_addr').warning(
-                    "More than one device with the same IP address `{}' found. "
-                    "Picking entry at random.".format(ip_addr)
-                )
-            if not addrs:
-                return None
-            return addrs[0].get_attr('NDA_LLADDR')
-        mac_addr = _get_local_mac_addr(ip_addr) or _get_remote_mac_addr(ip_addr)
-        ip2.close()
-        return mac_addr
+        if len(addrs) > 1:
+            get_logger('get_mac_addr').warning(
+                "More than one device with the same IP address `{}' found. "
+                "Picking entry at random.".format(ip_addr)
+            )
+        if not addrs:
+            return None
+        return addrs[0].get_attr('NDA_LLADDR')
+    return _get_local_mac_addr(ip_addr) or _get_remote_mac_addr(ip_addr)
 
 def get_local_ip_addrs(ipv4_only=False):
     """
     Return a set of IP addresses which are bound to local interfaces.
     """
-    with IPDB() as ipdb:
-        return {
-            ip_subnet[0]
-            for ip_subnet_list
-                in [x['ipaddr'] for x in ipdb.interfaces.values()]
-                    for ip_subnet in ip_subnet_list
-            if not ipv4_only or ip_subnet[0].find(':') == -1
-        }
-
+    return set(get_snapshot().get_addrs(
+        family=socket.AF_INET if ipv4_only else None))
@@ -0,0 +1,268 @@
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Process-wide snapshot of the network configuration (links and addresses)
+
+Querying netlink for every lookup means opening a socket and dumping all
+links or addresses of the system, every time. Instead, this module takes one
+snapshot of the links (name, MAC address, operstate, MTU, speed) and the
+addresses, and keeps it up to date from the netlink events of the
+RTNLGRP_LINK, RTNLGRP_IPV4_IFADDR and RTNLGRP_IPV6_IFADDR groups. Pending
+events are applied whenever the snapshot is accessed, so reading it only
+costs a non-blocking poll of the event socket.
+
+If netlink monitoring is not available, every access takes a new snapshot.
+"""
+
+import os
+import select
+import threading
+from pyroute2 import IPRoute
+from pyroute2.netlink.rtnl import \
+    RTMGRP_LINK, RTMGRP_IPV4_IFADDR, RTMGRP_IPV6_IFADDR
+from usrp_mpm.mpmlog import get_logger
+
+# Max number of events that are applied in one go. If there are more, the
+# snapshot is taken again instead.
+MAX_EVENTS_PER_POLL = 256
+
+_lock = threading.RLock()
+# The current NetSnapshot, or None if there is none yet
+_snapshot = None
+# Netlink socket which receives the events. False if monitoring is not
+# available. The socket must not be shared between processes, so we remember
+# which process created it.
+_monitor = None
+_monitor_pid = None
+# Callables which are called with the new snapshot when something changed
+_subscribers = []
+
+class NetSnapshot(object):
+    """
+    Network configuration at one point in time. A snapshot is never modified,
+    when something changes, the current snapshot is replaced. Callers can
+    thus hold on to a snapshot to get a consistent view over multiple
+    lookups.
+
+    Attributes:
+    links -- Map interface index -> link info. The link info is a dictionary
+             with the keys 'index', 'ifname', 'mac_addr', 'operstate', 'mtu'
+             and 'kind' (e.g. 'bridge', or None).
+    addrs -- Map interface index -> list of (family, address, prefixlen)
+    generation -- Increases with every change of the network configuration
+    """
+    def __init__(self, links, addrs, generation):
+        self.links = links
+        self.addrs = addrs
+        self.generation = generation
+        self._indexes = {
+            link_info['ifname']: index for index, link_info in links.items()
+        }
+        # Link speeds are not part of netlink, they are read from sysfs on
+        # demand. Map ifname -> speed
+        self._speeds = {}
+
+    def get_link(self, ifname):
+        """
+        Return the link info of the interface called ifname (e.g. 'eth1'), or
+        None if there is no such interface.
+        """
+        index = self._indexes.get(ifname)
+        return self.links[index] if index is not None else None
+
+    def get_links_by_mac(self, mac_addr):
+        """
+        Return the link infos of all interfaces with the given MAC address.
+        """
+        return [
+            link_info for link_info in self.links.values()
+            if link_info['mac_addr'] == mac_addr
+        ]
+
+    def get_addrs(self, ifname=None, family=None):
+        """
+        Return the list of addresses (as strings) of the interface called
+        ifname, or of all interfaces if ifname is None.
+
+        Arguments:
+        ifname -- Interface name, e.g. 'eth1'
+        family -- Only return addresses of this family (e.g. socket.AF_INET)
+        """
+        if ifname is None:
+            addr_lists = list(self.addrs.values())
+        else:
+            addr_lists = [self.addrs.get(self._indexes.get(ifname), [])]
+        return [
+            addr
+            for addr_list in addr_lists
+            for addr_family, addr, _ in addr_list
+            if family is None or addr_family == family
+        ]
+
+    def get_speed(self, ifname):
+        """
+        Return the raw link speed of the interface called ifname in Mbps, as
+        reported by the driver. Returns -1 if the driver doesn't know it
+        (e.g., the link is down). Raises an IndexError if there is no such
+        interface.
+        """
+        if ifname not in self._indexes:
+            raise IndexError("No interface called `{}'".format(ifname))
+        if ifname not in self._speeds:
+            try:
+                with open('/sys/class/net/{}/speed'.format(ifname)) as speed:
+                    self._speeds[ifname] = int(speed.read().strip())
+            except (OSError, ValueError):
+                self._speeds[ifname] = -1
+        return self._speeds[ifname]
+
+def _parse_link(msg):
+    " Turn an RTM_NEWLINK message into a link info dictionary "
+    link_info = msg.get_attr('IFLA_LINKINFO')
+    return {
+        'index': msg['index'],
+        'ifname': msg.get_attr('IFLA_IFNAME'),
+        'mac_addr': msg.get_attr('IFLA_ADDRESS'),
+        'operstate': msg.get_attr('IFLA_OPERSTATE'),
+        'mtu': msg.get_attr('IFLA_MTU'),
+        'kind': link_info.get_attr('IFLA_INFO_KIND') \
+                if link_info is not None else None,
+    }
+
+def _parse_addr(msg):
+    " Turn an RTM_NEWADDR/RTM_DELADDR message into an address tuple "
+    return (msg['family'], msg.get_attr('IFA_ADDRESS'), msg['prefixlen'])
+
+def _take_snapshot(prev_snapshot):
+    """
+    Dump all links and addresses, and return them as a new NetSnapshot. If
+    nothing changed compared to prev_snapshot, returns prev_snapshot.
+    """
+    with IPRoute() as ipr:
+        links = {msg['index']: _parse_link(msg) for msg in ipr.get_links()}
+        addrs = {}
+        for msg in ipr.get_addr():
+            addrs.setdefault(msg['index'], []).append(_parse_addr(msg))
+    if prev_snapshot is None:
+        return NetSnapshot(links, addrs, 0)
+    if links == prev_snapshot.links and addrs == prev_snapshot.addrs:
+        return prev_snapshot
+    return NetSnapshot(links, addrs, prev_snapshot.generation + 1)
+
+def apply_events(snapshot, events):
+    """
+    Return a new snapshot, which is snapshot with the netlink messages in
+    events applied. If none of the events changes anything, returns snapshot
+    itself.
+    """
+    links = dict(snapshot.links)
+    addrs = dict(snapshot.addrs)
+    changed = False
+    for msg in events:
+        event = msg['event']
+        index = msg['index']
+        if event == 'RTM_NEWLINK':
+            link_info = _parse_link(msg)
+            if links.get(index) != link_info:
+                links[index] = link_info
+                changed = True
+        elif event == 'RTM_DELLINK':
+            if index in links or index in addrs:
+                links.pop(index, None)
+                addrs.pop(index, None)
+                changed = True
+        elif event == 'RTM_NEWADDR':
+            addr = _parse_addr(msg)
+            if addr not in addrs.get(index, []):
+                addrs[index] = addrs.get(index, []) + [addr]
+                changed = True
+        elif event == 'RTM_DELADDR':
+            addr = _parse_addr(msg)
+            if addr in addrs.get(index, []):
+                addrs[index] = [x for x in addrs[index] if x != addr]
+                changed = True
+    if not changed:
+        return snapshot
+    return NetSnapshot(links, addrs, snapshot.generation + 1)
+
+def _start_monitor():
+    """
+    Subscribe to netlink events for links and addresses. If that is not
+    possible, a new snapshot is taken for every access.
+    """
+    global _monitor, _monitor_pid
+    _monitor_pid = os.getpid()
+    try:
+        monitor = IPRoute()
+        monitor.bind(
+            groups=RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR)
+        _monitor = monitor
+    except Exception as ex:
+        get_logger('net_monitor').warning(
+            "Cannot monitor netlink events: %s", str(ex))
+        _monitor = False
+
+def _read_events():
+    """
+    Return the list of pending netlink events, or None if the snapshot needs
+    to be taken again (because monitoring is not available, or events were
+    lost).
+    """
+    if not _monitor:
+        return None
+    events = []
+    try:
+        while select.select([_monitor], [], [], 0)[0]:
+            events += _monitor.get()
+            if len(events) > MAX_EVENTS_PER_POLL:
+                return None
+    except Exception:
+        # This includes ENOBUFS, i.e. the kernel dropped events
+        return None
+    return events
+
+def get_snapshot():
+    """
+    Return the current NetSnapshot, with all pending netlink events applied.
+    """
+    global _snapshot
+    with _lock:
+        prev_snapshot = _snapshot
+        if _monitor_pid != os.getpid():
+            # Start monitoring before taking the snapshot, so nothing that
+            # happens in between is lost
+            _start_monitor()
+            _snapshot = _take_snapshot(prev_snapshot)
+        else:
+            events = _read_events()
+            if events is None:
+                _snapshot = _take_snapshot(prev_snapshot)
+            elif events:
+                _snapshot = apply_events(_snapshot, events)
+        snapshot = _snapshot
+        subscribers = list(_subscribers) \
+            if snapshot is not prev_snapshot and prev_snapshot is not None \
+            else []
+    for callback in subscribers:
+        callback(snapshot)
+    return snapshot
+
+def subscribe(callback):
+    """
+    Register callback to be called with the new NetSnapshot whenever the
+    network configuration changed. Note that changes are only noticed when
+    get_snapshot() is called (e.g., by any of the functions in
+    usrp_mpm.sys_utils.net), and that the callback runs on the calling
+    thread.
+    """
+    with _lock:
+        _subscribers.append(callback)
+
+def unsubscribe(callback):
+    " Undo subscribe() "
+    with _lock:
+        if callback in _subscribers:
+            _subscribers.remove(callback)
@@ -8,12 +8,38 @@ Access to GPIOs mapped into the PS via sysfs
 """
 
 import os
+import re
+import struct
+import fcntl
 from builtins import object
 import pyudev
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.sys_utils import device_index
 
 GPIO_SYSFS_BASE_DIR = '/sys/class/gpio'
 GPIO_SYSFS_VALUEFILE = 'value'
+GPIO_CHARDEV_BASE_DIR = '/dev'
+
+# GPIO character device ABI (v1), see include/uapi/linux/gpio.h
+GPIOHANDLES_MAX = 64
+GPIOHANDLE_REQUEST_INPUT = 1 << 0
+GPIOHANDLE_REQUEST_OUTPUT = 1 << 1
+# struct gpiohandle_request: lineoffsets, flags, default_values,
+# consumer_label, lines, fd
+GPIOHANDLE_REQUEST_FMT = '{0}II{0}B32sIi'.format(GPIOHANDLES_MAX)
+# struct gpiohandle_data: values
+GPIOHANDLE_DATA_FMT = '{}B'.format(GPIOHANDLES_MAX)
+
+def _iowr(type_, number, size):
+    " Equivalent of the _IOWR() macro "
+    return (3 << 30) | (size << 16) | (type_ << 8) | number
+
+GPIO_GET_LINEHANDLE_IOCTL = \
+    _iowr(0xB4, 0x03, struct.calcsize(GPIOHANDLE_REQUEST_FMT))
+GPIOHANDLE_GET_LINE_VALUES_IOCTL = \
+    _iowr(0xB4, 0x08, struct.calcsize(GPIOHANDLE_DATA_FMT))
+GPIOHANDLE_SET_LINE_VALUES_IOCTL = \
+    _iowr(0xB4, 0x09, struct.calcsize(GPIOHANDLE_DATA_FMT))
 
 def get_all_gpio_devs(parent_dev=None):
     """
@@ -34,7 +60,7 @@ def get_all_gpio_devs(parent_dev=None):
     >>> get_all_gpio_devs(parent_dev)
     """
     try:
-        context = pyudev.Context()
+        context = device_index.get_udev_context()
         gpios = [device.sys_name
                  for device in context.list_devices(
                      subsystem="gpio").match_parent(parent_dev)
@@ -67,7 +93,7 @@ def get_gpio_map_info(gpio_dev):
         except ValueError:
             map_info[info_file] = map_info_value
     # Manually add GPIO number
-    context = pyudev.Context()
+    context = device_index.get_udev_context()
     map_info['sys_number'] = int(
         pyudev.Devices.from_name(context, subsystem="gpio", sys_name=gpio_dev).sys_number
     )
@@ -85,11 +111,12 @@ def get_map_data(gpio_dev, path, logger=None):
     map_path = os.path.join(GPIO_SYSFS_BASE_DIR, path, gpio_dev)
     if not os.path.isfile(map_path):
         if logger:
-            logger.trace("Couldn't find a device tree file to match: `{0}'".format(map_path))
+            logger.trace("Couldn't find a device tree file to match: `%s'",
+                         map_path)
         return None
     map_info_value = open(map_path, 'r').read().strip().rstrip('\x00')
     if logger:
-        logger.trace("File at `{0}' has value `{1}'".format(map_path, map_info_value))
+        logger.trace("File at `%s' has value `%s'", map_path, map_info_value)
     try:
         map_info_value = int(map_info_value, 0)
     except ValueError:
@@ -105,6 +132,29 @@ def find_gpio_device(identifiers, parent_dev=None, logger=None):
     uio_device is something like 'gpio882'.
     map_info is a dictionary with information regarding the GPIO device read
     from the map info sysfs dir.
+
+    Results are cached (see device_index), so repeated lookups with the same
+    identifiers don't need to scan sysfs.
+    """
+    index_key = (
+        tuple(sorted(identifiers.items())),
+        parent_dev.sys_path if parent_dev is not None else None,
+    )
+    result = device_index.lookup(
+        'gpio', index_key,
+        lambda: _find_gpio_device(identifiers, parent_dev, logger))
+    if result is None:
+        if logger:
+            logger.warning("Found no matching gpio device for identifiers `{0}'"
+                           .format(identifiers))
+        return None, None
+    gpio_device, map_info = result
+    return gpio_device, dict(map_info)
+
+def _find_gpio_device(identifiers, parent_dev=None, logger=None):
+    """
+    Implementation of find_gpio_device(), without caching. Returns None if
+    there is no matching device.
     """
     def id_dict_compare(identifiers, gpio_dev, logger=None):
         """
@@ -120,33 +170,41 @@ def find_gpio_device(identifiers, parent_dev=None, logger=None):
 
     gpio_devices = get_all_gpio_devs(parent_dev)
     if logger:
-        logger.trace("Found the following UIO devices: `{0}'".format(','.join(gpio_devices)))
+        logger.trace("Found the following UIO devices: `%s'",
+                     ','.join(gpio_devices))
     for gpio_device in gpio_devices:
         map_info = get_gpio_map_info(gpio_device)
         if logger:
-            logger.trace("{0} has map info: {1}".format(gpio_device, map_info))
+            logger.trace("%s has map info: %s", gpio_device, map_info)
         if id_dict_compare(identifiers, gpio_device, logger):
             if logger:
-                logger.trace("Device matches identifiers: `{0}'".format(gpio_device))
+                logger.trace("Device matches identifiers: `%s'", gpio_device)
             return gpio_device, map_info
-    if logger:
-        logger.warning("Found no matching gpio device for identifiers `{0}'".format(identifiers))
-    return None, None
+    return None
+
+def _get_pin_list(n_gpio, mask):
+    " Return the list of pin indexes which are set in mask "
+    return [x for x in range(n_gpio) if (1<<x) & mask]
 
 class SysFSGPIO(object):
     """
     API for accessing GPIOs mapped into userland via sysfs
+
+    The value files of all GPIOs are opened once during initialization and
+    kept open, so accessing a pin only takes a single read or write.
     """
 
     def __init__(self, identifiers, use_mask, ddr, init_value=0, parent_dev=None):
+        # Map GPIO index -> file descriptor of its value file
+        self._value_fds = {}
         assert (use_mask & ddr) == ddr
         self.log = get_logger("SysFSGPIO")
         self._identifiers = identifiers
         self._use_mask = use_mask
         self._ddr = ddr
         self._init_value = init_value
-        self.log.trace("Generating SysFSGPIO object for identifiers `{}'..."
-                       .format(identifiers))
+        self.log.trace("Generating SysFSGPIO object for identifiers `%s'...",
+                       identifiers)
         self._gpio_dev, self._map_info = \
                 find_gpio_device(identifiers, parent_dev, self.log)
         if self._gpio_dev is None:
@@ -154,8 +212,8 @@ class SysFSGPIO(object):
                 "Could not find GPIO device with identifiers `{}'.".format(identifiers)
             self.log.error(error_msg)
             raise RuntimeError(error_msg)
-        self.log.trace("GPIO base number is {}"
-                       .format(self._map_info.get("sys_number")))
+        self.log.trace("GPIO base number is %s",
+                       self._map_info.get("sys_number"))
         self._base_gpio = self._map_info.get("sys_number")
         self.init(self._map_info['ngpio'],
                   self._base_gpio,
@@ -168,22 +226,40 @@ class SysFSGPIO(object):
         Guarantees that all the devices are created accordingly
 
         E.g., if use_mask & 0x1 is True, it makes sure that 'gpioXXX' is exported.
-        Also sets the DDRs.
+        Also sets the DDRs, and opens the value files.
         """
-        gpio_list = [x for x in range(n_gpio) if (1<<x) & use_mask]
-        self.log.trace("Initializing {} GPIOs...".format(len(gpio_list)))
+        self.close()
+        gpio_list = _get_pin_list(n_gpio, use_mask)
+        self.log.trace("Initializing %s GPIOs...", len(gpio_list))
         for gpio_idx in gpio_list:
             gpio_num = base + gpio_idx
             ddr_out = ddr & (1<<gpio_idx)
             ini_v = init_value & (1<<gpio_idx)
             gpio_path = os.path.join(GPIO_SYSFS_BASE_DIR, 'gpio{}'.format(gpio_num))
             if not os.path.exists(gpio_path):
-                self.log.trace("Creating GPIO path `{}'...".format(gpio_path))
+                self.log.trace("Creating GPIO path `%s'...", gpio_path)
                 open(os.path.join(GPIO_SYSFS_BASE_DIR, 'export'), 'w').write('{}'.format(gpio_num))
             ddr_str = 'out' if ddr_out else 'in'
             ddr_str = 'high' if ini_v else ddr_str
-            self.log.trace("On GPIO path `{}', setting DDR mode to {}.".format(gpio_path, ddr_str))
+            self.log.trace("On GPIO path `%s', setting DDR mode to %s.",
+                           gpio_path, ddr_str)
             open(os.path.join(GPIO_SYSFS_BASE_DIR, gpio_path, 'direction'), 'w').write(ddr_str)
+            self._value_fds[gpio_idx] = os.open(
+                os.path.join(gpio_path, GPIO_SYSFS_VALUEFILE),
+                os.O_RDWR)
+
+    def close(self):
+        """
+        Close the value files. Calling init() will reopen them.
+        """
+        for value_fd in self._value_fds.values():
+            os.close(value_fd)
+        self._value_fds = {}
+
+    def __del__(self):
+        # Owners are expected to call close(), but don't leak the value files
+        # if they don't.
+        self.close()
 
     def set(self, gpio_idx, value=None):
         """
@@ -196,12 +272,8 @@ class SysFSGPIO(object):
             value = 1
         assert (1<<gpio_idx) & self._use_mask
         assert (1<<gpio_idx) & self._ddr
-        gpio_num = self._base_gpio + gpio_idx
-        gpio_path = os.path.join(GPIO_SYSFS_BASE_DIR, 'gpio{}'.format(gpio_num))
-        value_path = os.path.join(gpio_path, GPIO_SYSFS_VALUEFILE)
-        self.log.trace("Writing value `{}' to `{}'...".format(value, value_path))
-        assert os.path.exists(value_path)
-        open(value_path, 'w').write('{}'.format(value))
+        self.log.trace("Writing value `%s' to GPIO %d...", value, gpio_idx)
+        os.pwrite(self._value_fds[gpio_idx], b'1' if int(value) else b'0', 0)
 
     def reset(self, gpio_idx):
         """
@@ -221,12 +293,209 @@ class SysFSGPIO(object):
         """
         assert (1<<gpio_idx) & self._use_mask
         assert (1<<gpio_idx) & (~self._ddr)
-        gpio_num = self._base_gpio + gpio_idx
-        gpio_path = os.path.join(GPIO_SYSFS_BASE_DIR, 'gpio{}'.format(gpio_num))
-        value_path = os.path.join(gpio_path, GPIO_SYSFS_VALUEFILE)
-        assert os.path.exists(value_path)
-        read_value = int(open(value_path, 'r').read().strip())
-        self.log.trace("Reading value {} from `{}'...".format(read_value, value_path))
+        read_value = int(os.pread(self._value_fds[gpio_idx], 16, 0))
+        self.log.trace("Reading value %s from GPIO %d...", read_value, gpio_idx)
+        return read_value
+
+    def get_all(self, mask=None):
+        """
+        Read back all input GPIOs (or the ones selected by mask). Returns an
+        integer where bit N is the value of the GPIO at index N. Bits of
+        output GPIOs are zero.
+        """
+        if mask is None:
+            mask = self._use_mask
+        result = 0
+        for gpio_idx, value_fd in self._value_fds.items():
+            if (1<<gpio_idx) & mask & ~self._ddr:
+                if os.pread(value_fd, 16, 0)[0] != ord('0'):
+                    result |= 1 << gpio_idx
+        return result
+
+    def set_all(self, value, mask=None):
+        """
+        Write all output GPIOs (or the ones selected by mask): Bit N of value
+        is written to the GPIO at index N.
+        """
+        if mask is None:
+            mask = self._ddr
+        assert (mask & self._ddr) == mask
+        for gpio_idx, value_fd in self._value_fds.items():
+            if (1<<gpio_idx) & mask:
+                os.pwrite(value_fd, b'1' if (1<<gpio_idx) & value else b'0', 0)
+
+class CharDevGPIO(object):
+    """
+    API for accessing GPIOs through the GPIO character device (/dev/gpiochipN)
+
+    This has the same interface as SysFSGPIO, but all input GPIOs and all
+    output GPIOs are requested as one line handle each. That means
+    get_all() and set_all() only take a single ioctl() each, and all GPIOs
+    are read or written at the same time.
+
+    GPIOs which are exported via sysfs can't be requested through the
+    character device, so this will unexport them.
+    """
+    def __init__(self, identifiers, use_mask, ddr, init_value=0, parent_dev=None):
+        self._in_fd = None
+        self._out_fd = None
+        assert (use_mask & ddr) == ddr
+        self.log = get_logger("CharDevGPIO")
+        self._use_mask = use_mask
+        self._ddr = ddr
+        self._in_pins = []
+        self._out_pins = []
+        # The current values of the outputs (bit N is the GPIO at index N)
+        self._out_value = 0
+        self.log.trace("Generating CharDevGPIO object for identifiers `%s'...",
+                       identifiers)
+        gpio_dev, map_info = find_gpio_device(identifiers, parent_dev, self.log)
+        if gpio_dev is None:
+            error_msg = \
+                "Could not find GPIO device with identifiers `{}'.".format(identifiers)
+            self.log.error(error_msg)
+            raise RuntimeError(error_msg)
+        self._chardev = self._find_chardev(gpio_dev)
+        self.init(map_info['ngpio'], map_info['sys_number'],
+                  use_mask, ddr, init_value)
+
+    def _find_chardev(self, gpio_dev):
+        """
+        Return the path to the character device of the GPIO chip which has the
+        sysfs name gpio_dev (e.g. 'gpiochip882').
+        """
+        device_path = os.path.join(GPIO_SYSFS_BASE_DIR, gpio_dev, 'device')
+        for entry in os.listdir(device_path):
+            if re.match(r'^gpiochip\d+$', entry):
+                chardev = os.path.join(GPIO_CHARDEV_BASE_DIR, entry)
+                self.log.trace("Using GPIO character device %s", chardev)
+                return chardev
+        raise RuntimeError(
+            "Could not find GPIO character device for `{}'.".format(gpio_dev))
+
+    def _request_lines(self, pins, flags, values=0):
+        """
+        Request a line handle for the given GPIO indexes. Returns its file
+        descriptor.
+        """
+        assert len(pins) <= GPIOHANDLES_MAX
+        pad = [0] * (GPIOHANDLES_MAX - len(pins))
+        request = struct.pack(
+            GPIOHANDLE_REQUEST_FMT,
+            *(pins + pad),
+            flags,
+            *([int(bool((1<<x) & values)) for x in pins] + pad),
+            b'usrp_hwd',
+            len(pins),
+            -1)
+        chip_fd = os.open(self._chardev, os.O_RDONLY)
+        try:
+            request = fcntl.ioctl(chip_fd, GPIO_GET_LINEHANDLE_IOCTL, request)
+        finally:
+            os.close(chip_fd)
+        return struct.unpack(GPIOHANDLE_REQUEST_FMT, request)[-1]
+
+    def init(self, n_gpio, base, use_mask, ddr, init_value=0):
+        """
+        Request the line handles for all inputs and outputs. Outputs are set
+        to init_value.
+        """
+        self.close()
+        self._use_mask = use_mask
+        self._ddr = ddr
+        # Any bit in init_value turns that pin into an output (like the 'high'
+        # direction of SysFSGPIO)
+        out_mask = (ddr | init_value) & use_mask
+        self._in_pins = _get_pin_list(n_gpio, use_mask & ~out_mask)
+        self._out_pins = _get_pin_list(n_gpio, out_mask)
+        self.log.trace("Initializing %d input and %d output GPIOs...",
+                       len(self._in_pins), len(self._out_pins))
+        for gpio_idx in self._in_pins + self._out_pins:
+            gpio_num = base + gpio_idx
+            if os.path.exists(os.path.join(
+                    GPIO_SYSFS_BASE_DIR, 'gpio{}'.format(gpio_num))):
+                self.log.trace("Unexporting GPIO %d", gpio_num)
+                with open(os.path.join(GPIO_SYSFS_BASE_DIR, 'unexport'), 'w') \
+                        as unexport_file:
+                    unexport_file.write('{}'.format(gpio_num))
+        self._out_value = init_value & out_mask
+        if self._in_pins:
+            self._in_fd = self._request_lines(
+                self._in_pins, GPIOHANDLE_REQUEST_INPUT)
+        if self._out_pins:
+            self._out_fd = self._request_lines(
+                self._out_pins, GPIOHANDLE_REQUEST_OUTPUT, self._out_value)
+
+    def close(self):
+        """
+        Release the line handles. Calling init() will request them again.
+        """
+        for line_fd in (self._in_fd, self._out_fd):
+            if line_fd is not None:
+                os.close(line_fd)
+        self._in_fd = None
+        self._out_fd = None
+
+    def __del__(self):
+        # Owners are expected to call close(), but don't leak the line handles
+        # if they don't.
+        self.close()
+
+    def get_all(self, mask=None):
+        """
+        Read back all input GPIOs. Returns an integer where bit N is the value
+        of the GPIO at index N. Bits of output GPIOs are zero.
+
+        If mask is given, bits which are not set in mask are also zero.
+        """
+        if mask is None:
+            mask = self._use_mask
+        data = fcntl.ioctl(self._in_fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL,
+                           bytes(GPIOHANDLES_MAX))
+        result = 0
+        for gpio_idx, value in zip(self._in_pins, data):
+            if value:
+                result |= 1 << gpio_idx
+        return result & mask
+
+    def set_all(self, value, mask=None):
+        """
+        Write all output GPIOs (or the ones selected by mask): Bit N of value
+        is written to the GPIO at index N.
+        """
+        if mask is None:
+            mask = self._ddr
+        assert (mask & self._ddr) == mask
+        self._out_value = (self._out_value & ~mask) | (value & mask)
+        data = bytes(int(bool((1<<x) & self._out_value)) for x in self._out_pins)
+        fcntl.ioctl(self._out_fd, GPIOHANDLE_SET_LINE_VALUES_IOCTL,
+                    data.ljust(GPIOHANDLES_MAX, b'\0'))
+
+    def set(self, gpio_idx, value=None):
+        """
+        Assert a GPIO at given index. See also SysFSGPIO.set().
+        """
+        if value is None:
+            value = 1
+        assert (1<<gpio_idx) & self._use_mask
+        assert (1<<gpio_idx) & self._ddr
+        self.log.trace("Writing value `%s' to GPIO %d...", value, gpio_idx)
+        self.set_all((1<<gpio_idx) if int(value) else 0, 1<<gpio_idx)
+
+    def reset(self, gpio_idx):
+        """
+        Deassert a GPIO at given index. See also SysFSGPIO.reset().
+        """
+        self.set(gpio_idx, value=0)
+
+    def get(self, gpio_idx):
+        """
+        Read back a GPIO at given index. See also SysFSGPIO.get().
+        """
+        assert (1<<gpio_idx) & self._use_mask
+        assert (1<<gpio_idx) & (~self._ddr)
+        read_value = int(bool(self.get_all(1<<gpio_idx)))
+        self.log.trace("Reading value %s from GPIO %d...", read_value, gpio_idx)
         return read_value
 
 class GPIOBank:
@@ -250,20 +519,31 @@ class GPIOBank:
             0x00)       # All pins are readable
     >>> if gpio_bank.get_all() == 3:
         print("Pins 0 and 1 are high!")
+
+    By default, the pins are accessed through sysfs (see SysFSGPIO). Pass
+    gpio_cls=CharDevGPIO to use the GPIO character device instead, which
+    reads or writes all pins of the bank with a single system call.
     """
-    def __init__(self, uio_identifiers, offset, usemask, ddr):
+    def __init__(self, uio_identifiers, offset, usemask, ddr,
+                 gpio_cls=SysFSGPIO):
         self._gpiosize = bin(usemask).count("1")
         # Make sure the pins are all one:
         assert (1 << self._gpiosize) == usemask+1
         self._offset = offset
         self._ddr = ddr
         self._usemask = usemask
-        self._gpios = SysFSGPIO(
+        self._gpios = gpio_cls(
             uio_identifiers,
             self._usemask << self._offset,
             self._ddr << self._offset
         )
 
+    def close(self):
+        """
+        Release the underlying GPIO files
+        """
+        self._gpios.close()
+
     def set(self, index, value=None):
         """
         Set a pin by index
@@ -273,11 +553,18 @@ class GPIOBank:
 
     def reset_all(self):
         """
-        Clear all pins
+        Clear all output pins
         """
-        for i in range(self._gpiosize):
-            if self._ddr & i:
-                self._gpios.reset(self._offset+i)
+        self.set_all(0)
+
+    def set_all(self, value):
+        """
+        Write all output pins at once: Bit N of value is written to pin N.
+        Bits of input pins are ignored.
+        """
+        self._gpios.set_all(
+            (value & self._ddr) << self._offset,
+            (self._ddr & self._usemask) << self._offset)
 
     def reset(self, index):
         """
@@ -291,13 +578,17 @@ class GPIOBank:
 
     def get_all(self):
         """
-        Read back all pins. Pins with a DDR value of 1 ("output") are left zero.
+        Read back all input pins. Pins with a DDR value of 1 ("output") are
+        skipped, the values of the input pins are packed together, with the
+        lowest pin in the most significant bit (this is the order in which
+        bist.gpio_set_all() writes patterns).
         """
+        bank_value = self._gpios.get_all(self._usemask << self._offset) \
+            >> self._offset
         result = 0
         for i in range(self._gpiosize):
             if not (1<<i) & self._ddr:
-                value = self._gpios.get(self._offset + i)
-                result = (result << 1) | value
+                result = (result << 1) | ((bank_value >> i) & 1)
         return result
 
     def get(self, index):
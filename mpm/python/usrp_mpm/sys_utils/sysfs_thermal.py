@@ -6,7 +6,15 @@
 sysfs thermal sensors API
 """
 
+import collections
+import os
+import threading
+import time
 import pyudev
+from usrp_mpm.sys_utils import device_index
+
+# Number of samples per sensor which ThermalSampler keeps
+THERMAL_HISTORY_LEN = 60
 
 def read_sysfs_sensors_value(sensor_type, data_probe, subsystem, attribute):
     """
@@ -41,6 +49,28 @@ def read_thermal_sensors_value(sensor_type, data_probe, subsystem='thermal', att
     """
     return read_sysfs_sensors_value(sensor_type, data_probe, subsystem, attribute)
 
+def get_thermal_sensor_path(sensor_type, data_probe, subsystem='thermal', attribute='type'):
+    """
+    Return the sysfs path of the file which contains the value of a sensor
+    (e.g. /sys/devices/virtual/thermal/thermal_zone0/temp). If there are
+    multiple matching sensors, the first one is used. The path is looked up
+    once and then cached (see device_index).
+
+    See read_thermal_sensor_value() for the arguments.
+    """
+    def _find_path():
+        " Return the path of the first matching sensor, or None "
+        for device in device_index.get_udev_context() \
+                .list_devices(subsystem=subsystem) \
+                .match_attribute(attribute, sensor_type):
+            return os.path.join(device.sys_path, data_probe)
+        return None
+    sensor_path = device_index.lookup(
+        'thermal', (sensor_type, data_probe, subsystem, attribute), _find_path)
+    if sensor_path is None:
+        raise IndexError("No {} attribute found for {} sensor.".format(data_probe, sensor_type))
+    return sensor_path
+
 def read_thermal_sensor_value(sensor_type, data_probe, subsystem='thermal', attribute='type'):
     """
     This function will return the float value of the thermal sensor
@@ -53,7 +83,126 @@ def read_thermal_sensor_value(sensor_type, data_probe, subsystem='thermal', attr
                   the case of thermal-zone or 'cur_state' in the case of a
                   cooling device.
     """
-    sensor_val = read_thermal_sensors_value(sensor_type, data_probe, subsystem, attribute)
-    if not sensor_val:
-        raise IndexError("No {} attribute found for {} sensor.".format(data_probe, sensor_type))
-    return sensor_val[0]
+    sensor_path = get_thermal_sensor_path(
+        sensor_type, data_probe, subsystem, attribute)
+    with open(sensor_path, 'r') as sensor_file:
+        return float(sensor_file.read())
+
+
+class ThermalSampler(object):
+    """
+    Samples thermal sensors (or any other sysfs sensor files) at a fixed
+    interval in a background thread, and keeps a short history of their
+    values. Sensor readings can then be served from the cache instead of
+    going to sysfs every time.
+
+    Example:
+    >>> sampler = ThermalSampler(1.0, log)
+    >>> sampler.add_sensor('temp', 'fpga-thermal-zone', 'temp')
+    >>> sampler.start()
+    >>> value, timestamp = sampler.get('temp')
+
+    Arguments:
+    interval -- Sampling interval in seconds
+    log -- Logger object
+    history_len -- Number of samples to keep per sensor
+    """
+    def __init__(self, interval, log, history_len=THERMAL_HISTORY_LEN):
+        self.log = log
+        self._interval = interval
+        self._history_len = history_len
+        self._lock = threading.Lock()
+        # Map sensor name -> sysfs path
+        self._sensor_paths = {}
+        # Map sensor name -> deque of (timestamp, value)
+        self._history = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_sensor(self, name, sensor_type, data_probe,
+                   subsystem='thermal', attribute='type'):
+        """
+        Add a sensor which is sampled from now on. The sysfs path is resolved
+        right away, see get_thermal_sensor_path() for the arguments. Raises
+        an IndexError if the sensor does not exist.
+        """
+        sensor_path = get_thermal_sensor_path(
+            sensor_type, data_probe, subsystem, attribute)
+        self.log.trace("Sampling sensor `%s' from %s", name, sensor_path)
+        with self._lock:
+            self._sensor_paths[name] = sensor_path
+            self._history[name] = collections.deque(maxlen=self._history_len)
+
+    def sample(self):
+        """
+        Read all sensors once. This is called by the sampling thread, but
+        can also be called manually.
+        """
+        for name, sensor_path in list(self._sensor_paths.items()):
+            try:
+                with open(sensor_path, 'r') as sensor_file:
+                    value = float(sensor_file.read())
+            except (OSError, ValueError) as ex:
+                self.log.warning("Failed to sample sensor `%s': %s",
+                                 name, str(ex))
+                continue
+            with self._lock:
+                self._history[name].append((time.time(), value))
+
+    def get(self, name):
+        """
+        Return the most recent sample of a sensor as a tuple (value,
+        timestamp), where timestamp is the time.time() at which the value was
+        read. If there is no sample yet, the sensor is sampled right away.
+        """
+        with self._lock:
+            history = self._history[name]
+            if history:
+                timestamp, value = history[-1]
+                return value, timestamp
+        self.sample()
+        with self._lock:
+            if not history:
+                raise RuntimeError("Unable to read sensor `{}'".format(name))
+            timestamp, value = history[-1]
+            return value, timestamp
+
+    def get_history(self, name):
+        """
+        Return the stored samples of a sensor as a list of (timestamp, value)
+        tuples, oldest first.
+        """
+        with self._lock:
+            return list(self._history[name])
+
+    def has_sensor(self, name):
+        " Return True if sensor name is being sampled "
+        return name in self._sensor_paths
+
+    def start(self):
+        " Start the sampling thread "
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._sample_loop,
+            name="ThermalSamplerThread",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        " Stop the sampling thread "
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(2 * self._interval)
+        if self._thread.is_alive():
+            self.log.warning("Thermal sampler thread did not terminate.")
+        self._thread = None
+
+    def _sample_loop(self):
+        " Thread main loop "
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self._interval)
@@ -9,18 +9,30 @@ Utilities for udev lookups
 
 import os
 import pyudev
+from usrp_mpm.sys_utils import device_index
 
 def get_eeprom_paths(address):
     """
     Return list of EEPROM device paths for a given I2C address.
     If no device paths are found, an empty list is returned.
+
+    Results are cached, see device_index.
+    """
+    return list(device_index.lookup(
+        'nvmem', address, lambda: _get_eeprom_paths(address)) or [])
+
+def _get_eeprom_paths(address):
+    """
+    Implementation of get_eeprom_paths(), without caching. Returns None
+    instead of an empty list, so device_index doesn't cache the result (the
+    devices may still show up, e.g., after loading an overlay).
     """
-    context = pyudev.Context()
+    context = device_index.get_udev_context()
     parent = pyudev.Device.from_name(context, "platform", address)
     paths = [d.device_node if d.device_node is not None else d.sys_path
              for d in context.list_devices(parent=parent, subsystem="nvmem")]
     if len(paths) == 0:
-        return []
+        return None
     # We need to sort this so 9-0050 comes before 10-0050 (etc.)
     maxlen = max((len(os.path.split(p)[1]) for p in paths))
     paths = sorted(
@@ -33,11 +45,22 @@ def get_spidev_nodes(spi_master):
     """
     Return list of spidev device paths for a given SPI master. If no valid paths
     can be found, an empty list is returned.
+
+    Results are cached, see device_index.
+    """
+    return list(device_index.lookup(
+        'spidev', spi_master, lambda: _get_spidev_nodes(spi_master)) or [])
+
+def _get_spidev_nodes(spi_master):
+    """
+    Implementation of get_spidev_nodes(), without caching. Like
+    _get_eeprom_paths(), this returns None if nothing was found.
     """
-    context = pyudev.Context()
+    context = device_index.get_udev_context()
     parent = pyudev.Device.from_name(context, "platform", spi_master)
-    return [
+    nodes = [
         device.device_node
         for device in context.list_devices(parent=parent, subsystem="spidev")
     ]
+    return nodes or None
 
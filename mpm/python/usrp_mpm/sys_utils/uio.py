@@ -8,11 +8,14 @@ Access to UIO mapped memory.
 """
 
 import os
+import array
+import select
+import struct
 from contextlib import contextmanager
 from builtins import object
-import pyudev
 import usrp_mpm.libpyusrp_periphs as lib
 from usrp_mpm.mpmlog import get_logger
+from usrp_mpm.sys_utils import device_index
 
 UIO_SYSFS_BASE_DIR = '/sys/class/uio'
 UIO_DEV_BASE_DIR = '/dev'
@@ -36,7 +39,7 @@ def get_all_uio_devs():
     ['uio0', 'uio1', ...].
     """
     try:
-        context = pyudev.Context()
+        context = device_index.get_udev_context()
         paths = [os.path.split(device.device_node)[-1]
                  for device in context.list_devices(subsystem="uio")]
         return paths
@@ -67,24 +70,42 @@ def get_uio_map_info(uio_dev, map_num):
     return map_info
 
 
+def _build_uio_index():
+    """
+    Return a dictionary label -> (uio_device, map_info) for all UIO devices.
+    See find_uio_device().
+    """
+    uio_index = {}
+    for uio_device in get_all_uio_devs():
+        map0_info = get_uio_map_info(uio_device, 0)
+        uio_index.setdefault(
+            map0_info.get('name'),
+            (os.path.join(UIO_DEV_BASE_DIR, uio_device), map0_info)
+        )
+    return uio_index
+
+
 def find_uio_device(label, logger=None):
     """
     Given a label, returns a tuple (uio_device, map_info).
     uio_device is something like '/dev/uio0'. map_info is a dictionary with
     information regarding the UIO device read from the map info sysfs dir.
     Note: We assume a single map (map0) for all UIO devices here.
+
+    The labels of all UIO devices are read once and then cached (see
+    device_index), so repeated lookups don't need to scan sysfs.
     """
-    uio_devices = get_all_uio_devs()
-    if logger:
-        logger.trace("Found the following UIO devices: `{0}'".format(','.join(uio_devices)))
-    for uio_device in uio_devices:
-        map0_info = get_uio_map_info(uio_device, 0)
+    uio_index = device_index.lookup('uio', None, _build_uio_index)
+    if label not in uio_index:
+        # The device may have shown up after the index was built
+        device_index.invalidate('uio')
+        uio_index = device_index.lookup('uio', None, _build_uio_index)
+    if label in uio_index:
+        uio_device, map0_info = uio_index[label]
         if logger:
-            logger.trace("{0} has map info: {1}".format(uio_device, map0_info))
-        if map0_info.get('name') == label:
-            if logger:
-                logger.trace("Device matches label: `{0}'".format(uio_device))
-            return os.path.join(UIO_DEV_BASE_DIR, uio_device), map0_info
+            logger.trace("Device matches label `%s': %s, map info: %s",
+                         label, uio_device, map0_info)
+        return uio_device, dict(map0_info)
     if logger:
         logger.warning("Found no matching UIO device for label `{0}'".format(label))
     return None, None
@@ -135,21 +156,21 @@ class UIO(object):
         self.log = get_logger('UIO')
         if label is None:
             self._path = path
-            self.log.trace("Using UIO device `{0}'".format(path))
+            self.log.trace("Using UIO device `%s'", path)
             uio_device = os.path.split(path)[-1]
-            self.log.trace("Getting map info for UIO device `{0}'".format(uio_device))
+            self.log.trace("Getting map info for UIO device `%s'", uio_device)
             map_info = get_uio_map_info(uio_device, 0)
             # Python can't tell the size of a uio device by itself
             assert length is not None
         else:
-            self.log.trace("Using UIO device by label `{0}'".format(label))
+            self.log.trace("Using UIO device by label `%s'", label)
             self._path, map_info = find_uio_device(label, self.log)
         # TODO If we ever support multiple maps, check if this is correct...
         offset = offset or map_info['offset']
         assert offset == 0 # ...and then remove this line
         length = length or map_info['size']
-        self.log.trace("UIO device is being opened read-{0}.".format(
-            "only" if read_only else "write"))
+        self.log.trace("UIO device is being opened read-%s.",
+                       "only" if read_only else "write")
         if self._path is None:
             self.log.error("Could not find a UIO device for label {0}".format(label))
             raise RuntimeError("Could not find a UIO device for label {0}".format(label))
@@ -159,6 +180,8 @@ class UIO(object):
         self._uio = lib.types.mmap_regs_iface(self._path, length, offset, self._read_only, False)
         # Reference counter for safely __enter__ and __exit__-ing
         self._ref_count = 0
+        # File descriptor for interrupt handling, see wait_for_irq()
+        self._irq_fd = None
 
     def __enter__(self):
         return self._open()
@@ -189,6 +212,9 @@ class UIO(object):
         self._ref_count -= 1
         if self._ref_count == 0:
             self._uio.close()
+            if self._irq_fd is not None:
+                os.close(self._irq_fd)
+                self._irq_fd = None
 
     def peek32(self, addr):
         """
@@ -204,3 +230,49 @@ class UIO(object):
         """
         assert not self._read_only
         return self._uio.poke32(addr, val)
+
+    def peek32_block(self, addr, count):
+        """
+        Reads count consecutive 32-bit values starting at address addr.
+
+        The registers are read in a single call into C++ land, which is a lot
+        faster than calling peek32() for every address. Returns a memoryview
+        of unsigned 32-bit integers; it can be indexed like a list, or turned
+        into a NumPy array without copying (numpy.frombuffer(..., 'uint32')).
+        The values are a snapshot, they are not updated on later reads.
+        """
+        return memoryview(self._uio.peek32_block(addr, count)).cast('I')
+
+    def poke32_many(self, addr_vals):
+        """
+        Writes a sequence of (addr, val) pairs in a single call, in order.
+        Will throw if read_only was set to True.
+        Values that exceed 32 bits will be truncated to 32 bits.
+        """
+        assert not self._read_only
+        addr_data_pairs = array.array('I')
+        for addr, val in addr_vals:
+            addr_data_pairs.append(addr)
+            addr_data_pairs.append(val & 0xFFFFFFFF)
+        return self._uio.poke32_many(addr_data_pairs)
+
+    def wait_for_irq(self, timeout):
+        """
+        Enables the interrupt of this UIO device, and waits for it to fire.
+        Only works if the device tree assigns an interrupt to this device.
+
+        Returns True if the interrupt fired within timeout (in seconds),
+        False otherwise.
+        """
+        assert self._ref_count > 0
+        if self._irq_fd is None:
+            self._irq_fd = os.open(self._path, os.O_RDWR)
+        # Writing a 1 (re-)enables the interrupt
+        os.write(self._irq_fd, struct.pack('I', 1))
+        readable, _, _ = select.select([self._irq_fd], [], [], timeout)
+        if not readable:
+            return False
+        # Reading returns the total interrupt count, and acknowledges the
+        # interrupt
+        os.read(self._irq_fd, 4)
+        return True
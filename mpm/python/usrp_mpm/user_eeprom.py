@@ -9,6 +9,7 @@ User EEPROM via Bfrfs mixin class
 
 import threading
 from six import iterkeys, iteritems
+from usrp_mpm import eeprom
 from usrp_mpm.mpmlog import get_logger
 from usrp_mpm.sys_utils.udev import get_eeprom_paths
 from usrp_mpm.bfrfs import BufferFS
@@ -71,7 +72,8 @@ class BfrfsEEPROM(object):
         self.log.trace("Selected EEPROM path: `{}'".format(eeprom_path))
         user_eeprom_offset = eeprom_info.get('offset', 0)
         self.log.trace("Selected EEPROM offset: %d", user_eeprom_offset)
-        user_eeprom_data = open(eeprom_path, 'rb').read()[user_eeprom_offset:]
+        user_eeprom_data = \
+            eeprom.get_raw_data(eeprom_path, user_eeprom_offset)
         self.log.trace("Total EEPROM size is: %d bytes", len(user_eeprom_data))
         return BufferFS(
             user_eeprom_data,
@@ -105,31 +107,51 @@ class BfrfsEEPROM(object):
             self.eeprom_fs.set_blob(blob_id, blob)
         self.log.trace("Writing EEPROM info to `{}'".format(self.eeprom_path))
         eeprom_offset = _get_user_eeprom_info(self.rev, self.user_eeprom)['offset']
-        def _write_to_eeprom_task(path, offset, data, log):
+        eeprom_fs = self.eeprom_fs
+        def _write_to_eeprom_task(
+                path, offset, buf, dirty_ranges, prev_task, log):
             " Writer task: Actually write to file "
-            # Note: This can be sped up by only writing sectors that actually
-            # changed. To do so, this function would need to read out the
-            # current state of the file, do some kind of diff, and then seek()
-            # to the different sectors. When very large blobs are being
-            # written, it doesn't actually help all that much, of course,
-            # because in that case, we'd anyway be changing most of the EEPROM.
-            with open(path, 'r+b') as eeprom_file:
-                log.trace("Seeking forward to `{}'".format(offset))
-                eeprom_file.seek(eeprom_offset)
-                log.trace("Writing a total of {} bytes.".format(
-                    len(self.eeprom_fs.buffer)))
-                eeprom_file.write(data)
+            # Writes must reach the EEPROM in order
+            if prev_task is not None:
+                prev_task.join()
+            # Only the blocks that actually changed are written. When very
+            # large blobs are being written, this doesn't help all that much,
+            # of course, because in that case, we're anyway changing most of
+            # the EEPROM.
+            try:
+                with open(path, 'r+b') as eeprom_file:
+                    log.trace("Writing a total of %d bytes in %d range(s).",
+                              sum(len(data) for _, data in dirty_ranges),
+                              len(dirty_ranges))
+                    for range_offset, data in dirty_ranges:
+                        eeprom_file.seek(offset + range_offset)
+                        eeprom_file.write(data)
                 log.trace("EEPROM write complete.")
+                eeprom_fs.mark_clean(buf)
+            except OSError as ex:
+                log.error("Writing EEPROM `%s' failed: %s", path, str(ex))
+                # We don't know what the EEPROM contains now, so the next
+                # write needs to rewrite everything
+                eeprom_fs.mark_dirty()
+            finally:
+                # Drop whatever was read while the write was in progress
+                eeprom.invalidate_cache(path)
+        dirty_ranges = self.eeprom_fs.get_dirty_ranges()
+        eeprom.invalidate_cache(self.eeprom_path)
         thread_id = "eeprom_writer_task_{}".format(self.slot_idx)
-        if any([x.name == thread_id for x in threading.enumerate()]):
-            # Should this be fatal?
-            self.log.warn("Another EEPROM writer thread is already active!")
+        prev_task = next(
+            (x for x in threading.enumerate() if x.name == thread_id), None)
+        if prev_task is not None:
+            self.log.warning("Another EEPROM writer thread is already active, "
+                             "this write will wait for it.")
         writer_task = threading.Thread(
             target=_write_to_eeprom_task,
             args=(
                 self.eeprom_path,
                 eeprom_offset,
                 self.eeprom_fs.buffer,
+                dirty_ranges,
+                prev_task,
                 self.log
             ),
             name=thread_id,
@@ -8,13 +8,27 @@
 UDP Transport manager
 """
 
+import ipaddress
 import subprocess
 from six import iteritems, itervalues
 from usrp_mpm import prefs
 from usrp_mpm.ethdispatch import EthDispatcherCtrl
 from usrp_mpm.sys_utils import net
+from usrp_mpm.sys_utils import net_monitor
 
 DEFAULT_BRIDGE_MODE = False
+# Duration of the link probe burst per interface (seconds), see
+# get_chdr_link_options()
+LINK_PROBE_DURATION = 0.05
+# UDP port the link probe bursts are sent to (the discard port)
+LINK_PROBE_PORT = 9
+# IPv4 and UDP headers, which are part of the MTU
+UDP_IP_HEADER_SIZE = 28
+# Weights for the link preference by interface type. Forwarded CHDR traffic
+# has to pass through the ARM, so it's a lot slower than the link itself.
+LINK_TYPE_PREFERENCE = {
+    'forward': 0.25,
+}
 
 class XportMgrUDP:
     """
@@ -44,6 +58,14 @@ class XportMgrUDP:
         self._chdr_ifaces = self._init_interfaces(self._possible_chdr_ifaces)
         self._bridge_mode = args.get('bridge_mode', DEFAULT_BRIDGE_MODE)
         self._eth_dispatchers = {}
+        # EthDispatcherCtrl objects by interface, they are kept around so
+        # they can skip writes that don't change anything
+        self._eth_dispatcher_cache = {}
+        # iptables rules (as argument tuples) which are known to be in place
+        self._iptables_rules = set()
+        # Map (iface, client address) -> measured link rate (bits/s), so
+        # links are only probed once per session
+        self._link_probe_results = {}
 
     def _init_interfaces(self, possible_ifaces):
         """
@@ -58,37 +80,32 @@ class XportMgrUDP:
         Return Value:
         A list of dictionaries. The keys are determined by net.get_iface_info().
         """
-        self.log.trace("Testing available interfaces out of `{}'".format(
-            list(possible_ifaces)
-        ))
+        self.log.trace("Testing available interfaces out of `%s'",
+                       list(possible_ifaces))
+        # Use one snapshot for all lookups, so the list of valid interfaces
+        # and their info are consistent
+        snapshot = net_monitor.get_snapshot()
         valid_iface_infos = {
-            x: net.get_iface_info(x)
-            for x in net.get_valid_interfaces(possible_ifaces)
-        }
-        # Because get_iface_info() and get_valid_interfaces() are not one atomic
-        # operation, there are rare scenarios when their return values are
-        # inconsistent. To catch these cases, we filter the list again and warn
-        # the user. Usually, this is not a problem and the next call to
-        # _init_interfaces() will be back to normal.
-        valid_iface_infos_filtered = {
-            x: valid_iface_infos[x]
-            for x in valid_iface_infos
-            if valid_iface_infos[x]['ip_addr']
+            x: net.get_iface_info(x, snapshot)
+            for x in net.get_valid_interfaces(possible_ifaces, snapshot)
         }
-        if len(valid_iface_infos) != len(valid_iface_infos_filtered):
-            self.log.warning(
-                "Number of detected CHDR devices is inconsistent. Dropped from "
-                "{} to {}."
-                .format(len(valid_iface_infos), len(valid_iface_infos_filtered))
-            )
-        if valid_iface_infos_filtered:
-            self.log.debug(
-                "Found CHDR interfaces: `{}'"
-                .format(", ".join(list(valid_iface_infos.keys())))
-            )
+        if valid_iface_infos:
+            self.log.debug("Found CHDR interfaces: `%s'",
+                           ", ".join(list(valid_iface_infos.keys())))
         else:
             self.log.info("No CHDR interfaces found!")
-        return valid_iface_infos_filtered
+        return valid_iface_infos
+
+    def _get_eth_dispatcher(self, iface):
+        """
+        Return the EthDispatcherCtrl object for iface. There is only one per
+        interface, so the dispatchers keep track of what was programmed
+        across sessions.
+        """
+        if iface not in self._eth_dispatcher_cache:
+            self._eth_dispatcher_cache[iface] = \
+                EthDispatcherCtrl(self.iface_config[iface]['label'])
+        return self._eth_dispatcher_cache[iface]
 
     def _update_dispatchers(self):
         """
@@ -96,6 +113,8 @@ class XportMgrUDP:
         addresses are programmed correctly.
 
         After calling this, _chdr_ifaces and _eth_dispatchers are in sync.
+        Registers and iptables rules which are already programmed correctly
+        are not touched again.
         """
         if self._bridge_mode:
             bridge_iface = list(self._chdr_ifaces.keys())[0]
@@ -106,7 +125,7 @@ class XportMgrUDP:
                 "Updated dispatchers in bridge mode with bridge interface {}"
                 .format(bridge_iface))
             self._eth_dispatchers = {
-                x: EthDispatcherCtrl(self.iface_config[x]['label'])
+                x: self._get_eth_dispatcher(x)
                 for x in self.bridges[bridge_iface]
             }
             for dispatcher, table in iteritems(self._eth_dispatchers):
@@ -132,7 +151,7 @@ class XportMgrUDP:
                     continue
                 if iface not in self._eth_dispatchers:
                     self._eth_dispatchers[iface] = \
-                        EthDispatcherCtrl(self.iface_config[iface]['label'])
+                        self._get_eth_dispatcher(iface)
                 self._eth_dispatchers[iface].set_ipv4_addr(
                     self._chdr_ifaces[iface]['ip_addr']
                 )
@@ -161,6 +180,7 @@ class XportMgrUDP:
 
     def deinit(self):
         " Clean up after a session terminates "
+        self._link_probe_results = {}
 
     def get_xport_info(self):
         """
@@ -209,30 +229,102 @@ class XportMgrUDP:
         ))
         return {**external_ip_dict, **forward_ip_dict}
 
-    def get_chdr_link_options(self, host_location = 'all'):
+    def get_chdr_link_options(self, host_location='all', client_addr=None):
         """
         Returns a list of dictionaries for returning by
         PeriphManagerBase.get_chdr_link_options().
 
+        The list is sorted by the 'preference' key, best link first. The
+        preference is the usable CHDR throughput of the link in MB/s. That
+        is the link capacity, minus the header overhead at the link's MTU,
+        weighted by the interface type (see LINK_TYPE_PREFERENCE). The link
+        capacity ('link_capacity', bytes/s) is the nominal link speed. If
+        chdr_link_probe is enabled in mpm.conf, and client_addr is on the same
+        subnet as the link, it is measured instead (but never exceeds the
+        nominal speed). 'link_rate' always stays the nominal link speed,
+        because UHD uses it to pick the frame sizes.
+
         Note: This requires a claim, which means that init() was called, and
         deinit() was not yet called.
+
+        Arguments:
+        host_location -- 'remote', 'local' or 'all': Which links to return
+        client_addr -- IPv4 address of the client which claimed the device
         """
         assert host_location in ('remote', 'local', 'all')
-          
-        return [
-            {
-                'ipv4': str(iface_info['ip_addr']) if (self.iface_config[iface_name]['type'] != 'internal')
-                    else str(self.get_fpga_internal_ip_address(iface_name)),
+        link_options = []
+        for iface_name, iface_info in iteritems(self._chdr_ifaces):
+            iface_type = self.iface_config[iface_name]['type']
+            if not ((iface_type == 'internal' and host_location == 'local') or
+                    (iface_type != 'internal' and host_location == 'remote') or
+                    host_location == 'all'):
+                continue
+            link_capacity = self._get_link_capacity(
+                iface_name, iface_info, client_addr)
+            mtu = iface_info['mtu']
+            mtu_efficiency = float(mtu - UDP_IP_HEADER_SIZE) / \
+                (mtu + net.UDP_WIRE_OVERHEAD - UDP_IP_HEADER_SIZE)
+            preference = link_capacity * mtu_efficiency \
+                * LINK_TYPE_PREFERENCE.get(iface_type, 1.0) / 1e6
+            link_options.append({
+                'ipv4': str(iface_info['ip_addr']) if iface_type != 'internal'
+                        else str(self.get_fpga_internal_ip_address(iface_name)),
                 'port': str(self.chdr_port),
                 'link_rate': str(int(iface_info['link_speed'] * 1e6 / 8)),
-                'type': str(self.iface_config[iface_name]['type']),
-                'mtu': str(iface_info['mtu'])
-            }
-            for iface_name, iface_info in iteritems(self._chdr_ifaces)
-            if((self.iface_config[iface_name]['type'] == 'internal' and host_location == 'local') or
-                (self.iface_config[iface_name]['type'] != 'internal' and host_location == 'remote') or
-                host_location == 'all')
-        ]
+                'link_capacity': str(int(link_capacity)),
+                'preference': str(int(preference)),
+                'type': str(iface_type),
+                'mtu': str(mtu)
+            })
+        link_options.sort(key=lambda x: int(x['preference']), reverse=True)
+        return link_options
+
+    def _get_link_capacity(self, iface_name, iface_info, client_addr):
+        """
+        Return the capacity of the link on iface_name in bytes/s. This is
+        measured if the link probe is enabled and possible, otherwise, it's
+        the nominal link speed (see net.get_link_speed()). The nominal speed
+        also caps the measured rate.
+        """
+        try:
+            link_speed = net.get_link_speed(iface_name)
+        except IndexError:
+            # Interface went away since init()
+            link_speed = iface_info['link_speed']
+        link_capacity = link_speed * 1e6 / 8
+        if not client_addr or \
+                self.iface_config[iface_name]['type'] == 'internal' or \
+                not prefs.get_prefs().getboolean('mpm', 'chdr_link_probe'):
+            return link_capacity
+        probe_key = (iface_name, client_addr)
+        if probe_key not in self._link_probe_results:
+            try:
+                on_link = any(
+                    ipaddress.ip_address(client_addr) in iface_network.network
+                    for iface_network in
+                    net.get_iface_ipv4_networks().get(iface_name, []))
+            except ValueError:
+                # Not an IPv4 address, e.g. a Unix domain socket client
+                on_link = False
+            measured_rate = None
+            if on_link:
+                measured_rate = net.probe_link_rate(
+                    iface_name,
+                    client_addr,
+                    LINK_PROBE_PORT,
+                    iface_info['mtu'] - UDP_IP_HEADER_SIZE,
+                    LINK_PROBE_DURATION)
+                self.log.debug(
+                    "Link probe on %s: %s", iface_name,
+                    "{:.1f} Mbps".format(measured_rate / 1e6)
+                    if measured_rate else "failed")
+            self._link_probe_results[probe_key] = measured_rate
+        measured_rate = self._link_probe_results[probe_key]
+        if measured_rate is None:
+            return link_capacity
+        # The probe can overshoot a bit because of buffering, but it can't be
+        # faster than the link
+        return min(measured_rate / 8, link_capacity)
 
     def _setup_forwarding(self, iface):
         """
@@ -262,27 +354,33 @@ class XportMgrUDP:
             '--dport', str(self.chdr_port),
             '-j', 'ACCEPT']
         try:
-            result = subprocess.run(
-                ['iptables', '-C'] + prerouting_arguments,
-                timeout=2)
-            if result.returncode != 0:
-                self.log.debug('Adding iptables prerouting rule')
-                subprocess.run(
-                    ['iptables', '-A'] + prerouting_arguments,
-                    timeout=2,
-                    check=True)
-            result = subprocess.run(
-                ['iptables', '-C'] + forward_arguments,
-                timeout=2)
-            if result.returncode != 0:
-                self.log.debug('Adding iptables forward rule')
-                subprocess.run(
-                    ['iptables', '-A'] + forward_arguments,
-                    timeout=2,
-                    check=True)
+            for rule_name, rule_arguments in (
+                    ('prerouting', prerouting_arguments),
+                    ('forward', forward_arguments)):
+                self._add_iptables_rule(rule_name, rule_arguments)
         except subprocess.SubprocessError:
             self.log.warning('Unable to configure CHDR forwarding')
 
+    def _add_iptables_rule(self, rule_name, rule_arguments):
+        """
+        Add an iptables rule, unless it's already there. Rules that were
+        checked or added before are remembered, so iptables only runs the
+        first time.
+        """
+        rule = tuple(rule_arguments)
+        if rule in self._iptables_rules:
+            return
+        result = subprocess.run(
+            ['iptables', '-C'] + rule_arguments,
+            timeout=2)
+        if result.returncode != 0:
+            self.log.debug('Adding iptables %s rule', rule_name)
+            subprocess.run(
+                ['iptables', '-A'] + rule_arguments,
+                timeout=2,
+                check=True)
+        self._iptables_rules.add(rule)
+
     @staticmethod
     def get_fpga_internal_ip_address(iface):
         """
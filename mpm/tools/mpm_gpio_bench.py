@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# Copyright 2019 Ettus Research, a National Instruments Brand
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Microbenchmark for GPIO reads: Compares opening the sysfs value file for
+every access with the persistent file descriptors of SysFSGPIO, and with
+whole-bank reads through the GPIO character device (CharDevGPIO).
+
+Only reads GPIOs, and configures all benchmarked pins as inputs. Note that
+the CharDevGPIO test unexports the pins from sysfs.
+"""
+import argparse
+import os
+import time
+from usrp_mpm import mpmlog
+from usrp_mpm.sys_utils.sysfs_gpio import SysFSGPIO, CharDevGPIO
+from usrp_mpm.sys_utils.sysfs_gpio import GPIO_SYSFS_BASE_DIR, GPIO_SYSFS_VALUEFILE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-l", "--label", default="zynq_gpio",
+                        help="Label of the GPIO chip")
+    parser.add_argument("-m", "--mask", default="0xFFF", type=lambda x: int(x, 0),
+                        help="Mask of the GPIO pins to read")
+    parser.add_argument("-n", "--num-iterations", default=1000, type=int,
+                        help="Number of times every pin (or the bank) is read")
+    parser.add_argument("--skip-chardev", action="store_true",
+                        help="Don't run the character device test")
+    return parser.parse_args()
+
+
+def read_bank_per_open(base_gpio, pins):
+    """
+    Read all pins the way SysFSGPIO.get() used to: Build the path, check it
+    exists, open, read and close the value file for every pin.
+    """
+    result = 0
+    for gpio_idx in pins:
+        gpio_path = os.path.join(
+            GPIO_SYSFS_BASE_DIR, 'gpio{}'.format(base_gpio + gpio_idx))
+        value_path = os.path.join(gpio_path, GPIO_SYSFS_VALUEFILE)
+        assert os.path.exists(value_path)
+        if int(open(value_path, 'r').read().strip()):
+            result |= 1 << gpio_idx
+    return result
+
+
+def bench(name, func, num_iterations):
+    " Run func num_iterations times and print the time per call "
+    func()
+    start = time.perf_counter()
+    for _ in range(num_iterations):
+        func()
+    duration = time.perf_counter() - start
+    print("{:32s} {:9.1f} us per bank read".format(
+        name, duration / num_iterations * 1e6))
+
+
+def main():
+    " Go, go, go! "
+    args = parse_args()
+    mpmlog.get_main_logger(use_console=False)
+    identifiers = {'label': args.label}
+    pins = [x for x in range(64) if (1 << x) & args.mask]
+    gpios = SysFSGPIO(identifiers, args.mask, 0)
+    base_gpio = gpios._base_gpio
+    print("Reading {} pins of GPIO chip `{}' (base {}):".format(
+        len(pins), args.label, base_gpio))
+    bench("sysfs, open per access",
+          lambda: read_bank_per_open(base_gpio, pins), args.num_iterations)
+    bench("sysfs, persistent fds, get()",
+          lambda: [gpios.get(x) for x in pins], args.num_iterations)
+    bench("sysfs, persistent fds, get_all()",
+          gpios.get_all, args.num_iterations)
+    gpios.close()
+    if not args.skip_chardev:
+        chardev_gpios = CharDevGPIO(identifiers, args.mask, 0)
+        bench("chardev, get_all()", chardev_gpios.get_all, args.num_iterations)
+        chardev_gpios.close()
+
+
+if __name__ == "__main__":
+    main()
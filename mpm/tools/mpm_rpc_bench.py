@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Copyright 2019 Ettus Research, a National Instruments Company
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+"""
+Benchmark for the MPM RPC server: Compares round-trip latency and throughput
+of a no-claim RPC call over TCP and over the Unix domain socket, both for
+one-request-at-a-time and for pipelined requests.
+"""
+import argparse
+import socket
+import time
+import msgpack
+
+MPM_RPC_PORT = 49601
+MSGPACKRPC_REQUEST = 0
+DEFAULT_UNIX_SOCKET = '/run/usrp_hwd.sock'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-a", "--address", default="127.0.0.1",
+                        help="TCP address of the RPC server")
+    parser.add_argument("-p", "--port", default=MPM_RPC_PORT, type=int,
+                        help="TCP port of the RPC server")
+    parser.add_argument("-u", "--unix-socket", default=DEFAULT_UNIX_SOCKET,
+                        help="Path of the RPC server's Unix domain socket. "
+                             "Use an empty string to skip this transport.")
+    parser.add_argument("-c", "--call", default="get_mpm_compat_num",
+                        help="RPC method to call (must not require a token)")
+    parser.add_argument("-n", "--num-calls", default=2000, type=int,
+                        help="Number of calls per test")
+    parser.add_argument("-d", "--depth", default=32, type=int,
+                        help="Number of outstanding requests when pipelining")
+    return parser.parse_args()
+
+
+class BenchClient(object):
+    """
+    Minimal msgpack-rpc client which allows sending multiple requests before
+    reading the responses.
+    """
+    def __init__(self, sock):
+        self._sock = sock
+        self._sock.setblocking(True)
+        self._packer = msgpack.Packer(use_bin_type=True)
+        self._unpacker = msgpack.Unpacker(raw=False)
+        self._msg_id = 0
+
+    def send_request(self, method, *args):
+        " Send a request without waiting for the response "
+        self._sock.sendall(self._packer.pack(
+            [MSGPACKRPC_REQUEST, self._msg_id, method, list(args)]))
+        self._msg_id += 1
+
+    def recv_responses(self, num_responses):
+        " Wait for num_responses responses "
+        received = 0
+        while received < num_responses:
+            for _, _, error, _ in self._unpacker:
+                if error is not None:
+                    raise RuntimeError("RPC error: {}".format(error))
+                received += 1
+            if received < num_responses:
+                data = self._sock.recv(65536)
+                if not data:
+                    raise RuntimeError("Connection closed by server")
+                self._unpacker.feed(data)
+
+    def close(self):
+        " Close the connection "
+        self._sock.close()
+
+
+def run_sequential(client, method, num_calls):
+    """
+    Run num_calls calls, one at a time. Returns the sorted list of
+    round-trip times in seconds.
+    """
+    rtts = []
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        client.send_request(method)
+        client.recv_responses(1)
+        rtts.append(time.perf_counter() - start)
+    return sorted(rtts)
+
+
+def run_pipelined(client, method, num_calls, depth):
+    """
+    Run num_calls calls, keeping up to depth requests outstanding. Returns
+    the total time in seconds.
+    """
+    start = time.perf_counter()
+    sent = 0
+    while sent < num_calls:
+        batch = min(depth, num_calls - sent)
+        for _ in range(batch):
+            client.send_request(method)
+        client.recv_responses(batch)
+        sent += batch
+    return time.perf_counter() - start
+
+
+def bench_transport(name, connect, args):
+    " Run all tests on one transport and print the results "
+    client = BenchClient(connect())
+    # Warm up the connection and the server's method cache
+    run_sequential(client, args.call, min(100, args.num_calls))
+    rtts = run_sequential(client, args.call, args.num_calls)
+    total = run_pipelined(client, args.call, args.num_calls, args.depth)
+    client.close()
+    print("{}:".format(name))
+    print("  sequential: p50 = {:8.1f} us, p99 = {:8.1f} us, {:9.0f} calls/s"
+          .format(rtts[len(rtts) // 2] * 1e6,
+                  rtts[int(len(rtts) * 0.99)] * 1e6,
+                  len(rtts) / sum(rtts)))
+    print("  pipelined (depth {}): {:9.0f} calls/s".format(
+        args.depth, args.num_calls / total))
+
+
+def main():
+    " Go, go, go! "
+    args = parse_args()
+    def connect_tcp():
+        sock = socket.create_connection((args.address, args.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    def connect_unix():
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(args.unix_socket)
+        return sock
+    bench_transport("TCP {}:{}".format(args.address, args.port),
+                    connect_tcp, args)
+    if args.unix_socket:
+        bench_transport("Unix domain socket {}".format(args.unix_socket),
+                        connect_unix, args)
+
+
+if __name__ == "__main__":
+    main()